@@ -0,0 +1,133 @@
+import asyncio
+import collections
+
+from aiosmb.exceptions import SMBException
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/dc517c41-646c-4ab3-a14d-ba4cf1a7b7b9
+class SMBCreditWindow:
+	"""
+	Keeps track of the credits the server granted to us and hands out MessageIds accordingly.
+	Every outgoing request must reserve its CreditCharge before being sent, every reply (including interim ones)
+	gives back the credits the server granted in its header. When the window is exhausted reservations are queued
+	and served in FIFO order as soon as enough credits arrive.
+	"""
+	def __init__(self, target = 128, initial = 1):
+		self.target = target #the window size we are trying to maintain by requesting credits
+		self.available = initial #credits we can spend right now
+		self.next_message_id = 0
+		self.in_flight = 0 #sum of credit charges of requests waiting for a final reply
+		self.requested = 0 #sum of credits asked for by requests waiting for a final reply
+		self.outstanding = {} #message_id -> (credit_charge, credit_request)
+		self.waiters = collections.deque() #(credit_charge, future)
+		self.closed = False
+		self.close_exc = None
+
+	@property
+	def pending(self):
+		"""
+		Number of requests waiting for credits
+		"""
+		return len(self.waiters)
+
+	@property
+	def granted(self):
+		"""
+		Total number of credits currently owned by us (spendable + in flight)
+		"""
+		return self.available + self.in_flight
+
+	def __allocate(self, charge):
+		message_id = self.next_message_id
+		self.next_message_id += charge
+		self.available -= charge
+
+		#asking for enough credits so the window grows back to the target size once all outstanding requests completed
+		credit_request = self.target - (self.available + self.requested)
+		credit_request = min(max(credit_request, charge, 1), 0xFFFF)
+
+		self.in_flight += charge
+		self.requested += credit_request
+		self.outstanding[message_id] = (charge, credit_request)
+		return message_id, credit_request
+
+	def __wake_waiters(self):
+		while len(self.waiters) > 0:
+			charge, fut = self.waiters[0]
+			if fut.cancelled():
+				self.waiters.popleft()
+				continue
+			if self.available < charge:
+				break
+			self.waiters.popleft()
+			fut.set_result(self.__allocate(charge))
+
+	async def reserve(self, charge = 1):
+		"""
+		Reserves credit_charge amount of credits, waits if the window is exhausted.
+		Returns the MessageId to be used and the amount of credits to request in the header.
+		"""
+		charge = max(1, charge)
+		if self.closed is True:
+			raise self.close_exc
+
+		if len(self.waiters) == 0 and self.available >= charge:
+			return self.__allocate(charge)
+
+		fut = asyncio.get_event_loop().create_future()
+		self.waiters.append((charge, fut))
+		try:
+			return await fut
+		except asyncio.CancelledError:
+			if fut.done() and not fut.cancelled() and fut.exception() is None:
+				#credits got allocated right before we were cancelled, the message will never be sent
+				message_id, _ = fut.result()
+				self.release(message_id, refund = True)
+			raise
+
+	def grant(self, message_id, credits_granted, is_final = True):
+		"""
+		Must be called for every reply received from the server.
+		credits_granted is the CreditResponse field of the reply header.
+		is_final should be False for interim (STATUS_PENDING) replies.
+		"""
+		self.available += credits_granted
+		if is_final is True:
+			self.release(message_id)
+		self.__wake_waiters()
+
+	def release(self, message_id, refund = False):
+		"""
+		Drops the bookkeeping for message_id. No reply will be accounted for it anymore.
+		refund: the request was never sent. If it was the most recent reservation its MessageIds and credits are handed out again,
+		otherwise the credits are lost: the server only accepts MessageIds within the window it granted and
+		the ones after the gap are already taken.
+		"""
+		if message_id not in self.outstanding:
+			return
+		charge, credit_request = self.outstanding.pop(message_id)
+		self.in_flight -= charge
+		self.requested -= credit_request
+		if refund is True and message_id + charge == self.next_message_id:
+			self.next_message_id = message_id
+			self.available += charge
+			self.__wake_waiters()
+
+	def close(self, exc = None):
+		"""
+		Fails all pending and future reservations
+		"""
+		self.closed = True
+		self.close_exc = exc if exc is not None else SMBException('Connection closed')
+		while len(self.waiters) > 0:
+			charge, fut = self.waiters.popleft()
+			if not fut.done():
+				fut.set_exception(self.close_exc)
+
+	def __str__(self):
+		t = '==== SMBCreditWindow ====\r\n'
+		t += 'available: %s\r\n' % self.available
+		t += 'in_flight: %s\r\n' % self.in_flight
+		t += 'outstanding: %s\r\n' % len(self.outstanding)
+		t += 'pending: %s\r\n' % self.pending
+		t += 'next_message_id: %s\r\n' % self.next_message_id
+		return t
@@ -0,0 +1,135 @@
+import asyncio
+
+from aiosmb import logger
+from aiosmb.exceptions import SMBConnectionTerminated
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+
+# MessageId used by the server for unsolicited messages (oplock/lease break notifications)
+SMB2_UNSOLICITED_MESSAGE_ID = 0xFFFFFFFFFFFFFFFF
+
+class SMBResponseDispatcher:
+	"""
+	Matches incoming messages to the requests waiting for them.
+	Every request gets a future when it is sent, the future is resolved with the final reply.
+	Interim (STATUS_PENDING) replies don't resolve the future, only the AsyncId is recorded so the request can be cancelled later.
+	Unsolicited notifications (oplock/lease breaks) are passed to the registered notification handlers.
+	Entries are removed as soon as the final reply arrives, the waiter gives up or the connection is terminated.
+	"""
+	def __init__(self):
+		self.pending = {} #message_id -> future
+		self.async_ids = {} #message_id -> AsyncId of requests that got an interim reply
+		self.notification_handlers = {} #SMB2Command -> list of callables, taking the message as parameter
+		self.closed = False
+		self.close_exc = None
+
+	def register(self, message_id):
+		"""
+		Must be called before the request is sent out. Returns the future that will hold the final reply.
+		"""
+		if self.closed is True:
+			raise self.close_exc
+		fut = asyncio.get_event_loop().create_future()
+		self.pending[message_id] = fut
+		return fut
+
+	async def wait(self, message_id, timeout = None):
+		"""
+		Waits for the final reply of message_id. If the wait is cancelled the entry is dropped.
+		timeout: seconds to wait, asyncio.TimeoutError is raised on expiry. The entry is kept so the caller can still look up the AsyncId to cancel the request.
+		"""
+		if message_id not in self.pending:
+			raise Exception('No outstanding request with MessageId %s' % message_id)
+		fut = self.pending[message_id]
+		try:
+			if timeout is None:
+				return await fut
+			#shield: an expired timeout must not cancel the future, the entry is still needed to cancel the request
+			return await asyncio.wait_for(asyncio.shield(fut), timeout)
+		except asyncio.CancelledError:
+			self.forget(message_id)
+			raise
+
+	def get_async_id(self, message_id):
+		"""
+		Returns the AsyncId the server assigned to the request in its interim reply, or None
+		"""
+		return self.async_ids.get(message_id)
+
+	def forget(self, message_id):
+		"""
+		Drops the bookkeeping of message_id, a late reply will be treated as unsolicited
+		"""
+		fut = self.pending.pop(message_id, None)
+		self.async_ids.pop(message_id, None)
+		if fut is not None and not fut.done():
+			fut.cancel()
+
+	def add_notification_handler(self, command, handler):
+		"""
+		handler will be called with every unsolicited message of the given SMB2Command type.
+		If the handler returns a coroutine, it will be scheduled as a task.
+		"""
+		if command not in self.notification_handlers:
+			self.notification_handlers[command] = []
+		self.notification_handlers[command].append(handler)
+
+	def remove_notification_handler(self, command, handler):
+		if command in self.notification_handlers and handler in self.notification_handlers[command]:
+			self.notification_handlers[command].remove(handler)
+
+	def __notify(self, msg):
+		handlers = self.notification_handlers.get(msg.header.Command, [])
+		if len(handlers) == 0:
+			logger.debug('No handler for unsolicited %s message' % msg.header.Command.name)
+			return
+		for handler in handlers:
+			try:
+				res = handler(msg)
+				if asyncio.iscoroutine(res):
+					asyncio.ensure_future(res)
+			except Exception:
+				logger.exception('Notification handler failed')
+
+	def dispatch(self, msg):
+		"""
+		Called with every incoming (decrypted) message
+		"""
+		message_id = msg.header.MessageId
+		if message_id == SMB2_UNSOLICITED_MESSAGE_ID and msg.header.Command == SMB2Command.OPLOCK_BREAK:
+			self.__notify(msg)
+			return
+
+		if message_id not in self.pending:
+			logger.debug('Reply to unknown or abandoned request with MessageId %s' % message_id)
+			return
+
+		if msg.header.Status == NTStatus.PENDING and hasattr(msg.header, 'AsyncId'):
+			#interim reply, the final reply will arrive with the same MessageId later
+			self.async_ids[message_id] = msg.header.AsyncId
+			return
+
+		fut = self.pending.pop(message_id)
+		self.async_ids.pop(message_id, None)
+		if not fut.done():
+			fut.set_result(msg)
+
+	def fail_all(self, exc = None):
+		"""
+		Fails every outstanding request, no new requests can be registered afterwards
+		"""
+		self.closed = True
+		self.close_exc = exc if exc is not None else SMBConnectionTerminated('Connection terminated')
+		pending = self.pending
+		self.pending = {}
+		self.async_ids = {}
+		for fut in pending.values():
+			if not fut.done():
+				fut.set_exception(self.close_exc)
+
+	def __str__(self):
+		t = '==== SMBResponseDispatcher ====\r\n'
+		t += 'pending: %s\r\n' % len(self.pending)
+		t += 'async: %s\r\n' % len(self.async_ids)
+		t += 'closed: %s\r\n' % self.closed
+		return t
@@ -0,0 +1,240 @@
+import os
+import hashlib
+import collections
+
+from aiosmb.protocol.smb2.commands.oplock_break import LeaseState
+
+class SMBLeaseCacheEntry:
+	"""
+	Cached data and metadata of one file. The content can be trusted as long as an open of the file holds a lease with read caching,
+	the server breaks the lease before anyone else changes the file.
+	"""
+	def __init__(self, lease_key):
+		self.lease_key = lease_key
+		self.lease_state = LeaseState.SMB2_LEASE_NONE
+		self.epoch = 0
+		self.open_count = 0 #number of our opens using the lease
+		self.version = 0 #incremented by every invalidation, data requested before an invalidation must not be stored
+		self.metadata = None #CREATE_REPLY of the last open (times, sizes, attributes)
+		self.end_of_file = None
+		self.info = {} #(information_class, additional_information) -> QUERY_INFO data
+		self.blocks = {} #block index -> bytes
+		self.size = 0 #bytes held in blocks
+
+	def is_readable(self):
+		return self.open_count > 0 and self.end_of_file is not None and LeaseState.SMB2_LEASE_READ_CACHING in self.lease_state
+
+	def __repr__(self):
+		t = '==== SMBLeaseCacheEntry ====\r\n'
+		t += 'lease_key: %s\r\n' % self.lease_key.hex()
+		t += 'lease_state: %s\r\n' % self.lease_state
+		t += 'open_count: %s\r\n' % self.open_count
+		t += 'blocks: %s\r\n' % len(self.blocks)
+		return t
+
+class SMBLeaseCache:
+	"""
+	Client side cache of file blocks and metadata, backed by SMB 2.1+ leases.
+	Every file gets its own lease key, so all opens of the same file share one lease. The key is derived from the path,
+	entries are only created for files the server granted a lease on. The cached data is served while an open holds
+	a lease with read caching and dropped when the server breaks it. After the last open is closed the data is kept, the next open
+	revalidates it with the timestamps and size returned by the server. Only whole blocks are cached (and the last block of the file),
+	the least recently used files are evicted once max_size is exceeded.
+	"""
+	def __init__(self, max_size = 64*1024*1024, block_size = 64*1024):
+		self.max_size = max_size
+		self.block_size = block_size
+		self.entries = collections.OrderedDict() #lease key -> SMBLeaseCacheEntry, least recently used first
+		self.size = 0
+		self.__salt = os.urandom(16) #lease keys of the same path differ between caches
+
+	def get_lease_key(self, share_name, path):
+		"""
+		Returns the lease key to be used when opening the file, the same file always gets the same key
+		"""
+		#SMB paths are case insensitive
+		data = '%s\x00%s' % (share_name.upper(), path.upper())
+		return hashlib.sha256(self.__salt + data.encode('utf-16-le')).digest()[:16]
+
+	def get_entry(self, lease_key):
+		return self.entries.get(lease_key)
+
+	def opened(self, lease_key, lease_state, epoch, reply):
+		"""
+		Called for every successful open that got a lease. reply is the CREATE_REPLY
+		"""
+		entry = self.entries.get(lease_key)
+		if entry is None:
+			entry = SMBLeaseCacheEntry(lease_key)
+			self.entries[lease_key] = entry
+		if LeaseState.SMB2_LEASE_READ_CACHING not in lease_state:
+			self.invalidate(entry)
+		elif entry.metadata is not None and entry.open_count == 0:
+			#nothing protected the data while the file was not open
+			old = entry.metadata
+			if (old.LastWriteTime, old.ChangeTime, old.EndofFile) != (reply.LastWriteTime, reply.ChangeTime, reply.EndofFile):
+				self.invalidate(entry)
+		entry.lease_state = lease_state
+		entry.epoch = epoch
+		entry.metadata = reply
+		entry.end_of_file = reply.EndofFile
+		entry.open_count += 1
+		return entry
+
+	def closed(self, lease_key):
+		entry = self.entries.get(lease_key)
+		if entry is None or entry.open_count == 0:
+			return
+		entry.open_count -= 1
+		if entry.open_count == 0 and entry.size == 0:
+			#nothing worth revalidating on the next open
+			self.__remove(entry)
+
+	def lease_break(self, lease_key, new_state, epoch = 0):
+		"""
+		Applies a lease break notification, returns the entry or None if the lease is unknown
+		"""
+		entry = self.entries.get(lease_key)
+		if entry is None:
+			return None
+		if LeaseState.SMB2_LEASE_READ_CACHING not in new_state:
+			self.invalidate(entry)
+		entry.lease_state = new_state
+		entry.epoch = max(entry.epoch, epoch)
+		return entry
+
+	def invalidate(self, entry):
+		"""
+		Drops everything cached for the file, the lease key is kept
+		"""
+		entry.version += 1
+		self.size -= entry.size
+		entry.size = 0
+		entry.blocks = {}
+		entry.info = {}
+		entry.metadata = None
+		entry.end_of_file = None
+
+	def reset(self):
+		"""
+		Invalidates all entries and forgets the opens, used when the session is lost
+		"""
+		for entry in self.entries.values():
+			self.invalidate(entry)
+			entry.open_count = 0
+			entry.lease_state = LeaseState.SMB2_LEASE_NONE
+
+	def written(self, entry, offset, count):
+		"""
+		Our own writes don't break our lease, the cached data is dropped and the known size is updated instead
+		"""
+		end_of_file = entry.end_of_file
+		self.invalidate(entry)
+		if end_of_file is not None:
+			entry.end_of_file = max(end_of_file, offset + count)
+
+	def read(self, entry, offset, length):
+		"""
+		Returns the data of the range (truncated at the end of the file) or None if any of it is not cached
+		"""
+		length = self.__get_cached_length(entry, offset, length)
+		if length is None:
+			return None
+		if length == 0:
+			return b''
+		bs = self.block_size
+		first = offset // bs
+		last = (offset + length - 1) // bs
+		if first == last:
+			block = entry.blocks[first]
+			start = offset - first * bs
+			return block[start:start+length]
+		buff = bytearray(length)
+		self.__copy_out(entry, offset, memoryview(buff))
+		return bytes(buff)
+
+	def readinto(self, entry, offset, view):
+		"""
+		Copies the cached data of the range into view, returns the byte count or None if any of it is not cached
+		"""
+		view = memoryview(view)
+		length = self.__get_cached_length(entry, offset, len(view))
+		if length is None:
+			return None
+		self.__copy_out(entry, offset, view[:length])
+		return length
+
+	def store(self, entry, version, offset, data):
+		"""
+		Stores the blocks fully covered by data (read from offset), nothing is stored if the entry was invalidated since version was taken
+		"""
+		if entry.version != version or entry.is_readable() is False:
+			return
+		bs = self.block_size
+		data = memoryview(data)
+		end = offset + len(data)
+		index = (offset + bs - 1) // bs
+		while index * bs < end:
+			start = index * bs
+			stop = min(start + bs, entry.end_of_file)
+			if stop > end or stop <= start:
+				break
+			if index not in entry.blocks:
+				block = bytes(data[start-offset:stop-offset])
+				entry.blocks[index] = block
+				entry.size += len(block)
+				self.size += len(block)
+			index += 1
+		self.entries.move_to_end(entry.lease_key)
+		self.__evict()
+
+	def get_info(self, entry, info_key):
+		return entry.info.get(info_key)
+
+	def store_info(self, entry, version, info_key, data):
+		if entry.version != version or entry.is_readable() is False:
+			return
+		entry.info[info_key] = data
+
+	def __get_cached_length(self, entry, offset, length):
+		if entry.is_readable() is False:
+			return None
+		length = max(0, min(length, entry.end_of_file - offset))
+		if length == 0:
+			return 0
+		bs = self.block_size
+		for index in range(offset // bs, (offset + length + bs - 1) // bs):
+			if index not in entry.blocks:
+				return None
+		self.entries.move_to_end(entry.lease_key)
+		return length
+
+	def __copy_out(self, entry, offset, view):
+		bs = self.block_size
+		pos = 0
+		while pos < len(view):
+			index, start = divmod(offset + pos, bs)
+			block = entry.blocks[index]
+			count = min(len(block) - start, len(view) - pos)
+			view[pos:pos+count] = block[start:start+count]
+			pos += count
+
+	def __evict(self):
+		for entry in list(self.entries.values()):
+			if self.size <= self.max_size:
+				break
+			self.size -= entry.size
+			entry.size = 0
+			entry.blocks = {}
+			if entry.open_count == 0:
+				self.__remove(entry)
+
+	def __remove(self, entry):
+		self.size -= entry.size
+		del self.entries[entry.lease_key]
+
+	def __str__(self):
+		t = '==== SMBLeaseCache ====\r\n'
+		t += 'files: %s\r\n' % len(self.entries)
+		t += 'size: %s\r\n' % self.size
+		return t
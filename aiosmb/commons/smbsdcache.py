@@ -0,0 +1,49 @@
+import hashlib
+import collections
+
+from aiosmb.dtyp.constrcuted_security.security_descriptor import SECURITY_DESCRIPTOR
+
+class SMBSecurityDescriptorCache:
+	"""
+	Parsed SECURITY_DESCRIPTOR objects keyed by the SHA-256 digest of their raw bytes.
+	Most files of a share inherit the ACL of their parent, so the same few descriptors come back over and over again.
+	The returned objects are shared between all files with the same descriptor, they must not be modified.
+	The least recently used descriptors are dropped above max_entries.
+	"""
+	def __init__(self, max_entries = 10000):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict() #digest -> SECURITY_DESCRIPTOR, least recently used first
+		self.hits = 0
+		self.misses = 0
+
+	@staticmethod
+	def get_key(data):
+		return hashlib.sha256(data).digest()
+
+	def from_bytes(self, data):
+		"""
+		Returns the parsed descriptor of data, parsing it only if it was not seen before
+		"""
+		key = SMBSecurityDescriptorCache.get_key(data)
+		sd = self.entries.get(key)
+		if sd is not None:
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return sd
+
+		self.misses += 1
+		sd = SECURITY_DESCRIPTOR.from_bytes(data)
+		self.entries[key] = sd
+		if len(self.entries) > self.max_entries:
+			self.entries.popitem(last = False)
+		return sd
+
+	def clear(self):
+		self.entries.clear()
+
+	def __str__(self):
+		t = '==== SMBSecurityDescriptorCache ====\r\n'
+		t += 'descriptors: %s\r\n' % len(self.entries)
+		t += 'hits: %s\r\n' % self.hits
+		t += 'misses: %s\r\n' % self.misses
+		return t
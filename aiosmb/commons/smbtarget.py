@@ -8,6 +8,7 @@ class SMBTarget:
 		self.timeout = 1
 		self.dc_ip = None
 		self.domain = None
+		self.buffered_transport = False #use the BufferedProtocol based transport instead of the TCPSocket/NetBIOSTransport queues
 		
 	def to_target_string(self):
 		return 'cifs/%s@%s' % (self.hostname, self.domain)
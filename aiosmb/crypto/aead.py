@@ -0,0 +1,98 @@
+"""
+SMB 3.x message encryption (AES-128-CCM and AES-128-GCM).
+The cryptography package is used, it is backed by OpenSSL which makes use of the AES-NI/CLMUL instructions where available.
+"""
+import os
+
+from aiosmb.protocol.smb2.commands.negotiate import SMB2Cipher
+from aiosmb.protocol.smb2.headers.transform import SMB2Header_TRANSFORM
+
+ENCRYPTION_AVAILABLE = False
+try:
+	from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+	from cryptography.hazmat.primitives.ciphers.aead import AESCCM
+	from cryptography.hazmat.backends import default_backend
+	ENCRYPTION_AVAILABLE = True
+except ImportError:
+	pass
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/24d74c0c-3de1-40d9-a949-d169ad84361d
+class SMBEncryption:
+	"""
+	Encrypts and decrypts SMB2 messages for one session.
+	The expanded keys are created once and reused for every message.
+	"""
+	TRANSFORM_HEADER_SIZE = 52
+
+	def __init__(self, cipher, encryption_key, decryption_key):
+		self.cipher = cipher
+		self.encryption_key = encryption_key
+		self.decryption_key = decryption_key
+
+		if self.cipher == SMB2Cipher.AES_128_CCM:
+			self.nonce_length = 11
+			self.__ccm_enc = AESCCM(self.encryption_key, tag_length = 16)
+			self.__ccm_dec = AESCCM(self.decryption_key, tag_length = 16)
+		elif self.cipher == SMB2Cipher.AES_128_GCM:
+			self.nonce_length = 12
+			self.__gcm_enc = algorithms.AES(self.encryption_key)
+			self.__gcm_dec = algorithms.AES(self.decryption_key)
+		else:
+			raise Exception('Unsupported cipher %s' % self.cipher)
+
+	def encrypt(self, data, session_id):
+		"""
+		data: the serialized SMB2 message(s), bytes-like
+		Returns a bytearray with the transform header and the encrypted message
+		"""
+		data = memoryview(data)
+		nonce = os.urandom(self.nonce_length)
+
+		hdr = SMB2Header_TRANSFORM()
+		hdr.Nonce = nonce + b'\x00' * (16 - self.nonce_length)
+		hdr.OriginalMessageSize = len(data)
+		hdr.SessionId = session_id
+
+		hsize = SMBEncryption.TRANSFORM_HEADER_SIZE
+		hdr_data = hdr.to_bytes()
+		aad = hdr_data[20:]
+		if self.cipher == SMB2Cipher.AES_128_GCM:
+			#encrypting directly into the output buffer, update_into needs block_size - 1 bytes of extra room
+			buff = bytearray(hsize + len(data) + 15)
+			buff[:hsize] = hdr_data
+			encryptor = Cipher(self.__gcm_enc, modes.GCM(nonce), backend = default_backend()).encryptor()
+			encryptor.authenticate_additional_data(aad)
+			view = memoryview(buff)
+			encryptor.update_into(data, view[hsize:])
+			encryptor.finalize()
+			view.release()
+			del buff[hsize + len(data):]
+			buff[4:20] = encryptor.tag
+			return buff
+
+		ct = self.__ccm_enc.encrypt(nonce, data, aad)
+		buff = bytearray(hsize + len(data))
+		buff[:hsize] = hdr_data
+		buff[hsize:] = memoryview(ct)[:-16]
+		buff[4:20] = memoryview(ct)[-16:]
+		return buff
+
+	def decrypt(self, header, data):
+		"""
+		header: SMB2Header_TRANSFORM of the incoming message
+		data: encrypted payload, bytes-like
+		Returns the decrypted SMB2 message(s) as bytes-like object. Raises an exception if the authentication fails.
+		"""
+		aad = header.to_bytes()[20:]
+		nonce = header.Nonce[:self.nonce_length]
+
+		if self.cipher == SMB2Cipher.AES_128_GCM:
+			buff = bytearray(len(data) + 15)
+			decryptor = Cipher(self.__gcm_dec, modes.GCM(nonce, header.Signature), backend = default_backend()).decryptor()
+			decryptor.authenticate_additional_data(aad)
+			decryptor.update_into(data, buff)
+			decryptor.finalize()
+			del buff[len(data):]
+			return buff
+
+		return self.__ccm_dec.decrypt(nonce, bytes(data) + header.Signature, aad)
@@ -0,0 +1,23 @@
+import hmac
+import hashlib
+
+# https://csrc.nist.gov/publications/detail/sp/800-108/final
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/7fd079ca-17e6-4f02-8449-46b606ea289c
+def KDF_CounterMode(Ki, Label, Context, L = 128):
+	"""
+	SP800-108 key derivation in counter mode with HMAC-SHA256 as PRF, as used by SMB 3.x to derive the signing/encryption keys.
+	Ki: the session key
+	Label, Context: bytes, including the terminating NULL as the SMB2 specification lists them
+	L: length of the derived key in bits
+	"""
+	h = 256 #HMAC-SHA256 output length
+	n = (L + h - 1) // h
+	
+	result = b''
+	for i in range(1, n + 1):
+		data  = i.to_bytes(4, byteorder = 'big', signed = False)
+		data += Label + b'\x00' + Context
+		data += L.to_bytes(4, byteorder = 'big', signed = False)
+		result += hmac.new(Ki, data, hashlib.sha256).digest()
+	
+	return result[:L // 8]
@@ -0,0 +1,77 @@
+"""
+SMB2/3 message signing.
+Every signer is created once per session, the keyed state is cached and copied for each message instead of being set up again.
+AES-CMAC and AES-GMAC need the cryptography package.
+"""
+import hmac
+import hashlib
+
+from aiosmb.protocol.smb2.commands.negotiate import SMB2SigningAlgorithm
+
+SIGNING_AES_AVAILABLE = False
+try:
+	from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+	from cryptography.hazmat.primitives.cmac import CMAC
+	from cryptography.hazmat.backends import default_backend
+	SIGNING_AES_AVAILABLE = True
+except ImportError:
+	pass
+
+class HMACSHA256Signer:
+	"""
+	SMB 2.0.2 and 2.1
+	"""
+	def __init__(self, key):
+		self.__hmac = hmac.new(key, digestmod = hashlib.sha256)
+
+	def sign(self, data):
+		h = self.__hmac.copy()
+		h.update(data)
+		return h.digest()[:16]
+
+class AESCMACSigner:
+	"""
+	SMB 3.0, 3.0.2 and 3.1.1 (unless GMAC is negotiated)
+	"""
+	def __init__(self, key):
+		self.__cmac = CMAC(algorithms.AES(key), backend = default_backend())
+
+	def sign(self, data):
+		c = self.__cmac.copy()
+		c.update(data)
+		return c.finalize()
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/a3154a0e-a7f9-4e5c-a69f-b5bbbd3e9c12
+class AESGMACSigner:
+	"""
+	SMB 3.1.1 with the signing capabilities negotiate context.
+	The nonce is built from the MessageId, the direction and whether the message is a CANCEL request.
+	"""
+	def __init__(self, key):
+		self.__aes = algorithms.AES(key)
+
+	def sign(self, data):
+		flags = int.from_bytes(data[16:20], byteorder = 'little', signed = False)
+		command = int.from_bytes(data[12:14], byteorder = 'little', signed = False)
+		role = 1 if flags & 0x00000001 else 0 #SMB2_FLAGS_SERVER_TO_REDIR
+		is_cancel = 2 if command == 0x000C else 0 #SMB2 CANCEL
+		nonce = bytes(data[24:32]) + (role | is_cancel).to_bytes(4, byteorder = 'little', signed = False)
+
+		encryptor = Cipher(self.__aes, modes.GCM(nonce), backend = default_backend()).encryptor()
+		encryptor.authenticate_additional_data(data)
+		encryptor.finalize()
+		return encryptor.tag[:16]
+
+def get_signer(algorithm, key):
+	"""
+	Returns the signer object for the negotiated signing algorithm
+	"""
+	if algorithm == SMB2SigningAlgorithm.HMAC_SHA256:
+		return HMACSHA256Signer(key)
+	if SIGNING_AES_AVAILABLE is False:
+		raise Exception('Signing algorithm %s needs the cryptography package!' % algorithm.name)
+	if algorithm == SMB2SigningAlgorithm.AES_CMAC:
+		return AESCMACSigner(key)
+	if algorithm == SMB2SigningAlgorithm.AES_GMAC:
+		return AESGMACSigner(key)
+	raise Exception('Unknown signing algorithm %s' % algorithm)
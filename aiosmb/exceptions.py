@@ -32,4 +32,16 @@ class SMBIncorrectShareName(SMBException):
 	pass
 	
 class SMBCreateAccessDenied(SMBException):
-	pass
\ No newline at end of file
+	pass
+	
+class SMBConnectionTerminated(SMBException):
+	pass
+
+class SMBRequestTimeoutException(SMBException):
+	pass
+
+class SMBMultiChannelNotSupported(SMBException):
+	pass
+
+class SMBMessageParseError(SMBException):
+	pass
@@ -1,10 +1,15 @@
 
+import asyncio
+import collections
+
+from aiosmb import logger
+from aiosmb.exceptions import SMBException, SMBConnectionTerminated, SMBRequestTimeoutException
 from aiosmb.commons.smbcontainer import *
 from aiosmb.commons.access_mask import *
 from aiosmb.protocol.smb2.commands import *
 
 class SMBFileReader:
-	def __init__(self, connection = None):
+	def __init__(self, connection = None, read_window = 8, write_window = 8, durable = False, max_reconnects = 3, lease = False):
 		self.connection = connection
 		self.mode = None
 		self.file = None
@@ -13,6 +18,24 @@ class SMBFileReader:
 		self.position = 0
 		self.is_pipe = False
 		
+		#files are opened with a durable handle, reads survive a network failure by reconnecting and resuming at the last received offset
+		self.durable = durable
+		self.max_reconnects = max_reconnects
+		self.__handle = None #FileHandle entry of the connection, it is updated in place by reconnect
+		
+		#files opened for reading ask for a read lease, unchanged data is then served from the lease cache of the connection
+		self.lease = lease
+		
+		#maximum number of READ requests kept in flight, the actual window is also bounded by the available credits
+		self.read_window = read_window
+		
+		#write-behind buffering, small writes are coalesced into max-write-size chunks
+		#and up to write_window WRITE requests are kept in flight. flush() waits for all of them
+		self.write_window = write_window
+		self.__write_buffer = bytearray()
+		self.__write_buffer_offset = 0
+		self.__write_tasks = collections.deque()
+		
 	async def __aenter__(self):
 		return self
 		
@@ -29,36 +52,221 @@ class SMBFileReader:
 		
 		return
 		
+	def __get_read_window(self, chunk_size):
+		"""
+		Number of READ requests that can be in flight at the same time for chunk_size sized reads
+		"""
+		credit_charge = 1 + (chunk_size - 1) // 65536
+		return max(1, min(self.read_window, self.connection.get_granted_credits() // credit_charge))
+		
+	async def __read_pipelined(self, size, offset):
+		"""
+		Reads size bytes starting from offset, keeping multiple READ requests in flight.
+		Yields the data chunks in file order as they arrive. Stops at EOF.
+		"""
+		chunk_size = self.connection.get_max_read_size()
+		end = offset + size
+		next_offset = offset
+		pending = collections.deque() #(offset, length, task) in file order
+		try:
+			while True:
+				window = self.__get_read_window(chunk_size)
+				while len(pending) < window and next_offset < end:
+					length = min(chunk_size, end - next_offset)
+					task = asyncio.ensure_future(self.connection.read(self.share.tree_id, self.file.file_id, offset = next_offset, length = length))
+					pending.append((next_offset, length, task))
+					next_offset += length
+				
+				if len(pending) == 0:
+					break
+				
+				chunk_offset, length, task = pending.popleft()
+				data, remaining = await task
+				if len(data) == 0:
+					#EOF
+					break
+				
+				if len(data) < length:
+					#short read, asking for the missing part before anything else
+					missing_offset = chunk_offset + len(data)
+					missing_length = length - len(data)
+					task = asyncio.ensure_future(self.connection.read(self.share.tree_id, self.file.file_id, offset = missing_offset, length = missing_length))
+					pending.appendleft((missing_offset, missing_length, task))
+				
+				yield data
+		
+		finally:
+			#not cancelling the outstanding reads, their replies must be consumed
+			if len(pending) > 0:
+				await asyncio.gather(*[task for _, _, task in pending], return_exceptions = True)
+		
+	async def __recover(self, generation, attempt):
+		"""
+		Reconnects the session and picks up the reclaimed durable handle. Returns False if the read can't be resumed.
+		"""
+		if self.__handle is None or self.__handle.is_durable is False or attempt >= self.max_reconnects:
+			return False
+		try:
+			await self.connection.reconnect(generation = generation)
+		except Exception as e:
+			logger.debug('[SMBFileReader] Reconnect failed. Reason: %s' % e)
+			return False
+		if self.connection.FileHandleTable.get(self.__handle.file_id) is not self.__handle:
+			#the server dropped the handle while we were away
+			return False
+		self.file.file_id = self.__handle.file_id
+		self.share.tree_id = self.__handle.tree_id
+		return True
+		
+	async def __read_resumable(self, size, offset, view = None):
+		"""
+		Pipelined read which resumes at the first missing byte after a reconnect, if the file was opened with a durable handle.
+		view: if given, the data is read into it (see __readinto_pipelined), otherwise yields the data chunks
+		"""
+		done = 0
+		attempt = 0
+		while True:
+			generation = self.connection.generation
+			try:
+				if view is None:
+					chunks = self.__read_pipelined(size - done, offset + done)
+				else:
+					chunks = self.__readinto_pipelined(view[done:size], offset + done)
+				try:
+					async for data in chunks:
+						done += len(data)
+						yield data
+				finally:
+					#drains the reads in flight right away if the consumer stopped early
+					await chunks.aclose()
+				return
+			
+			except (SMBConnectionTerminated, SMBRequestTimeoutException):
+				if await self.__recover(generation, attempt) is False:
+					raise
+				logger.debug('[SMBFileReader] Resuming read at offset %s after reconnect' % (offset + done))
+				attempt += 1
+		
 	async def __read(self, size, offset):
 		"""
 		This is the main function for reading.
 		It does not do buffering, so if more data is returned it will just discard it
 		If less data is returned than requested it will do more reads until the requested size is reached.
-		Do not call this directly as it could go in an infinite loop 
 		"""
 		if self.is_pipe == True:
 			data, remaining = await self.connection.read(self.share.tree_id, self.file.file_id, offset = offset, length = size)
 			return data
 		
-		buffer = b''
-		while len(buffer) <= size:
-			data, remaining = await self.connection.read(self.share.tree_id, self.file.file_id, offset = offset, length = size)
-			buffer += data
+		chunks = []
+		async for data in self.__read_resumable(size, offset):
+			chunks.append(data)
 			
-		return buffer[:size]
+		return b''.join(chunks)[:size]
+		
+	async def __readinto_pipelined(self, view, offset):
+		"""
+		Same as __read_pipelined, but every READ lands in its own slice of view, nothing is copied afterwards.
+		Yields the filled parts of view in order. Stops at EOF.
+		"""
+		chunk_size = self.connection.get_max_read_size()
+		size = len(view)
+		next_pos = 0
+		pending = collections.deque() #(position in view, length, task) in file order
+		try:
+			while True:
+				window = self.__get_read_window(chunk_size)
+				while len(pending) < window and next_pos < size:
+					length = min(chunk_size, size - next_pos)
+					task = asyncio.ensure_future(self.connection.readinto(self.share.tree_id, self.file.file_id, view[next_pos:next_pos+length], offset = offset + next_pos))
+					pending.append((next_pos, length, task))
+					next_pos += length
+				
+				if len(pending) == 0:
+					break
+				
+				pos, length, task = pending.popleft()
+				count, remaining = await task
+				if count == 0:
+					#EOF
+					break
+				
+				if count < length:
+					#short read, filling the gap before anything else
+					missing_pos = pos + count
+					missing_length = length - count
+					task = asyncio.ensure_future(self.connection.readinto(self.share.tree_id, self.file.file_id, view[missing_pos:missing_pos+missing_length], offset = offset + missing_pos))
+					pending.appendleft((missing_pos, missing_length, task))
+				
+				yield view[pos:pos+count]
+		
+		finally:
+			#not cancelling the outstanding reads, their replies must be consumed
+			if len(pending) > 0:
+				await asyncio.gather(*[task for _, _, task in pending], return_exceptions = True)
 		
 	async def __write(self, data, offset = 0):
-		remaining = len(data)
+		"""
+		Writes all of data to the file at offset, reissues the WRITE for the remaining part if the server did not write everything.
+		"""
+		data = memoryview(data)
 		total_bytes_written = 0
 		
-		while remaining != 0:
-			bytes_written = await self.connection.write(self.share.tree_id, self.file.file_id, data[offset:len(data)], offset = offset)
+		while total_bytes_written < len(data):
+			bytes_written = await self.connection.write(self.share.tree_id, self.file.file_id, data[total_bytes_written:], offset = offset + total_bytes_written)
+			if bytes_written == 0:
+				#would never advance
+				raise SMBException('Server wrote 0 bytes at offset %s' % (offset + total_bytes_written))
 			total_bytes_written += bytes_written
-			remaining -= bytes_written
-			offset += bytes_written
 		
 		return total_bytes_written
 		
+	async def __write_dispatch(self, data, offset):
+		"""
+		Starts a background WRITE for data, waits for the oldest one first if the write window is full.
+		"""
+		credit_charge = 1 + (len(data) - 1) // 65536
+		window = max(1, min(self.write_window, self.connection.get_granted_credits() // credit_charge))
+		while len(self.__write_tasks) >= window:
+			await self.__write_tasks.popleft()
+		
+		self.__write_tasks.append(asyncio.ensure_future(self.__write(data, offset)))
+		
+	async def __write_buffered(self, data):
+		"""
+		Appends data to the write-behind buffer and sends out every full chunk.
+		"""
+		if len(self.__write_buffer) == 0:
+			self.__write_buffer_offset = self.position
+		self.__write_buffer += data
+		
+		chunk_size = self.connection.get_max_write_size()
+		while len(self.__write_buffer) >= chunk_size:
+			chunk = self.__write_buffer[:chunk_size]
+			del self.__write_buffer[:chunk_size]
+			await self.__write_dispatch(chunk, self.__write_buffer_offset)
+			self.__write_buffer_offset += chunk_size
+			
+		return len(data)
+		
+	async def __write_drain(self):
+		"""
+		Sends out the remaining buffered data and waits until all outstanding WRITEs are acknowledged.
+		The first error is raised after all WRITEs completed.
+		"""
+		if len(self.__write_buffer) > 0:
+			chunk = self.__write_buffer
+			self.__write_buffer = bytearray()
+			await self.__write_dispatch(chunk, self.__write_buffer_offset)
+		
+		if len(self.__write_tasks) == 0:
+			return
+		tasks = list(self.__write_tasks)
+		self.__write_tasks.clear()
+		results = await asyncio.gather(*tasks, return_exceptions = True)
+		for res in results:
+			if isinstance(res, Exception):
+				raise res
+		
 	async def open(self, filename, mode = 'r'):
 		self.mode = mode
 		if 'p' in self.mode:
@@ -89,7 +297,7 @@ class SMBFileReader:
 		else:
 			raise Exception('Filename MUST be either SMBFile or a full path string to the file')
 		
-		#first, connecting to the share. we create a new treeid regardless of it already exists one for this share or not
+		#first, connecting to the share. an already connected tree is reused by the connection
 		await self.__connect_share(self.share)
 		
 		#then connect to file
@@ -103,7 +311,14 @@ class SMBFileReader:
 			file_attrs = 0
 			create_disposition = CreateDisposition.FILE_OPEN
 			
-			self.file.file_id, smb_reply = await self.connection.create(self.share.tree_id, self.fullpath, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = True)
+			lease_state = None
+			if self.lease == True and self.is_pipe == False:
+				lease_state = LeaseState.SMB2_LEASE_READ_CACHING
+				if self.durable == True:
+					#a leased handle is only made durable with handle caching
+					lease_state |= LeaseState.SMB2_LEASE_HANDLE_CACHING
+			
+			self.file.file_id, smb_reply = await self.connection.create(self.share.tree_id, self.fullpath, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = True, durable = self.durable and not self.is_pipe, lease_state = lease_state)
 			self.file.size = smb_reply.EndofFile
 			
 		elif 'w' in mode:
@@ -113,17 +328,23 @@ class SMBFileReader:
 			file_attrs = 0
 			create_disposition = CreateDisposition.FILE_OPEN
 			
-			self.file.file_id, smb_reply = await self.connection.create(self.share.tree_id, self.fullpath, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = True)
+			self.file.file_id, smb_reply = await self.connection.create(self.share.tree_id, self.fullpath, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = True, durable = self.durable and not self.is_pipe)
 			self.file.size = smb_reply.EndofFile
 			
 		else:
 			raise Exception('ONLY read and write is supported at the moment!')
 			
+		self.__handle = self.connection.FileHandleTable.get(self.file.file_id)
+		if self.durable == True and self.is_pipe == False and (self.__handle is None or self.__handle.is_durable == False):
+			logger.debug('[SMBFileReader] Server did not grant a durable handle for %s' % self.fullpath)
+		
 		#if we don't know the actual file fize, we need to ask the server
 		
 			
 		
 	async def seek(self, offset, whence = 0):
+		#buffered data belongs to the current position
+		await self.__write_drain()
 		if whence == 0:
 			if offset < 0:
 				raise Exception('Offset must be > 0 when whence is 0')
@@ -144,6 +365,7 @@ class SMBFileReader:
 				raise Exception('Seeking outside of file size!')
 		
 	async def read(self, size = -1):
+		await self.__write_drain()
 		if size == 0:
 			raise Exception('Cant read 0 bytes')
 			
@@ -161,10 +383,62 @@ class SMBFileReader:
 			return data
 			
 			
+	async def readinto(self, buffer):
+		"""
+		Reads up to len(buffer) bytes from the current position directly into buffer (bytearray, mmap or writable memoryview).
+		Returns the number of bytes read, which is less than len(buffer) only at the end of the file.
+		"""
+		await self.__write_drain()
+		view = memoryview(buffer).cast('B')
+		if self.is_pipe == True:
+			count, remaining = await self.connection.readinto(self.share.tree_id, self.file.file_id, view, offset = self.position)
+			return count
+		
+		size = min(len(view), self.file.size - self.position)
+		if size <= 0:
+			return 0
+		count = 0
+		async for data in self.__read_resumable(size, self.position, view = view):
+			count += len(data)
+		self.position += count
+		return count
+		
+	async def read_chunked(self, size = -1):
+		"""
+		Async generator version of read. Keeps multiple READ requests in flight and yields the data in order as it arrives.
+		Useful for large files where the whole content should not be kept in memory.
+		"""
+		if self.is_pipe == True:
+			raise Exception('read_chunked is not supported on pipes!')
+		await self.__write_drain()
+		if size == 0:
+			raise Exception('Cant read 0 bytes')
+		elif size == -1:
+			size = self.file.size - self.position
+		elif size + self.position > self.file.size:
+			raise Exception('More data requested than filesize!')
+		
+		chunks = self.__read_resumable(size, self.position)
+		try:
+			async for data in chunks:
+				self.position += len(data)
+				yield data
+		finally:
+			await chunks.aclose()
+			
 	async def write(self, data):
-		count = await self.__write(data, self.position)
-		if self.is_pipe == False:
-			self.position += count
+		"""
+		Pipes are written directly, for files the data is buffered and written in the background.
+		Call flush() to make sure all data reached the server.
+		"""
+		if self.is_pipe == True:
+			return await self.__write(data, self.position)
+		
+		count = await self.__write_buffered(data)
+		self.position += count
+		if self.position > self.file.size:
+			self.file.size = self.position
+		return count
 		
 	async def flush(self):
 		if self.file is None:
@@ -172,12 +446,18 @@ class SMBFileReader:
 		if 'r' in self.mode:
 			return
 		else:
+			await self.__write_drain()
 			await self.connection.flush(self.share.tree_id, self.file.file_id)
 		
 	async def close(self):
-		if self.file is not None:
-			await self.flush()
-			await self.connection.close(self.share.tree_id, self.file.file_id)
-		if self.share is not None:
-			await self.connection.tree_disconnect(self.share.tree_id)
+		try:
+			if self.file is not None:
+				try:
+					await self.flush()
+				finally:
+					#the handle is closed even if the buffered data couldn't be written, the flush error is raised after
+					await self.connection.close(self.share.tree_id, self.file.file_id)
+		finally:
+			if self.share is not None:
+				await self.connection.tree_disconnect(self.share.tree_id)
 		
\ No newline at end of file
@@ -0,0 +1,202 @@
+import struct
+import datetime
+
+from aiosmb.fscc.structures.fileinfoclass import FileInfoClass
+
+#
+# Compact records for directory enumeration, for listings with lots of entries.
+# Timestamps are kept as raw FILETIME integers and FileAttributes as a plain integer, names are decoded on first access.
+# Cost per entry, from the cheapest: FileNamesInformation (name only), FileIdFullDirectoryInformation (+ times, sizes, attributes, FileId),
+# FileIdBothDirectoryInformation (+ 8.3 short name)
+#
+
+def filetime_to_datetime(ft):
+	"""
+	Converts a raw FILETIME integer to datetime, the same way FILETIME does
+	"""
+	if ft == 0xFFFFFFFFFFFFFFFF:
+		return datetime.datetime(3000, 1, 1, 0, 0)
+	if ft == 0:
+		return datetime.datetime(1970, 1, 1, 0, 0)
+	return datetime.datetime.utcfromtimestamp((ft - 116444736000000000) / 10000000)
+
+# NextEntryOffset, FileIndex, CreationTime, LastAccessTime, LastWriteTime, ChangeTime, EndOfFile, AllocationSize, FileAttributes,
+# FileNameLength, EaSize, ShortNameLength, Reserved1, ShortName, Reserved2, FileId
+FILE_ID_BOTH_DIRECTORY_INFORMATION_STRUCT = struct.Struct('<IIQQQQqqIIIBB24sHQ')
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-fscc/1e144bff-c056-45aa-bd29-c13d214ee2ba
+class FileIdBothDirectoryInformation:
+	__slots__ = (
+		'NextEntryOffset', 'FileIndex', 'CreationTime', 'LastAccessTime', 'LastWriteTime', 'ChangeTime', 'EndOfFile', 'AllocationSize',
+		'FileAttributes', 'EaSize', 'FileId', '_short_name', '_name', '_name_raw',
+	)
+
+	def __init__(self):
+		self.NextEntryOffset = 0
+		self.FileIndex = 0
+		self.CreationTime = 0
+		self.LastAccessTime = 0
+		self.LastWriteTime = 0
+		self.ChangeTime = 0
+		self.EndOfFile = 0
+		self.AllocationSize = 0
+		self.FileAttributes = 0
+		self.EaSize = 0
+		self.FileId = 0
+		self._short_name = b''
+		self._name = None
+		self._name_raw = b''
+
+	@property
+	def FileName(self):
+		if self._name is None:
+			self._name = self._name_raw.decode('utf-16-le')
+		return self._name
+
+	@property
+	def ShortName(self):
+		return self._short_name.decode('utf-16-le')
+
+	@staticmethod
+	def from_bytes(data):
+		return FileIdBothDirectoryInformation.from_view(memoryview(data), 0)
+
+	@staticmethod
+	def from_view(view, offset):
+		msg = FileIdBothDirectoryInformation()
+		msg.NextEntryOffset, msg.FileIndex, msg.CreationTime, msg.LastAccessTime, msg.LastWriteTime, msg.ChangeTime, \
+			msg.EndOfFile, msg.AllocationSize, msg.FileAttributes, name_length, msg.EaSize, short_name_length, _, short_name, _, \
+			msg.FileId = FILE_ID_BOTH_DIRECTORY_INFORMATION_STRUCT.unpack_from(view, offset)
+		msg._short_name = short_name[:short_name_length]
+		start = offset + FILE_ID_BOTH_DIRECTORY_INFORMATION_STRUCT.size
+		msg._name_raw = bytes(view[start:start+name_length])
+		return msg
+
+	def __str__(self):
+		t = '===== %s =====\r\n' % 'FileIdBothDirectoryInformation'
+		for k in FileIdBothDirectoryInformation.__slots__:
+			if k.startswith('_'):
+				continue
+			t += '%s : %s\r\n' % (k, getattr(self, k))
+		t += 'ShortName : %s\r\n' % self.ShortName
+		t += 'FileName : %s\r\n' % self.FileName
+		return t
+
+# NextEntryOffset, FileIndex, CreationTime, LastAccessTime, LastWriteTime, ChangeTime, EndOfFile, AllocationSize, FileAttributes,
+# FileNameLength, EaSize, Reserved, FileId
+FILE_ID_FULL_DIRECTORY_INFORMATION_STRUCT = struct.Struct('<IIQQQQqqIIIIQ')
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-fscc/b3a27a50-454f-4f8f-b8ea-decfedc5c454
+class FileIdFullDirectoryInformation:
+	__slots__ = (
+		'NextEntryOffset', 'FileIndex', 'CreationTime', 'LastAccessTime', 'LastWriteTime', 'ChangeTime', 'EndOfFile', 'AllocationSize',
+		'FileAttributes', 'EaSize', 'FileId', '_name', '_name_raw',
+	)
+
+	def __init__(self):
+		self.NextEntryOffset = 0
+		self.FileIndex = 0
+		self.CreationTime = 0
+		self.LastAccessTime = 0
+		self.LastWriteTime = 0
+		self.ChangeTime = 0
+		self.EndOfFile = 0
+		self.AllocationSize = 0
+		self.FileAttributes = 0
+		self.EaSize = 0
+		self.FileId = 0
+		self._name = None
+		self._name_raw = b''
+
+	@property
+	def FileName(self):
+		if self._name is None:
+			self._name = self._name_raw.decode('utf-16-le')
+		return self._name
+
+	@staticmethod
+	def from_bytes(data):
+		return FileIdFullDirectoryInformation.from_view(memoryview(data), 0)
+
+	@staticmethod
+	def from_view(view, offset):
+		msg = FileIdFullDirectoryInformation()
+		msg.NextEntryOffset, msg.FileIndex, msg.CreationTime, msg.LastAccessTime, msg.LastWriteTime, msg.ChangeTime, \
+			msg.EndOfFile, msg.AllocationSize, msg.FileAttributes, name_length, msg.EaSize, _, \
+			msg.FileId = FILE_ID_FULL_DIRECTORY_INFORMATION_STRUCT.unpack_from(view, offset)
+		start = offset + FILE_ID_FULL_DIRECTORY_INFORMATION_STRUCT.size
+		msg._name_raw = bytes(view[start:start+name_length])
+		return msg
+
+	def __str__(self):
+		t = '===== %s =====\r\n' % 'FileIdFullDirectoryInformation'
+		for k in FileIdFullDirectoryInformation.__slots__:
+			if k.startswith('_'):
+				continue
+			t += '%s : %s\r\n' % (k, getattr(self, k))
+		t += 'FileName : %s\r\n' % self.FileName
+		return t
+
+# NextEntryOffset, FileIndex, FileNameLength
+FILE_NAMES_INFORMATION_STRUCT = struct.Struct('<III')
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-fscc/a289f7a8-83d2-4927-8c88-b2d328dde5a5
+class FileNamesInformation:
+	__slots__ = ('NextEntryOffset', 'FileIndex', '_name', '_name_raw')
+
+	def __init__(self):
+		self.NextEntryOffset = 0
+		self.FileIndex = 0
+		self._name = None
+		self._name_raw = b''
+
+	@property
+	def FileName(self):
+		if self._name is None:
+			self._name = self._name_raw.decode('utf-16-le')
+		return self._name
+
+	@staticmethod
+	def from_bytes(data):
+		return FileNamesInformation.from_view(memoryview(data), 0)
+
+	@staticmethod
+	def from_view(view, offset):
+		msg = FileNamesInformation()
+		msg.NextEntryOffset, msg.FileIndex, name_length = FILE_NAMES_INFORMATION_STRUCT.unpack_from(view, offset)
+		start = offset + FILE_NAMES_INFORMATION_STRUCT.size
+		msg._name_raw = bytes(view[start:start+name_length])
+		return msg
+
+	def __str__(self):
+		t = '===== %s =====\r\n' % 'FileNamesInformation'
+		t += 'FileIndex : %s\r\n' % self.FileIndex
+		t += 'FileName : %s\r\n' % self.FileName
+		return t
+
+DIRECTORY_INFORMATION_TYPES = {
+	FileInfoClass.FileIdBothDirectoryInformation : FileIdBothDirectoryInformation,
+	FileInfoClass.FileIdFullDirectoryInformation : FileIdFullDirectoryInformation,
+	FileInfoClass.FileNamesInformation : FileNamesInformation,
+}
+
+class DirectoryInformationList:
+	"""
+	Parses a QUERY_DIRECTORY output buffer of one of the DIRECTORY_INFORMATION_TYPES classes into a list of records
+	"""
+	@staticmethod
+	def from_bytes(data, information_class):
+		return DirectoryInformationList.from_view(memoryview(data), information_class)
+
+	@staticmethod
+	def from_view(view, information_class):
+		parser = DIRECTORY_INFORMATION_TYPES[information_class].from_view
+		entries = []
+		offset = 0
+		while offset < len(view):
+			entry = parser(view, offset)
+			entries.append(entry)
+			if entry.NextEntryOffset == 0:
+				break
+			offset += entry.NextEntryOffset
+		return entries
@@ -0,0 +1,166 @@
+import asyncio
+
+from aiosmb import logger
+from aiosmb.exceptions import *
+
+class SMBBufferedTransport(asyncio.BufferedProtocol):
+	"""
+	TCP + NetBIOS framing transport built on asyncio.BufferedProtocol. Alternative to the TCPSocket + NetBIOSTransport chain.
+	The event loop reads directly into a preallocated buffer and the complete frames are handed to frame_handler
+	in the same callback, there are no queues or reader/writer tasks involved.
+	Frames that don't fit in the read buffer get their own buffer sized to the frame and the socket reads straight into it.
+	frame_handler: callable taking one frame payload (bytes-like), must not block
+	close_handler: callable taking the exception (or None), called once when the connection is lost
+	"""
+	HEADER_SIZE = 4
+
+	def __init__(self, frame_handler, close_handler = None, buffer_size = 256*1024):
+		self.frame_handler = frame_handler
+		self.close_handler = close_handler
+		self.settings = None
+		self.transport = None
+
+		self.__buffer = bytearray(buffer_size)
+		self.__view = memoryview(self.__buffer)
+		self.__start = 0
+		self.__end = 0
+
+		self.__frame = None #dedicated buffer of the frame being received
+		self.__frame_view = None
+		self.__frame_len = 0
+
+		self.__out_buffers = []
+		self.__flush_scheduled = False
+		self.__write_paused = False
+		self.__drain_waiter = None
+		self.disconnected = asyncio.Event()
+
+	async def connect(self, settings):
+		"""
+		Connects to the target specified in settings
+		"""
+		self.settings = settings
+		loop = asyncio.get_event_loop()
+		con = loop.create_connection(lambda: self, self.settings.get_ip(), self.settings.get_port())
+		try:
+			await asyncio.wait_for(con, int(self.settings.timeout))
+		except asyncio.TimeoutError:
+			logger.debug('[SMBBufferedTransport] Connection timeout')
+			raise SMBConnectionTimeoutException()
+		except ConnectionRefusedError:
+			logger.debug('[SMBBufferedTransport] Connection refused')
+			raise SMBConnectionRefusedException()
+
+	async def send(self, data):
+		"""
+		Sends one serialized SMB message (or compound), the NetBIOS header is written separately so the payload is not copied.
+		The data must not be modified afterwards.
+		"""
+		if self.transport is None or self.disconnected.is_set():
+			raise SMBConnectionTerminated('Connection closed')
+		hdr = b'\x00' + len(data).to_bytes(3, byteorder='big', signed = False)
+		self.__out_buffers.append(hdr)
+		self.__out_buffers.append(data)
+		if self.__flush_scheduled is False:
+			#everything sent in this event loop iteration is written out with one writelines call
+			self.__flush_scheduled = True
+			asyncio.get_event_loop().call_soon(self.__flush)
+		if self.__write_paused is True:
+			if self.__drain_waiter is None:
+				self.__drain_waiter = asyncio.get_event_loop().create_future()
+			await asyncio.shield(self.__drain_waiter)
+
+	async def stop(self):
+		await self.disconnect()
+
+	async def disconnect(self):
+		if self.transport is not None:
+			self.transport.close()
+			self.transport = None
+		self.disconnected.set()
+
+	def __flush(self):
+		self.__flush_scheduled = False
+		buffers = self.__out_buffers
+		self.__out_buffers = []
+		if self.transport is not None:
+			self.transport.writelines(buffers)
+
+	def connection_made(self, transport):
+		self.transport = transport
+
+	def connection_lost(self, exc):
+		self.transport = None
+		self.disconnected.set()
+		if self.__drain_waiter is not None and not self.__drain_waiter.done():
+			self.__drain_waiter.set_exception(SMBConnectionTerminated('Connection closed'))
+		self.__drain_waiter = None
+		if self.close_handler is not None:
+			try:
+				self.close_handler(exc)
+			except Exception:
+				logger.exception('[SMBBufferedTransport] close handler failed')
+
+	def pause_writing(self):
+		self.__write_paused = True
+
+	def resume_writing(self):
+		self.__write_paused = False
+		if self.__drain_waiter is not None and not self.__drain_waiter.done():
+			self.__drain_waiter.set_result(None)
+		self.__drain_waiter = None
+
+	def get_buffer(self, sizehint):
+		if self.__frame is not None:
+			#reading only the rest of the frame, the next header goes to the common buffer
+			return self.__frame_view[self.__frame_len:]
+		return self.__view[self.__end:]
+
+	def buffer_updated(self, nbytes):
+		if self.__frame is not None:
+			self.__frame_len += nbytes
+			if self.__frame_len == len(self.__frame):
+				frame = self.__frame
+				self.__frame_view.release()
+				self.__frame = None
+				self.__frame_view = None
+				self.__deliver(frame)
+			return
+
+		self.__end += nbytes
+		self.__parse()
+
+	def eof_received(self):
+		return False
+
+	def __parse(self):
+		view = self.__view
+		while self.__end - self.__start >= SMBBufferedTransport.HEADER_SIZE:
+			pos = self.__start + SMBBufferedTransport.HEADER_SIZE
+			size = int.from_bytes(view[self.__start+1:pos], byteorder='big', signed = False)
+			if self.__end - pos >= size:
+				self.__start = pos + size
+				if size > 0:
+					#the read buffer is reused, the frame must be copied out
+					self.__deliver(bytes(view[pos:pos+size]))
+				continue
+
+			#frame is incomplete, moving the received part to a buffer sized to the frame
+			self.__frame = bytearray(size)
+			self.__frame_view = memoryview(self.__frame)
+			self.__frame_len = self.__end - pos
+			self.__frame[:self.__frame_len] = view[pos:self.__end]
+			self.__start = self.__end
+			break
+
+		#only a partial header can be left over at this point
+		leftover = bytes(view[self.__start:self.__end])
+		self.__buffer[:len(leftover)] = leftover
+		self.__start = 0
+		self.__end = len(leftover)
+
+	def __deliver(self, frame):
+		try:
+			self.frame_handler(frame)
+		except Exception:
+			logger.exception('[SMBBufferedTransport] frame handler failed')
@@ -5,6 +5,86 @@ from aiosmb import logger
 from aiosmb.protocol.smb.message import *
 from aiosmb.protocol.smb2.message import *
 
+def parse_frame(msg_data):
+	"""
+	Parses one NetBIOS session message payload.
+	Returns the list of SMBv1/SMBv2/SMB2Transform messages in it, SMBv2 replies might be compounded.
+	"""
+	if msg_data[0] == 0xFF:
+		#version1
+		return [SMBMessage.from_bytes(msg_data)]
+	elif msg_data[0] == 0xFE:
+		#version2
+		return SMB2Message.from_compound_bytes(msg_data)
+	elif msg_data[0] == 0xFD:
+		#encrypted transform
+		return [SMB2Transform.from_bytes(msg_data)]
+	elif msg_data[0] == 0xFC:
+		#compressed transform
+		return [SMB2Transform.from_bytes(msg_data)]
+	else:
+		raise Exception('Unknown SMB version!')
+
+class NetBIOSFrameDecoder:
+	"""
+	Incremental NetBIOS session message decoder.
+	Frames that are fully contained in one incoming chunk are returned as memoryview slices of the chunk (no copy),
+	frames spanning multiple chunks are collected into a buffer preallocated to the frame size, so every byte is copied at most once.
+	The chunks passed to feed must not be modified afterwards.
+	"""
+	HEADER_SIZE = 4
+
+	def __init__(self):
+		self.__header = bytearray(NetBIOSFrameDecoder.HEADER_SIZE)
+		self.__header_len = 0
+		self.__frame = None #bytearray of the frame being collected
+		self.__frame_len = 0
+
+	def feed(self, data):
+		"""
+		data: bytes-like chunk from the network
+		Returns the list of complete frame payloads (bytes-like objects), possibly empty
+		"""
+		frames = []
+		view = memoryview(data)
+		pos = 0
+		end = len(view)
+		while pos < end:
+			if self.__frame is None:
+				if self.__header_len == 0 and end - pos >= NetBIOSFrameDecoder.HEADER_SIZE:
+					size = int.from_bytes(view[pos+1:pos+4], byteorder='big', signed = False)
+					pos += NetBIOSFrameDecoder.HEADER_SIZE
+				else:
+					#the header itself is split between chunks
+					n = min(NetBIOSFrameDecoder.HEADER_SIZE - self.__header_len, end - pos)
+					self.__header[self.__header_len:self.__header_len+n] = view[pos:pos+n]
+					self.__header_len += n
+					pos += n
+					if self.__header_len < NetBIOSFrameDecoder.HEADER_SIZE:
+						break
+					size = int.from_bytes(self.__header[1:4], byteorder='big', signed = False)
+					self.__header_len = 0
+				
+				if size == 0:
+					#keepalive or other empty session packet
+					continue
+				if end - pos >= size:
+					frames.append(view[pos:pos+size])
+					pos += size
+					continue
+				self.__frame = bytearray(size)
+				self.__frame_len = 0
+			
+			n = min(len(self.__frame) - self.__frame_len, end - pos)
+			self.__frame[self.__frame_len:self.__frame_len+n] = view[pos:pos+n]
+			self.__frame_len += n
+			pos += n
+			if self.__frame_len == len(self.__frame):
+				frames.append(self.__frame)
+				self.__frame = None
+		
+		return frames
+
 class NetBIOSTransport:
 	"""
 	Converts incoming bytestream from the network starsport to SMB messages and vice-versa.
@@ -37,39 +117,18 @@ class NetBIOSTransport:
 		asyncio.ensure_future(self.handle_incoming())
 		asyncio.ensure_future(self.handle_outgoing())
 		
-	async def parse_buffer(self, buffer, total_size = None):
+	async def send(self, data):
 		"""
-		Parses the incoming bytes buffer, dispatches SMBv1 or SMBv2 messages to the in_queue
-		Returns a bytes array with the remaining data
+		Queues one serialized SMB message (or compound) for sending
 		"""
-		if len(buffer) > 4:
-			if not total_size:
-				total_size = int.from_bytes(buffer[1:4], byteorder='big', signed = False) + 4
-			
-			if len(buffer) >= total_size:
-				msg_data = buffer[:total_size][4:]
-				buffer = buffer[total_size:]
-				total_size = None
-				
-				if msg_data[0] == 0xFF:
-					#version1
-					msg = SMBMessage.from_bytes(msg_data)
-				elif msg_data[0] == 0xFE:
-					#version2
-					msg = SMB2Message.from_bytes(msg_data)
-				elif msg_data[0] == 0xFD:
-					#encrypted transform
-					msg = SMB2Transform.from_bytes(msg_data)
-				elif msg_data[0] == 0xFC:
-					#compressed transform
-					msg = SMB2Transform.from_bytes(msg_data)
-				else:
-					raise Exception('Unknown SMB version!')
-					
-				await self.in_queue.put(msg)
-				await self.parse_buffer(buffer, total_size)
+		await self.out_queue.put(data)
 		
-		return buffer
+	async def dispatch_frame(self, msg_data):
+		"""
+		Parses one NetBIOS session message payload, dispatches the SMBv1 or SMBv2 message(s) to the in_queue
+		"""
+		for msg in parse_frame(msg_data):
+			await self.in_queue.put(msg)
 		
 	async def handle_incoming(self):
 		"""
@@ -77,12 +136,11 @@ class NetBIOSTransport:
 		Dispatches the SMBv1/2 message objects.
 		"""
 		try:
-			buffer = b''
+			decoder = NetBIOSFrameDecoder()
 			while not self.shutdown_evt.is_set() or not self.stop_evt.is_set():
 				data = await self.socket_in_queue.get()
-				#parse
-				buffer += data
-				buffer = await self.parse_buffer(buffer)
+				for msg_data in decoder.feed(data):
+					await self.dispatch_frame(msg_data)
 		except asyncio.CancelledError:
 			#the SMB connection is terminating
 			return
@@ -93,17 +151,19 @@ class NetBIOSTransport:
 		
 	async def handle_outgoing(self):
 		"""
-		Reads SMBv1/2 outgoing message objects from out_queue, wraps them in NetBIOS object, then serializes them, then sends them to socket_out_queue
+		Reads SMBv1/2 outgoing message objects from out_queue, serializes them, then sends them with the NetBIOS header to socket_out_queue as a (header, payload) tuple
 		"""
 		try:
 			while not self.shutdown_evt.is_set() or not self.stop_evt.is_set():
 				smb_msg = await self.out_queue.get()
-				#print(smb_msg)
-				smb_msg_data = smb_msg.to_bytes()
-				data  = b'\x00'
-				data += len(smb_msg_data).to_bytes(3, byteorder='big', signed = False)
-				data += smb_msg_data
-				await self.socket_out_queue.put(data)
+				#the connection might hand over already serialized (signed/encrypted) messages
+				if isinstance(smb_msg, (bytes, bytearray)):
+					smb_msg_data = smb_msg
+				else:
+					smb_msg_data = smb_msg.to_bytes()
+				#the header is passed along as a separate buffer, the payload is not copied
+				hdr = b'\x00' + len(smb_msg_data).to_bytes(3, byteorder='big', signed = False)
+				await self.socket_out_queue.put((hdr, smb_msg_data))
 		
 		except asyncio.CancelledError:
 			#the SMB connection is terminating
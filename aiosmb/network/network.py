@@ -4,6 +4,15 @@ import asyncio
 from aiosmb import logger
 from aiosmb.exceptions import *
 
+def add_out_buffers(buffers, data):
+	"""
+	Outgoing queue items are either a bytes-like object or a tuple of them (header and payload)
+	"""
+	if isinstance(data, tuple):
+		buffers.extend(data)
+	else:
+		buffers.append(data)
+
 class TCPSocket:
 	"""
 	Generic asynchronous TCP socket class, nothing SMB related.
@@ -40,6 +49,11 @@ class TCPSocket:
 		"""
 		while not self.disconnected.is_set() or not self.shutdown_evt.is_set():			
 			data = await asyncio.gather(*[self.reader.read(4096)], return_exceptions = True)
+			if data[0] == b'':
+				#EOF, the server closed the connection
+				await self.disconnect()
+				return
+			
 			if isinstance(data[0], bytes):
 				await self.in_queue.put(data[0])
 			
@@ -58,8 +72,12 @@ class TCPSocket:
 		"""
 		try:
 			while not self.disconnected.is_set() or not self.shutdown_evt.is_set():
-				data = await self.out_queue.get()
-				self.writer.write(data)
+				#everything queued up since the last write goes out with one writelines call and one drain
+				buffers = []
+				add_out_buffers(buffers, await self.out_queue.get())
+				while not self.out_queue.empty():
+					add_out_buffers(buffers, self.out_queue.get_nowait())
+				self.writer.writelines(buffers)
 				await self.writer.drain()
 		except asyncio.CancelledError:
 			#the SMB connection is terminating
@@ -3,6 +3,7 @@ import asyncio
 
 from aiosmb import logger
 from aiosmb.exceptions import *
+from aiosmb.network.network import add_out_buffers
 from aiosmb.network.netbios_transport import NetBIOSTransport
 from aiosmb.smbconnection_server import SMBServerConnection
 
@@ -51,8 +52,12 @@ class TCPServerSocket:
 		"""
 		try:
 			while not self.shutdown_evt.is_set():
-				data = await client.out_queue.get()
-				client.writer.write(data)
+				#everything queued up since the last write goes out with one writelines call and one drain
+				buffers = []
+				add_out_buffers(buffers, await client.out_queue.get())
+				while not client.out_queue.empty():
+					add_out_buffers(buffers, client.out_queue.get_nowait())
+				client.writer.writelines(buffers)
 				await client.writer.drain()
 		except asyncio.CancelledError:
 			#the SMB connection is terminating
@@ -1,7 +1,8 @@
-from aiosmb.protocol.smb2.commands.negotiate import NEGOTIATE_REQ, NEGOTIATE_REPLY,NegotiateSecurityMode, NegotiateCapabilities, NegotiateDialects
-from aiosmb.protocol.smb2.commands.sessionsetup import SESSION_SETUP_REQ, SESSION_SETUP_REPLY
+from aiosmb.protocol.smb2.commands.negotiate import NEGOTIATE_REQ, NEGOTIATE_REPLY,NegotiateSecurityMode, NegotiateCapabilities, NegotiateDialects, SMB2NegotiateContext, SMB2ContextType, SMB2PreauthIntegrityCapabilities, SMB2HashAlgorithm, SMB2EncryptionCapabilities, SMB2Cipher, SMB2SigningCapabilities, SMB2SigningAlgorithm
+from aiosmb.protocol.smb2.commands.sessionsetup import SESSION_SETUP_REQ, SESSION_SETUP_REPLY, SessionFlags, SessionSetupFlag
 from aiosmb.protocol.smb2.commands.tree_connect import TREE_CONNECT_REQ, TREE_CONNECT_REPLY, TreeConnectFlag, TreeCapabilities, ShareFlags
 from aiosmb.protocol.smb2.commands.create import CREATE_REQ, CREATE_REPLY, OplockLevel, ImpersonationLevel, OplockLevel, ImpersonationLevel, ShareAccess, CreateDisposition, CreateOptions
+from aiosmb.protocol.smb2.commands.create_contexts import SMB2CreateContextList, SMB2_CREATE_CONTEXT, SMB2CreateContextName, SMB2_CREATE_DURABLE_HANDLE_REQUEST, SMB2_CREATE_DURABLE_HANDLE_RESPONSE, SMB2_CREATE_DURABLE_HANDLE_RECONNECT, SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2, SMB2_CREATE_DURABLE_HANDLE_RESPONSE_V2, SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2, SMB2_CREATE_REQUEST_LEASE, SMB2_CREATE_REQUEST_LEASE_V2
 from aiosmb.protocol.smb2.commands.read import READ_REQ, READ_REPLY, Channel, ReadFlag
 from aiosmb.protocol.smb2.commands.query_info import QUERY_INFO_REPLY, QUERY_INFO_REQ, EaInformation, SecurityInfo, QueryInfoType
 from aiosmb.protocol.smb2.commands.query_directory import QUERY_DIRECTORY_REPLY, QUERY_DIRECTORY_REQ, QueryDirectoryFlag
@@ -13,6 +14,7 @@ from aiosmb.protocol.smb2.commands.cancel import CANCEL_REQ
 from aiosmb.protocol.smb2.commands.logoff import LOGOFF_REQ, LOGOFF_REPLY
 from aiosmb.protocol.smb2.commands.error import ERROR_REPLY
 from aiosmb.protocol.smb2.commands.write import WRITE_REPLY, WRITE_REQ
+from aiosmb.protocol.smb2.commands.oplock_break import OPLOCK_BREAK_REQ, OPLOCK_BREAK_REPLY, OPLOCK_BREAK_NOTIFICATION, LEASE_BREAK_NOTIFICATION, LEASE_BREAK_ACK, LeaseBreakFlag, LeaseState
 
 
 
@@ -23,7 +25,14 @@ __all__ = ['NEGOTIATE_REQ', 'NEGOTIATE_REPLY', 'SESSION_SETUP_REQ','SESSION_SETU
 			'ReadFlag', 'QUERY_INFO_REPLY', 'QUERY_INFO_REQ', 'EaInformation', 'SecurityInfo', 'QueryInfoType',
 			'QUERY_DIRECTORY_REPLY', 'QUERY_DIRECTORY_REQ', 'QueryDirectoryFlag','TREE_DISCONNECT_REQ','TREE_DISCONNECT_REPLY',
 			'CLOSE_REQ','CLOSE_REPLY','FLUSH_REQ','FLUSH_REPLY','ECHO_REQ','ECHO_REPLY','CANCEL_REQ','LOGOFF_REQ',
-			'LOGOFF_REPLY','ERROR_REPLY', 'CloseFlag', 'WRITE_REPLY', 'WRITE_REQ']
+			'LOGOFF_REPLY','ERROR_REPLY', 'CloseFlag', 'WRITE_REPLY', 'WRITE_REQ', 'SMB2NegotiateContext', 'SMB2ContextType',
+			'SMB2PreauthIntegrityCapabilities', 'SMB2HashAlgorithm', 'SMB2EncryptionCapabilities', 'SMB2Cipher', 'SessionFlags',
+			'SMB2SigningCapabilities', 'SMB2SigningAlgorithm', 'OPLOCK_BREAK_REQ', 'OPLOCK_BREAK_REPLY', 'OPLOCK_BREAK_NOTIFICATION',
+			'LEASE_BREAK_NOTIFICATION', 'LEASE_BREAK_ACK', 'LeaseBreakFlag', 'LeaseState', 'SessionSetupFlag',
+			'SMB2CreateContextList', 'SMB2_CREATE_CONTEXT', 'SMB2CreateContextName', 'SMB2_CREATE_DURABLE_HANDLE_REQUEST',
+			'SMB2_CREATE_DURABLE_HANDLE_RESPONSE', 'SMB2_CREATE_DURABLE_HANDLE_RECONNECT', 'SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2',
+			'SMB2_CREATE_DURABLE_HANDLE_RESPONSE_V2', 'SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2', 'SMB2_CREATE_REQUEST_LEASE',
+			'SMB2_CREATE_REQUEST_LEASE_V2']
 			
 			
 			
@@ -1,12 +1,19 @@
 import io
 import enum
+import struct
 
 from aiosmb.fscc.FileAttributes import *
+from aiosmb.protocol.smb2.headers.common import cached_enum
 
 class CloseFlag(enum.IntFlag):
 	NONE = 0
 	SMB2_CLOSE_FLAG_POSTQUERY_ATTRIB = 0x0001 #If set, the server MUST set the attribute fields in the response, as specified in section 2.2.16, to valid values. If not set, the client MUST NOT use the values that are returned in the response.
 
+# StructureSize, Flags, Reserved, FileId (low, high)
+CLOSE_REQ_STRUCT = struct.Struct('<HHIQQ')
+# StructureSize, Flags, Reserved, CreationTime, LastAccessTime, LastWriteTime, ChangeTime, AllocationSize, EndofFile, FileAttributes
+CLOSE_REPLY_STRUCT = struct.Struct('<HHIQQQQQQI')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/f84053b0-bcb2-4f85-9717-536dae2b02bd
 class CLOSE_REQ:
 	def __init__(self):
@@ -16,11 +23,7 @@ class CLOSE_REQ:
 		self.FileId = None
 		
 	def to_bytes(self):
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.Flags.value.to_bytes(2, byteorder='little', signed = False)
-		t += self.Reserved.to_bytes(4, byteorder='little', signed = False)
-		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
-		return t
+		return CLOSE_REQ_STRUCT.pack(self.StructureSize, self.Flags, self.Reserved, self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64)
 
 	@staticmethod
 	def from_bytes(bbuff):
@@ -59,17 +62,10 @@ class CLOSE_REPLY:
 		self.FileAttributes = None
 		
 	def to_bytes(self):
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.Flags.value.to_bytes(2, byteorder='little', signed = False)
-		t += self.Reserved.to_bytes(4, byteorder='little', signed = False)
-		t += self.CreationTime.to_bytes(8, byteorder='little', signed = False)
-		t += self.LastAccessTime.to_bytes(8, byteorder='little', signed = False)
-		t += self.LastWriteTime.to_bytes(8, byteorder='little', signed = False)
-		t += self.ChangeTime.to_bytes(8, byteorder='little', signed = False)
-		t += self.AllocationSize.to_bytes(8, byteorder='little', signed = False)
-		t += self.EndofFile.to_bytes(8, byteorder='little', signed = False)
-		t += self.FileAttributes.to_bytes(4, byteorder='little', signed = False)
-		return t
+		return CLOSE_REPLY_STRUCT.pack(
+			self.StructureSize, self.Flags, self.Reserved, self.CreationTime, self.LastAccessTime, self.LastWriteTime,
+			self.ChangeTime, self.AllocationSize, self.EndofFile, self.FileAttributes
+		)
 
 	@staticmethod
 	def from_bytes(bbuff):
@@ -77,18 +73,16 @@ class CLOSE_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		return CLOSE_REPLY.from_view(memoryview(buff.read(CLOSE_REPLY_STRUCT.size)), 0)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = CLOSE_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, flags, msg.Reserved, msg.CreationTime, msg.LastAccessTime, msg.LastWriteTime, \
+			msg.ChangeTime, msg.AllocationSize, msg.EndofFile, attributes = CLOSE_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 60
-		msg.Flags  = CloseFlag(int.from_bytes(buff.read(2), byteorder='little'))
-		msg.Reserved  = int.from_bytes(buff.read(4), byteorder='little')
-		msg.CreationTime  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.LastAccessTime  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.LastWriteTime  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.ChangeTime  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.AllocationSize  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.EndofFile  = int.from_bytes(buff.read(8), byteorder='little')
-		msg.FileAttributes  = FileAttributes(int.from_bytes(buff.read(4), byteorder='little'))
+		msg.Flags  = cached_enum(CloseFlag, flags)
+		msg.FileAttributes  = cached_enum(FileAttributes, attributes)
 		return msg
 
 	def __repr__(self):
@@ -1,7 +1,11 @@
 import io
 import enum
+import struct
 
 from aiosmb.fscc.FileAttributes import FileAttributes
+from aiosmb.commons.access_mask import FileAccessMask
+from aiosmb.protocol.smb2.headers.common import cached_enum
+from aiosmb.protocol.smb2.commands.create_contexts import SMB2CreateContextList
 
 class OplockLevel(enum.Enum):
 	SMB2_OPLOCK_LEVEL_NONE = 0x00 #No oplock is requested.
@@ -59,6 +63,13 @@ class CreateAction(enum.Enum):
 	FILE_CREATED = 0x00000002 #A new file was created.
 	FILE_OVERWRITTEN = 0x00000003
 
+# StructureSize, SecurityFlags, RequestedOplockLevel, ImpersonationLevel, SmbCreateFlags, Reserved, DesiredAccess, FileAttributes,
+# ShareAccess, CreateDisposition, CreateOptions, NameOffset, NameLength, CreateContextsOffset, CreateContextsLength
+CREATE_REQ_STRUCT = struct.Struct('<HBBIQQIIIIIHHII')
+# StructureSize, OplockLevel, Flags, CreateAction, CreationTime, LastAccessTime, LastWriteTime, ChangeTime, AllocationSize, EndofFile,
+# FileAttributes, Reserved2, FileId (low, high), CreateContextsOffset, CreateContextsLength
+CREATE_REPLY_STRUCT = struct.Struct('<HBBIQQQQQQIIQQII')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/e8fb45c1-a03d-44ca-b7ae-47385cfd7997
 class CREATE_REQ:
 	def __init__(self):
@@ -82,7 +93,7 @@ class CREATE_REQ:
 		
 		#high-level
 		self.Name = None
-		self.CreateContext = None
+		self.CreateContext = None #SMB2CreateContextList
 
 	def to_bytes(self):
 		if self.Name is not None:
@@ -95,7 +106,7 @@ class CREATE_REQ:
 			t_ctx = self.CreateContext.to_bytes()
 			self.CreateContextsLength = len(t_ctx)
 			
-			pos = curself.NameOffset + self.NameLength
+			pos = self.NameOffset + self.NameLength
 			t_m = pos % 8
 			if t_m != 0:
 				pad = b'\x00' * (8 - t_m)
@@ -107,21 +118,12 @@ class CREATE_REQ:
 				self.CreateContextsOffset = pos
 			
 		
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.SecurityFlags.to_bytes(1, byteorder='little', signed = False)
-		t += self.RequestedOplockLevel.value.to_bytes(1, byteorder='little', signed = False)
-		t += self.ImpersonationLevel.value.to_bytes(4, byteorder='little', signed = False)
-		t += self.SmbCreateFlags.to_bytes(8, byteorder='little', signed = False)
-		t += self.Reserved.to_bytes(8, byteorder='little', signed = False)
-		t += self.DesiredAccess.to_bytes(4, byteorder='little', signed = False)
-		t += self.FileAttributes.to_bytes(4, byteorder='little', signed = False)
-		t += self.ShareAccess.to_bytes(4, byteorder='little', signed = False)
-		t += self.CreateDisposition.value.to_bytes(4, byteorder='little', signed = False)
-		t += self.CreateOptions.to_bytes(4, byteorder='little', signed = False)
-		t += self.NameOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.NameLength.to_bytes(2, byteorder='little', signed = False)
-		t += self.CreateContextsOffset.to_bytes(4, byteorder='little', signed = False)
-		t += self.CreateContextsLength.to_bytes(4, byteorder='little', signed = False)
+		t = CREATE_REQ_STRUCT.pack(
+			self.StructureSize, self.SecurityFlags, self.RequestedOplockLevel.value, self.ImpersonationLevel.value,
+			self.SmbCreateFlags, self.Reserved, self.DesiredAccess, self.FileAttributes, self.ShareAccess,
+			self.CreateDisposition.value, self.CreateOptions, self.NameOffset, self.NameLength,
+			self.CreateContextsOffset, self.CreateContextsLength
+		)
 		t += self.Buffer
 		t += b'\x00'
 		return t
@@ -158,7 +160,7 @@ class CREATE_REQ:
 		if msg.CreateContextsLength > 0:
 			buff.seek(msg.CreateContextsOffset, io.SEEK_SET)
 			t = buff.read(msg.CreateContextsLength)
-			msg.CreateContext = t #ADDITIONAL PARSING NEEDED BUT NOT YET IMPLEMENTED!!!! See: https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/75364667-3a93-4e2c-b771-592d8d5e876d
+			msg.CreateContext = SMB2CreateContextList.from_bytes(t, is_reply = False)
 		
 		return msg
 
@@ -199,7 +201,7 @@ class CREATE_REPLY:
 		self.Buffer = b''
 		
 		#high-level
-		self.CreateContext = None
+		self.CreateContext = None #SMB2CreateContextList
 
 	def to_bytes(self):
 		# TODO	
@@ -212,29 +214,25 @@ class CREATE_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		pos = buff.tell()
+		buff.seek(0, io.SEEK_SET)
+		return CREATE_REPLY.from_view(memoryview(buff.read()), pos)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = CREATE_REPLY()
-		msg.StructureSize = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, oplock_level, flags, create_action, msg.CreationTime, msg.LastAccessTime, msg.LastWriteTime, \
+			msg.ChangeTime, msg.AllocationSize, msg.EndofFile, attributes, msg.Reserved2, file_id_low, file_id_high, \
+			msg.CreateContextsOffset, msg.CreateContextsLength = CREATE_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 89
-		msg.OplockLevel  = OplockLevel(int.from_bytes(buff.read(1), byteorder='little'))
-		msg.Flags  = CreateOptions(int.from_bytes(buff.read(1), byteorder='little'))
-		msg.CreateAction  = CreateAction(int.from_bytes(buff.read(4), byteorder = 'little'))
-		
-		msg.CreationTime  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.LastAccessTime  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.LastWriteTime  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.ChangeTime  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.AllocationSize  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.EndofFile  = int.from_bytes(buff.read(8), byteorder = 'little')
-		msg.FileAttributes   = FileAttributes(int.from_bytes(buff.read(4), byteorder = 'little'))
-		msg.Reserved2  = int.from_bytes(buff.read(4), byteorder = 'little') #first 8-byte aligned  !!!!!!
-		msg.FileId  = int.from_bytes(buff.read(16), byteorder = 'little')
-		msg.CreateContextsOffset = int.from_bytes(buff.read(4), byteorder = 'little') #first 8-byte aligned  !!!!!!
-		msg.CreateContextsLength = int.from_bytes(buff.read(4), byteorder = 'little')
+		msg.OplockLevel  = cached_enum(OplockLevel, oplock_level)
+		msg.Flags  = cached_enum(CreateOptions, flags)
+		msg.CreateAction  = cached_enum(CreateAction, create_action)
+		msg.FileAttributes   = cached_enum(FileAttributes, attributes)
+		msg.FileId  = file_id_low | (file_id_high << 64)
 		
 		if msg.CreateContextsLength > 0:
-			buff.seek(msg.CreateContextsOffset, io.SEEK_SET)
-			t = buff.read(msg.CreateContextsLength)
-			msg.CreateContext = t #ADDITIONAL PARSING NEEDED BUT NOT YET IMPLEMENTED!!!! See: https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/75364667-3a93-4e2c-b771-592d8d5e876d
+			msg.CreateContext = SMB2CreateContextList.from_view(view, msg.CreateContextsOffset, msg.CreateContextsLength)
 		
 		return msg
 
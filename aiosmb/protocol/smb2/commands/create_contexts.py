@@ -0,0 +1,315 @@
+import struct
+
+from aiosmb.dtyp.constrcuted_security.guid import GUID
+
+class SMB2CreateContextName:
+	DURABLE_HANDLE_REQUEST = b'DHnQ'
+	DURABLE_HANDLE_RECONNECT = b'DHnC'
+	DURABLE_HANDLE_REQUEST_V2 = b'DH2Q'
+	DURABLE_HANDLE_RECONNECT_V2 = b'DH2C'
+	QUERY_MAXIMAL_ACCESS_REQUEST = b'MxAc'
+	QUERY_ON_DISK_ID = b'QFid'
+	REQUEST_LEASE = b'RqLs'
+
+# Next, NameOffset, NameLength, Reserved, DataOffset, DataLength
+SMB2_CREATE_CONTEXT_STRUCT = struct.Struct('<IHHHHI')
+
+# MS-SMB2 2.2.13.2.3
+class SMB2_CREATE_DURABLE_HANDLE_REQUEST:
+	def __init__(self):
+		self.DurableRequest = b'\x00' * 16
+
+	def to_bytes(self):
+		return self.DurableRequest
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_REQUEST()
+		msg.DurableRequest = bytes(bbuff[:16])
+		return msg
+
+	def __repr__(self):
+		return '==== SMB2 CREATE DURABLE HANDLE REQUEST ====\r\n'
+
+# MS-SMB2 2.2.14.2.3
+class SMB2_CREATE_DURABLE_HANDLE_RESPONSE:
+	def __init__(self):
+		self.Reserved = 0
+
+	def to_bytes(self):
+		return self.Reserved.to_bytes(8, byteorder = 'little', signed = False)
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_RESPONSE()
+		msg.Reserved = int.from_bytes(bbuff[:8], byteorder = 'little', signed = False)
+		return msg
+
+	def __repr__(self):
+		return '==== SMB2 CREATE DURABLE HANDLE RESPONSE ====\r\n'
+
+# MS-SMB2 2.2.13.2.4
+class SMB2_CREATE_DURABLE_HANDLE_RECONNECT:
+	def __init__(self):
+		self.FileId = None
+
+	def to_bytes(self):
+		return self.FileId.to_bytes(16, byteorder = 'little', signed = False)
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_RECONNECT()
+		msg.FileId = int.from_bytes(bbuff[:16], byteorder = 'little', signed = False)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE DURABLE HANDLE RECONNECT ====\r\n'
+		t += 'FileId: %s\r\n' % self.FileId
+		return t
+
+# Timeout, Flags, Reserved, CreateGuid
+SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2_STRUCT = struct.Struct('<IIQ16s')
+
+# MS-SMB2 2.2.13.2.11
+class SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2:
+	def __init__(self):
+		self.Timeout = 0 #milliseconds, 0 lets the server choose
+		self.Flags = 0 #SMB2_DHANDLE_FLAG_PERSISTENT
+		self.Reserved = 0
+		self.CreateGuid = None
+
+	def to_bytes(self):
+		return SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2_STRUCT.pack(self.Timeout, self.Flags, self.Reserved, self.CreateGuid.to_bytes())
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2()
+		msg.Timeout, msg.Flags, msg.Reserved, guid = SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2_STRUCT.unpack_from(bbuff, 0)
+		msg.CreateGuid = GUID.from_bytes(guid)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE DURABLE HANDLE REQUEST V2 ====\r\n'
+		t += 'Timeout: %s\r\n' % self.Timeout
+		t += 'Flags: %s\r\n' % self.Flags
+		t += 'CreateGuid: %s\r\n' % self.CreateGuid
+		return t
+
+# MS-SMB2 2.2.14.2.12
+class SMB2_CREATE_DURABLE_HANDLE_RESPONSE_V2:
+	def __init__(self):
+		self.Timeout = 0
+		self.Flags = 0
+
+	def to_bytes(self):
+		t  = self.Timeout.to_bytes(4, byteorder = 'little', signed = False)
+		t += self.Flags.to_bytes(4, byteorder = 'little', signed = False)
+		return t
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_RESPONSE_V2()
+		msg.Timeout = int.from_bytes(bbuff[:4], byteorder = 'little', signed = False)
+		msg.Flags = int.from_bytes(bbuff[4:8], byteorder = 'little', signed = False)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE DURABLE HANDLE RESPONSE V2 ====\r\n'
+		t += 'Timeout: %s\r\n' % self.Timeout
+		t += 'Flags: %s\r\n' % self.Flags
+		return t
+
+# FileId (low, high), CreateGuid, Flags
+SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2_STRUCT = struct.Struct('<QQ16sI')
+
+# MS-SMB2 2.2.13.2.12
+class SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2:
+	def __init__(self):
+		self.FileId = None
+		self.CreateGuid = None
+		self.Flags = 0
+
+	def to_bytes(self):
+		return SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2_STRUCT.pack(
+			self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64, self.CreateGuid.to_bytes(), self.Flags
+		)
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2()
+		file_id_low, file_id_high, guid, msg.Flags = SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2_STRUCT.unpack_from(bbuff, 0)
+		msg.FileId = file_id_low | (file_id_high << 64)
+		msg.CreateGuid = GUID.from_bytes(guid)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE DURABLE HANDLE RECONNECT V2 ====\r\n'
+		t += 'FileId: %s\r\n' % self.FileId
+		t += 'CreateGuid: %s\r\n' % self.CreateGuid
+		return t
+
+# LeaseKey, LeaseState, LeaseFlags, LeaseDuration
+SMB2_CREATE_REQUEST_LEASE_STRUCT = struct.Struct('<16sIIQ')
+
+# MS-SMB2 2.2.13.2.8, the response (2.2.14.2.10) has the same layout
+class SMB2_CREATE_REQUEST_LEASE:
+	def __init__(self):
+		self.LeaseKey = None #16 bytes, chosen by the client, the same key must be used for every open of the same file
+		self.LeaseState = 0 #LeaseState flags
+		self.LeaseFlags = 0
+		self.LeaseDuration = 0
+
+	def to_bytes(self):
+		return SMB2_CREATE_REQUEST_LEASE_STRUCT.pack(self.LeaseKey, int(self.LeaseState), self.LeaseFlags, self.LeaseDuration)
+
+	@staticmethod
+	def from_bytes(bbuff):
+		#the v2 structure starts the same way, the data length tells them apart
+		if len(bbuff) >= SMB2_CREATE_REQUEST_LEASE_V2_STRUCT.size:
+			return SMB2_CREATE_REQUEST_LEASE_V2.from_bytes(bbuff)
+		msg = SMB2_CREATE_REQUEST_LEASE()
+		msg.LeaseKey, msg.LeaseState, msg.LeaseFlags, msg.LeaseDuration = SMB2_CREATE_REQUEST_LEASE_STRUCT.unpack_from(bbuff, 0)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE REQUEST LEASE ====\r\n'
+		t += 'LeaseKey: %s\r\n' % self.LeaseKey.hex()
+		t += 'LeaseState: %s\r\n' % self.LeaseState
+		t += 'LeaseFlags: %s\r\n' % self.LeaseFlags
+		return t
+
+# LeaseKey, LeaseState, Flags, LeaseDuration, ParentLeaseKey, Epoch, Reserved
+SMB2_CREATE_REQUEST_LEASE_V2_STRUCT = struct.Struct('<16sIIQ16sHH')
+
+# MS-SMB2 2.2.13.2.10, the response (2.2.14.2.11) has the same layout
+class SMB2_CREATE_REQUEST_LEASE_V2:
+	def __init__(self):
+		self.LeaseKey = None
+		self.LeaseState = 0
+		self.LeaseFlags = 0 #SMB2_LEASE_FLAG_PARENT_LEASE_KEY_SET
+		self.LeaseDuration = 0
+		self.ParentLeaseKey = b'\x00' * 16
+		self.Epoch = 0
+		self.Reserved = 0
+
+	def to_bytes(self):
+		return SMB2_CREATE_REQUEST_LEASE_V2_STRUCT.pack(
+			self.LeaseKey, int(self.LeaseState), self.LeaseFlags, self.LeaseDuration, self.ParentLeaseKey, self.Epoch, self.Reserved
+		)
+
+	@staticmethod
+	def from_bytes(bbuff):
+		msg = SMB2_CREATE_REQUEST_LEASE_V2()
+		msg.LeaseKey, msg.LeaseState, msg.LeaseFlags, msg.LeaseDuration, msg.ParentLeaseKey, msg.Epoch, msg.Reserved = SMB2_CREATE_REQUEST_LEASE_V2_STRUCT.unpack_from(bbuff, 0)
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE REQUEST LEASE V2 ====\r\n'
+		t += 'LeaseKey: %s\r\n' % self.LeaseKey.hex()
+		t += 'LeaseState: %s\r\n' % self.LeaseState
+		t += 'LeaseFlags: %s\r\n' % self.LeaseFlags
+		t += 'Epoch: %s\r\n' % self.Epoch
+		return t
+
+# context name -> data class, the same name is used in both directions with different structures
+CREATE_CONTEXT_REQ_TYPES = {
+	SMB2CreateContextName.DURABLE_HANDLE_REQUEST : SMB2_CREATE_DURABLE_HANDLE_REQUEST,
+	SMB2CreateContextName.DURABLE_HANDLE_RECONNECT : SMB2_CREATE_DURABLE_HANDLE_RECONNECT,
+	SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2 : SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2,
+	SMB2CreateContextName.DURABLE_HANDLE_RECONNECT_V2 : SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2,
+	SMB2CreateContextName.REQUEST_LEASE : SMB2_CREATE_REQUEST_LEASE,
+}
+
+CREATE_CONTEXT_REPLY_TYPES = {
+	SMB2CreateContextName.DURABLE_HANDLE_REQUEST : SMB2_CREATE_DURABLE_HANDLE_RESPONSE,
+	SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2 : SMB2_CREATE_DURABLE_HANDLE_RESPONSE_V2,
+	SMB2CreateContextName.REQUEST_LEASE : SMB2_CREATE_REQUEST_LEASE,
+}
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/75364667-3a93-4e2c-b771-592d8d5e876d
+class SMB2_CREATE_CONTEXT:
+	def __init__(self, name = None, data = None):
+		self.Next = 0
+		self.NameOffset = 16
+		self.NameLength = 0
+		self.Reserved = 0
+		self.DataOffset = 0
+		self.DataLength = 0
+		self.Name = name #bytes
+		self.Data = data #one of the context structures above, or raw bytes for unknown contexts
+
+	def to_bytes(self):
+		data = self.Data.to_bytes() if hasattr(self.Data, 'to_bytes') else bytes(self.Data or b'')
+		self.NameLength = len(self.Name)
+		self.DataLength = len(data)
+		name_end = self.NameOffset + self.NameLength
+		pad = b''
+		self.DataOffset = 0
+		if self.DataLength > 0:
+			#data is 8 byte aligned
+			pad = b'\x00' * ((8 - name_end % 8) % 8)
+			self.DataOffset = name_end + len(pad)
+		t = SMB2_CREATE_CONTEXT_STRUCT.pack(self.Next, self.NameOffset, self.NameLength, self.Reserved, self.DataOffset, self.DataLength)
+		t += self.Name + pad + data
+		return t
+
+	@staticmethod
+	def from_view(view, offset, is_reply = True):
+		ctx = SMB2_CREATE_CONTEXT()
+		ctx.Next, ctx.NameOffset, ctx.NameLength, ctx.Reserved, ctx.DataOffset, ctx.DataLength = SMB2_CREATE_CONTEXT_STRUCT.unpack_from(view, offset)
+		ctx.Name = bytes(view[offset+ctx.NameOffset:offset+ctx.NameOffset+ctx.NameLength])
+		data = bytes(view[offset+ctx.DataOffset:offset+ctx.DataOffset+ctx.DataLength])
+		types = CREATE_CONTEXT_REPLY_TYPES if is_reply is True else CREATE_CONTEXT_REQ_TYPES
+		if ctx.Name in types:
+			ctx.Data = types[ctx.Name].from_bytes(data)
+		else:
+			ctx.Data = data
+		return ctx
+
+	def __repr__(self):
+		t = '==== SMB2 CREATE CONTEXT ====\r\n'
+		t += 'Name: %s\r\n' % self.Name
+		t += 'Data: %s\r\n' % self.Data
+		return t
+
+class SMB2CreateContextList(list):
+	"""
+	The chain of create contexts of a CREATE request or reply
+	"""
+	def to_bytes(self):
+		t = b''
+		for i, ctx in enumerate(self):
+			ctx.Next = 0
+			data = ctx.to_bytes()
+			if i < len(self) - 1:
+				#every context but the last one is padded to 8 bytes, Next points to the following one
+				data += b'\x00' * ((8 - len(data) % 8) % 8)
+				ctx.Next = len(data)
+				data = ctx.Next.to_bytes(4, byteorder = 'little', signed = False) + data[4:]
+			t += data
+		return t
+
+	@staticmethod
+	def from_bytes(bbuff, is_reply = True):
+		return SMB2CreateContextList.from_view(memoryview(bbuff), 0, len(bbuff), is_reply)
+
+	@staticmethod
+	def from_view(view, offset, length, is_reply = True):
+		contexts = SMB2CreateContextList()
+		end = offset + length
+		while offset < end:
+			ctx = SMB2_CREATE_CONTEXT.from_view(view, offset, is_reply)
+			contexts.append(ctx)
+			if ctx.Next == 0:
+				break
+			offset += ctx.Next
+		return contexts
+
+	def get(self, name):
+		"""
+		Returns the context with the given name or None
+		"""
+		for ctx in self:
+			if ctx.Name == name:
+				return ctx
+		return None
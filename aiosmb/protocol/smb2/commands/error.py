@@ -1,5 +1,9 @@
 import io
 import enum
+import struct
+
+# StructureSize, ErrorContextCount, Reserved, ByteCount
+ERROR_REPLY_STRUCT = struct.Struct('<HBBI')
 
 # TODO: additional parsing for the error context!
 
@@ -28,14 +32,18 @@ class ERROR_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		pos = buff.tell()
+		buff.seek(0, io.SEEK_SET)
+		return ERROR_REPLY.from_view(memoryview(buff.read()), pos)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = ERROR_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, msg.ErrorContextCount, msg.Reserved, msg.ByteCount = ERROR_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 9
-		msg.ErrorContextCount  = int.from_bytes(buff.read(1), byteorder='little')
-		msg.Reserved  = int.from_bytes(buff.read(1), byteorder='little')
-		msg.ByteCount  = int.from_bytes(buff.read(4), byteorder='little')
 		if msg.ByteCount > 0:
-			msg.ErrorData = buff.read(msg.ByteCount)
+			pos = offset + ERROR_REPLY_STRUCT.size
+			msg.ErrorData = bytes(view[pos:pos+msg.ByteCount])
 		return msg
 
 	def __repr__(self):
@@ -50,20 +50,31 @@ class NEGOTIATE_REQ:
 		t += self.Capabilities.to_bytes(4, byteorder='little', signed = False)
 		t += self.ClientGuid.to_bytes()
 		
+		if self.Dialects == []:
+			raise Exception('At least one dialect MUST be set!')
+		
 		if NegotiateDialects.SMB311 in self.Dialects:
-			raise Exception('NOT IMLEMENTED!!! :(')
+			#the context list starts on the first 8 byte aligned offset after the dialects (offset is counted from the SMB2 header)
+			dialects_end = 64 + self.StructureSize + 2*len(self.Dialects)
+			self.NegotiateContextOffset = (dialects_end + 7) & ~7
+			self.NegotiateContextCount = len(self.NegotiateContextList)
 			t += self.NegotiateContextOffset.to_bytes(4, byteorder='little', signed = False)
-			t += len(self.NegotiateContextCount).to_bytes(2, byteorder='little', signed = False)
-			
+			t += self.NegotiateContextCount.to_bytes(2, byteorder='little', signed = False)
+			t += self.Reserved2.to_bytes(2, byteorder='little', signed = False)
 			
 		else:
 			t += self.ClientStartTime.to_bytes(8, byteorder='little', signed = False)
 			
-		if self.Dialects == []:
-			raise Exception('At least one dialect MUST be set!')
 		for dialect in self.Dialects:
 			t += dialect.value.to_bytes(2, byteorder='little', signed = False)
 		
+		if NegotiateDialects.SMB311 in self.Dialects:
+			t += b'\x00' * (self.NegotiateContextOffset - 64 - len(t))
+			for i, ctx in enumerate(self.NegotiateContextList):
+				t += ctx.to_bytes()
+				if i < len(self.NegotiateContextList) - 1:
+					t += b'\x00' * (((len(t) + 7) & ~7) - len(t))
+		
 		return t
 
 	@staticmethod
@@ -134,6 +145,11 @@ class NEGOTIATE_REQ:
 class SMB2ContextType(enum.Enum):
 	SMB2_PREAUTH_INTEGRITY_CAPABILITIES = 0x0001
 	SMB2_ENCRYPTION_CAPABILITIES = 0x0002
+	SMB2_COMPRESSION_CAPABILITIES = 0x0003
+	SMB2_NETNAME_NEGOTIATE_CONTEXT_ID = 0x0005
+	SMB2_TRANSPORT_CAPABILITIES = 0x0006
+	SMB2_RDMA_TRANSFORM_CAPABILITIES = 0x0007
+	SMB2_SIGNING_CAPABILITIES = 0x0008
 
 
 class SMB2HashAlgorithm(enum.Enum):
@@ -142,37 +158,60 @@ class SMB2HashAlgorithm(enum.Enum):
 
 # https://msdn.microsoft.com/en-us/library/mt208834.aspx
 class SMB2NegotiateContext:
-	def __init__(self):
-		self.ContextType = None
+	def __init__(self, context_type = None, data = None):
+		self.ContextType = context_type
 		self.DataLength  = None
-		self.Reserved    = None
-		self.Data        = None
+		self.Reserved    = 0
+		self.Data        = data
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return SMB2NegotiateContext.from_buffer(io.BytesIO(bbuff))
 
 	@staticmethod
 	def from_buffer(buff):
 		ctx = SMB2NegotiateContext()
-		ctx.ContextType = SMB2ContextType(int.from_bytes(buff.read(2), byteorder = 'little', signed = False))
+		context_type = int.from_bytes(buff.read(2), byteorder = 'little', signed = False)
 		ctx.DataLength  = int.from_bytes(buff.read(2), byteorder = 'little', signed = False)
-		ctx.Reserved    = buff.read(4)
+		ctx.Reserved    = int.from_bytes(buff.read(4), byteorder = 'little', signed = False)
+		data = buff.read(ctx.DataLength)
+		
+		try:
+			ctx.ContextType = SMB2ContextType(context_type)
+		except ValueError:
+			#unknown context, keeping the raw data
+			ctx.ContextType = context_type
+			ctx.Data = data
+			return ctx
 
 		if ctx.ContextType == SMB2ContextType.SMB2_PREAUTH_INTEGRITY_CAPABILITIES:
-			ctx.Data = SMB2PreauthIntegrityCapabilities.from_buffer(buff)
+			ctx.Data = SMB2PreauthIntegrityCapabilities.from_bytes(data)
 
 		elif ctx.ContextType == SMB2ContextType.SMB2_ENCRYPTION_CAPABILITIES:
-			ctx.Data = SMB2EncryptionCapabilities.from_buffer(buff)
+			ctx.Data = SMB2EncryptionCapabilities.from_bytes(data)
+
+		elif ctx.ContextType == SMB2ContextType.SMB2_SIGNING_CAPABILITIES:
+			ctx.Data = SMB2SigningCapabilities.from_bytes(data)
+		
+		else:
+			ctx.Data = data
 
 		return ctx
 
 	def to_bytes(self):
-		t  = self.ContextType.to_bytes(2, byteorder = 'little', signed=False)
+		data = self.Data if isinstance(self.Data, bytes) else self.Data.to_bytes()
+		self.DataLength = len(data)
+		
+		t  = self.ContextType.value.to_bytes(2, byteorder = 'little', signed=False)
 		t += self.DataLength.to_bytes(2, byteorder = 'little', signed=False)
 		t += self.Reserved.to_bytes(4, byteorder = 'little', signed=False)
+		t += data
 
 		return t
 
 	def __repr__(self):
 		t = '==== SMB2 Negotiate Context ====\r\n'
-		t += 'ConextType: %s\r\n' % self.ContextType.name
+		t += 'ConextType: %s\r\n' % (self.ContextType.name if isinstance(self.ContextType, SMB2ContextType) else self.ContextType)
 		t += 'DataLength: %s\r\n' % self.DataLength
 		t += 'Data: %s\r\n' % repr(self.Data)
 
@@ -186,6 +225,10 @@ class SMB2PreauthIntegrityCapabilities:
 		self.HashAlgorithms     = None
 		self.Salt               = None
 
+	@staticmethod
+	def from_bytes(bbuff):
+		return SMB2PreauthIntegrityCapabilities.from_buffer(io.BytesIO(bbuff))
+
 	@staticmethod
 	def from_buffer(buff):
 		cap = SMB2PreauthIntegrityCapabilities()
@@ -200,10 +243,12 @@ class SMB2PreauthIntegrityCapabilities:
 		return cap
 
 	def to_bytes(self):
+		self.HashAlgorithmCount = len(self.HashAlgorithms)
+		self.SaltLength = len(self.Salt)
 		t  = self.HashAlgorithmCount.to_bytes(2, byteorder = 'little', signed=False)
 		t += self.SaltLength.to_bytes(2, byteorder = 'little', signed=False)
 		for hashalgo in self.HashAlgorithms:
-			t += hashalgo.to_bytes(2, byteorder = 'little', signed=False)
+			t += hashalgo.value.to_bytes(2, byteorder = 'little', signed=False)
 		
 		t += self.Salt
 
@@ -231,6 +276,10 @@ class SMB2EncryptionCapabilities:
 		self.CipherCount = None
 		self.Ciphers = None
 
+	@staticmethod
+	def from_bytes(bbuff):
+		return SMB2EncryptionCapabilities.from_buffer(io.BytesIO(bbuff))
+
 	@staticmethod
 	def from_buffer(buff):
 		cap = SMB2EncryptionCapabilities()
@@ -243,9 +292,10 @@ class SMB2EncryptionCapabilities:
 		return cap
 
 	def to_bytes(self):
+		self.CipherCount = len(self.Ciphers)
 		t  = self.CipherCount.to_bytes(2, byteorder = 'little', signed=False)
 		for cipher in self.Ciphers:
-			t += cipher.to_bytes(2, byteorder = 'little', signed=False)
+			t += cipher.value.to_bytes(2, byteorder = 'little', signed=False)
 
 		return t
 			
@@ -259,6 +309,50 @@ class SMB2EncryptionCapabilities:
 		return t
 
 
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/cb9b5d66-b6be-4d18-aa66-8784a871cc10
+class SMB2SigningAlgorithm(enum.Enum):
+	HMAC_SHA256 = 0x0000
+	AES_CMAC = 0x0001
+	AES_GMAC = 0x0002
+
+
+class SMB2SigningCapabilities:
+	def __init__(self):
+		self.SigningAlgorithmCount = None
+		self.SigningAlgorithms = None
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return SMB2SigningCapabilities.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		cap = SMB2SigningCapabilities()
+		cap.SigningAlgorithmCount = int.from_bytes(buff.read(2), byteorder='little', signed = False)
+		cap.SigningAlgorithms = []
+
+		for i in range(cap.SigningAlgorithmCount):
+			cap.SigningAlgorithms.append(SMB2SigningAlgorithm(int.from_bytes(buff.read(2), byteorder='little', signed = False)))
+
+		return cap
+
+	def to_bytes(self):
+		self.SigningAlgorithmCount = len(self.SigningAlgorithms)
+		t  = self.SigningAlgorithmCount.to_bytes(2, byteorder = 'little', signed=False)
+		for algo in self.SigningAlgorithms:
+			t += algo.value.to_bytes(2, byteorder = 'little', signed=False)
+
+		return t
+
+	def __repr__(self):
+		t = '==== SMB2 Signing Capabilities ====\r\n'
+		t += 'SigningAlgorithmCount: %s\r\n' % self.SigningAlgorithmCount
+		for algo in self.SigningAlgorithms:
+			t += 'SigningAlgorithm: %s\r\n' % algo.name
+
+		return t
+
+
 # https://msdn.microsoft.com/en-us/library/cc246561.aspx
 class NEGOTIATE_REPLY:
 	def __init__(self):
@@ -315,6 +409,11 @@ class NEGOTIATE_REPLY:
 			buff.seek(msg.NegotiateContextOffset, io.SEEK_SET)
 			for i in range(msg.NegotiateContextCount):
 				msg.NegotiateContextList.append(SMB2NegotiateContext.from_buffer(buff))
+				#contexts are 8 byte aligned
+				pad_pos = buff.tell()
+				q,m = divmod(pad_pos, 8)
+				if m != 0:
+					buff.seek((q+1)*8, io.SEEK_SET)
 
 		return msg
 
@@ -0,0 +1,177 @@
+import io
+import enum
+
+from aiosmb.protocol.smb2.commands.create import OplockLevel
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/9abe6f73-f32f-4a23-998d-ee9da2b90e2e
+class LeaseBreakFlag(enum.IntFlag):
+	NONE = 0
+	SMB2_NOTIFY_BREAK_LEASE_FLAG_ACK_REQUIRED = 0x01 #The client MUST send an acknowledgment in response to this message.
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/3fe4e5c9-4d76-4e66-9bba-d5e9ae4a3a72
+class LeaseState(enum.IntFlag):
+	SMB2_LEASE_NONE = 0x00
+	SMB2_LEASE_READ_CACHING = 0x01
+	SMB2_LEASE_HANDLE_CACHING = 0x02
+	SMB2_LEASE_WRITE_CACHING = 0x04
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/dc2ab2ec-6fab-4ddb-ba5d-3e2dd2a7fc9f
+# Notification, acknowledgment and response all share this layout
+class OPLOCK_BREAK_NOTIFICATION:
+	def __init__(self):
+		self.StructureSize = 24
+		self.OplockLevel = None
+		self.Reserved = 0
+		self.Reserved2 = 0
+		self.FileId = None
+
+	def to_bytes(self):
+		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
+		t += self.OplockLevel.value.to_bytes(1, byteorder='little', signed = False)
+		t += self.Reserved.to_bytes(1, byteorder='little', signed = False)
+		t += self.Reserved2.to_bytes(4, byteorder='little', signed = False)
+		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
+		return t
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return OPLOCK_BREAK_NOTIFICATION.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		msg = OPLOCK_BREAK_NOTIFICATION()
+		msg.StructureSize = int.from_bytes(buff.read(2), byteorder='little')
+		assert msg.StructureSize == 24
+		msg.OplockLevel = OplockLevel(int.from_bytes(buff.read(1), byteorder='little'))
+		msg.Reserved = int.from_bytes(buff.read(1), byteorder='little')
+		msg.Reserved2 = int.from_bytes(buff.read(4), byteorder='little')
+		msg.FileId = int.from_bytes(buff.read(16), byteorder='little')
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 OPLOCK BREAK ====\r\n'
+		t += 'StructureSize: %s\r\n' % self.StructureSize
+		t += 'OplockLevel: %s\r\n' % self.OplockLevel
+		t += 'FileId: %s\r\n' % self.FileId
+		return t
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/4f35351a-67b3-4d5c-bb50-4a6cb6ff4e3c
+class LEASE_BREAK_NOTIFICATION:
+	def __init__(self):
+		self.StructureSize = 44
+		self.NewEpoch = 0
+		self.Flags = LeaseBreakFlag.NONE
+		self.LeaseKey = None
+		self.CurrentLeaseState = None
+		self.NewLeaseState = None
+		self.BreakReason = 0
+		self.AccessMaskHint = 0
+		self.ShareMaskHint = 0
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return LEASE_BREAK_NOTIFICATION.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		msg = LEASE_BREAK_NOTIFICATION()
+		msg.StructureSize = int.from_bytes(buff.read(2), byteorder='little')
+		assert msg.StructureSize == 44
+		msg.NewEpoch = int.from_bytes(buff.read(2), byteorder='little')
+		msg.Flags = LeaseBreakFlag(int.from_bytes(buff.read(4), byteorder='little'))
+		msg.LeaseKey = buff.read(16)
+		msg.CurrentLeaseState = LeaseState(int.from_bytes(buff.read(4), byteorder='little'))
+		msg.NewLeaseState = LeaseState(int.from_bytes(buff.read(4), byteorder='little'))
+		msg.BreakReason = int.from_bytes(buff.read(4), byteorder='little')
+		msg.AccessMaskHint = int.from_bytes(buff.read(4), byteorder='little')
+		msg.ShareMaskHint = int.from_bytes(buff.read(4), byteorder='little')
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 LEASE BREAK NOTIFICATION ====\r\n'
+		t += 'StructureSize: %s\r\n' % self.StructureSize
+		t += 'NewEpoch: %s\r\n' % self.NewEpoch
+		t += 'Flags: %s\r\n' % self.Flags
+		t += 'LeaseKey: %s\r\n' % self.LeaseKey.hex()
+		t += 'CurrentLeaseState: %s\r\n' % self.CurrentLeaseState
+		t += 'NewLeaseState: %s\r\n' % self.NewLeaseState
+		return t
+
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/8a3cfb38-0d1e-4b55-a8d5-ff6e2fc7e0fa
+# Acknowledgment and response share this layout
+class LEASE_BREAK_ACK:
+	def __init__(self):
+		self.StructureSize = 36
+		self.Reserved = 0
+		self.Flags = 0
+		self.LeaseKey = None
+		self.LeaseState = None
+		self.LeaseDuration = 0
+
+	def to_bytes(self):
+		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
+		t += self.Reserved.to_bytes(2, byteorder='little', signed = False)
+		t += self.Flags.to_bytes(4, byteorder='little', signed = False)
+		t += self.LeaseKey
+		t += self.LeaseState.to_bytes(4, byteorder='little', signed = False)
+		t += self.LeaseDuration.to_bytes(8, byteorder='little', signed = False)
+		return t
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return LEASE_BREAK_ACK.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		msg = LEASE_BREAK_ACK()
+		msg.StructureSize = int.from_bytes(buff.read(2), byteorder='little')
+		assert msg.StructureSize == 36
+		msg.Reserved = int.from_bytes(buff.read(2), byteorder='little')
+		msg.Flags = int.from_bytes(buff.read(4), byteorder='little')
+		msg.LeaseKey = buff.read(16)
+		msg.LeaseState = LeaseState(int.from_bytes(buff.read(4), byteorder='little'))
+		msg.LeaseDuration = int.from_bytes(buff.read(8), byteorder='little')
+		return msg
+
+	def __repr__(self):
+		t = '==== SMB2 LEASE BREAK ACK ====\r\n'
+		t += 'StructureSize: %s\r\n' % self.StructureSize
+		t += 'LeaseKey: %s\r\n' % self.LeaseKey.hex()
+		t += 'LeaseState: %s\r\n' % self.LeaseState
+		return t
+
+class OPLOCK_BREAK_REQ:
+	"""
+	Client to server OPLOCK_BREAK messages (oplock or lease break acknowledgment), the structure is selected by StructureSize
+	"""
+	@staticmethod
+	def from_bytes(bbuff):
+		return OPLOCK_BREAK_REQ.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		pos = buff.tell()
+		structure_size = int.from_bytes(buff.read(2), byteorder='little')
+		buff.seek(pos, io.SEEK_SET)
+		if structure_size == 36:
+			return LEASE_BREAK_ACK.from_buffer(buff)
+		return OPLOCK_BREAK_NOTIFICATION.from_buffer(buff)
+
+class OPLOCK_BREAK_REPLY:
+	"""
+	Server to client OPLOCK_BREAK messages (break notifications and acknowledgment responses), the structure is selected by StructureSize
+	"""
+	@staticmethod
+	def from_bytes(bbuff):
+		return OPLOCK_BREAK_REPLY.from_buffer(io.BytesIO(bbuff))
+
+	@staticmethod
+	def from_buffer(buff):
+		pos = buff.tell()
+		structure_size = int.from_bytes(buff.read(2), byteorder='little')
+		buff.seek(pos, io.SEEK_SET)
+		if structure_size == 44:
+			return LEASE_BREAK_NOTIFICATION.from_buffer(buff)
+		elif structure_size == 36:
+			return LEASE_BREAK_ACK.from_buffer(buff)
+		return OPLOCK_BREAK_NOTIFICATION.from_buffer(buff)
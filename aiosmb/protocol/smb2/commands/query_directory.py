@@ -1,5 +1,6 @@
 import io
 import enum
+import struct
 
 from aiosmb.fscc.structures.fileinfoclass import *
 
@@ -9,6 +10,11 @@ class QueryDirectoryFlag(enum.IntFlag):
 	SMB2_INDEX_SPECIFIED = 0x04 #The server SHOULD<64> return entries beginning at the byte number specified by FileIndex.
 	SMB2_REOPEN = 0x10 #The server MUST restart the enumeration from the beginning, and the search pattern MUST be changed to the provided value.
 
+# StructureSize, FileInformationClass, Flags, FileIndex, FileId (low, high), FileNameOffset, FileNameLength, OutputBufferLength
+QUERY_DIRECTORY_REQ_STRUCT = struct.Struct('<HBBIQQHHI')
+# StructureSize, OutputBufferOffset, OutputBufferLength
+QUERY_DIRECTORY_REPLY_STRUCT = struct.Struct('<HHI')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/10906442-294c-46d3-8515-c277efe1f752
 class QUERY_DIRECTORY_REQ:
 	def __init__(self):
@@ -32,14 +38,10 @@ class QUERY_DIRECTORY_REQ:
 			self.FileNameOffset = 64 + 2+1+1+4+16+2+2+4
 			self.FileNameLength = len(self.Buffer)
 			
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.FileInformationClass.value.to_bytes(1, byteorder='little', signed = False)
-		t += self.Flags.to_bytes(1, byteorder='little', signed = False)
-		t += self.FileIndex.to_bytes(4, byteorder='little', signed = False)
-		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
-		t += self.FileNameOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.FileNameLength.to_bytes(2, byteorder='little', signed = False)
-		t += self.OutputBufferLength.to_bytes(4, byteorder='little', signed = False)
+		t = QUERY_DIRECTORY_REQ_STRUCT.pack(
+			self.StructureSize, self.FileInformationClass.value, self.Flags, self.FileIndex,
+			self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64, self.FileNameOffset, self.FileNameLength, self.OutputBufferLength
+		)
 		
 		if self.Buffer:
 			t += self.Buffer
@@ -102,15 +104,18 @@ class QUERY_DIRECTORY_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		pos = buff.tell()
+		buff.seek(0, io.SEEK_SET)
+		return QUERY_DIRECTORY_REPLY.from_view(memoryview(buff.read()), pos)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = QUERY_DIRECTORY_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, msg.OutputBufferOffset, msg.OutputBufferLength = QUERY_DIRECTORY_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 9
-		msg.OutputBufferOffset  = int.from_bytes(buff.read(2), byteorder='little')
-		msg.OutputBufferLength  = int.from_bytes(buff.read(4), byteorder='little')
 		
 		if msg.OutputBufferLength > 0:
-			buff.seek(msg.OutputBufferOffset, io.SEEK_SET)
-			msg.Data= buff.read(msg.OutputBufferLength)
+			msg.Data = bytes(view[msg.OutputBufferOffset:msg.OutputBufferOffset+msg.OutputBufferLength])
 
 		return msg
 
@@ -1,5 +1,6 @@
 import io
 import enum
+import struct
 
 from aiosmb.fscc.structures.fileinfoclass import *
 	
@@ -24,6 +25,11 @@ class EaInformation(enum.IntFlag):
 	SL_RETURN_SINGLE_ENTRY = 0x00000002 #Return a single EA entry in the response buffer.
 	SL_INDEX_SPECIFIED = 0x00000004 #The caller has specified an EA index.
 
+# StructureSize, InfoType, FileInfoClass, OutputBufferLength, InputBufferOffset, Reserved, InputBufferLength, AdditionalInformation, Flags, FileId (low, high)
+QUERY_INFO_REQ_STRUCT = struct.Struct('<HBBIHHIIIQQ')
+# StructureSize, OutputBufferOffset, OutputBufferLength
+QUERY_INFO_REPLY_STRUCT = struct.Struct('<HHI')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/d623b2f7-a5cd-4639-8cc9-71fa7d9f9ba9
 class QUERY_INFO_REQ:
 	def __init__(self):
@@ -44,20 +50,15 @@ class QUERY_INFO_REQ:
 		
 	def to_bytes(self):
 		if self.Data:
-			self.Buffer = io.BytesIO(self.Data)
+			self.Buffer = self.Data
 			self.InputBufferOffset = 64 + 2+1+1+4+2+2+2+4+4+16
 			self.InputBufferLength = len(self.Data)
 			
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.InfoType.value.to_bytes(1, byteorder='little', signed = False)
-		t += self.FileInfoClass.value.to_bytes(1, byteorder='little', signed = False)
-		t += self.OutputBufferLength.to_bytes(4, byteorder='little', signed = False)
-		t += self.InputBufferOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.Reserved.to_bytes(2, byteorder='little', signed = False)
-		t += self.InputBufferLength.to_bytes(4, byteorder='little', signed = False)
-		t += self.AdditionalInformation.to_bytes(4, byteorder='little', signed = False)
-		t += self.Flags.to_bytes(4, byteorder='little', signed = False)
-		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
+		t = QUERY_INFO_REQ_STRUCT.pack(
+			self.StructureSize, self.InfoType.value, self.FileInfoClass.value, self.OutputBufferLength,
+			self.InputBufferOffset, self.Reserved, self.InputBufferLength, self.AdditionalInformation, self.Flags,
+			self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64
+		)
 		
 		if self.Buffer:
 			t += self.Buffer
@@ -123,16 +124,18 @@ class QUERY_INFO_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		pos = buff.tell()
+		buff.seek(0, io.SEEK_SET)
+		return QUERY_INFO_REPLY.from_view(memoryview(buff.read()), pos)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = QUERY_INFO_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, msg.OutputBufferOffset, msg.OutputBufferLength = QUERY_INFO_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 9
-		msg.OutputBufferOffset  = int.from_bytes(buff.read(2), byteorder='little')
-		msg.OutputBufferLength  = int.from_bytes(buff.read(4), byteorder='little')
-		
 
 		if msg.OutputBufferLength > 0:
-			buff.seek(msg.OutputBufferOffset, io.SEEK_SET)
-			msg.Data = buff.read(msg.OutputBufferLength)
+			msg.Data = bytes(view[msg.OutputBufferOffset:msg.OutputBufferOffset+msg.OutputBufferLength])
 
 		return msg
 
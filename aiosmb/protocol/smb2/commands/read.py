@@ -1,5 +1,6 @@
 import io
 import enum
+import struct
 
 from aiosmb.commons.access_mask import *
 
@@ -12,6 +13,11 @@ class Channel(enum.Enum):
 	SMB2_CHANNEL_RDMA_V1 = 0x00000001 #One or more SMB_DIRECT_BUFFER_DESCRIPTOR_V1 structures as specified in [MS-SMBD] section 2.2.3.1 are present in the channel information specified by ReadChannelInfoOffset and ReadChannelInfoLength fields.
 	SMB2_CHANNEL_RDMA_V1_INVALIDATE = 0x00000002 #This flag is not valid for the SMB 3.0 dialect. One or more SMB_DIRECT_BUFFER_DESCRIPTOR_V1 structures, as specified in [MS-SMBD] section 2.2.3.1, are present in the channel information specified by the ReadChannelInfoOffset and ReadChannelInfoLength fields. The server is requested to perform remote invalidation when responding to the request as specified in [MS-SMBD] section 3.1.4.2.
 
+# StructureSize, Padding, Flags, Length, Offset, FileId (low, high), MinimumCount, Channel, RemainingBytes, ReadChannelInfoOffset, ReadChannelInfoLength
+READ_REQ_STRUCT = struct.Struct('<HBBIQQQIIIHH')
+# StructureSize, DataOffset, Reserved, DataLength, DataRemaining, Reserved2
+READ_REPLY_STRUCT = struct.Struct('<HBBIII')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/320f04f3-1b28-45cd-aaa1-9e5aed810dca
 class READ_REQ:
 	def __init__(self):
@@ -38,17 +44,11 @@ class READ_REQ:
 			self.ReadChannelInfoOffset = 64 + 1+1+4+8+16+4+4+4+2+2
 			self.ReadChannelInfoLength = len(self.ReadChannelInfo.to_bytes())
 		
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.Padding.to_bytes(1, byteorder='little', signed = False)
-		t += self.Flags.to_bytes(1, byteorder='little', signed = False)
-		t += self.Length.to_bytes(4, byteorder='little', signed = False)
-		t += self.Offset.to_bytes(8, byteorder='little', signed = False)
-		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
-		t += self.MinimumCount.to_bytes(4, byteorder='little', signed = False)
-		t += self.Channel.value.to_bytes(4, byteorder='little', signed = False)
-		t += self.RemainingBytes.to_bytes(4, byteorder='little', signed = False)
-		t += self.ReadChannelInfoOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.ReadChannelInfoLength.to_bytes(2, byteorder='little', signed = False)
+		t = READ_REQ_STRUCT.pack(
+			self.StructureSize, self.Padding, self.Flags, self.Length, self.Offset,
+			self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64, self.MinimumCount, self.Channel.value, self.RemainingBytes,
+			self.ReadChannelInfoOffset, self.ReadChannelInfoLength
+		)
 		if self.ReadChannelInfoOffset > 0:
 			t += self.Buffer
 		else:
@@ -109,6 +109,19 @@ class READ_REPLY:
 		self.DataRemaining = None
 		self.Reserved2 = 0
 		self.Buffer  = None
+		
+		#memoryview of the payload inside the received message, Buffer is only created from it when accessed
+		self.BufferView = None
+
+	@property
+	def Buffer(self):
+		if self.__buffer is None and self.BufferView is not None:
+			self.__buffer = bytes(self.BufferView)
+		return self.__buffer
+
+	@Buffer.setter
+	def Buffer(self, data):
+		self.__buffer = data
 
 	def to_bytes(self):
 		#todo
@@ -120,17 +133,16 @@ class READ_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		pos = buff.tell()
+		buff.seek(0, io.SEEK_SET)
+		return READ_REPLY.from_view(memoryview(buff.read()), pos)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = READ_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, msg.DataOffset, msg.Reserved, msg.DataLength, msg.DataRemaining, msg.Reserved2 = READ_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 17
-		msg.DataOffset = int.from_bytes(buff.read(1), byteorder='little')
-		msg.Reserved  = int.from_bytes(buff.read(1), byteorder='little')
-		msg.DataLength = int.from_bytes(buff.read(4), byteorder = 'little')
-		msg.DataRemaining = int.from_bytes(buff.read(4), byteorder = 'little')
-		msg.Reserved2 = int.from_bytes(buff.read(4), byteorder = 'little')
-		
-		buff.seek(msg.DataOffset, io.SEEK_SET)
-		msg.Buffer= buff.read(msg.DataLength)
+		msg.BufferView = view[msg.DataOffset:msg.DataOffset+msg.DataLength]
 		return msg
 
 	def __repr__(self):
@@ -1,5 +1,6 @@
 import io
 import enum
+import struct
 
 from aiosmb.commons.access_mask import *
 from aiosmb.protocol.smb2.commands.read import Channel
@@ -10,6 +11,11 @@ class WriteFlag(enum.IntFlag):
 	WRITE_UNBUFFERED = 0x00000002 #File buffering is not performed. This bit is not valid for the SMB 2.0.2, 2.1, and 3.0 dialects.
 
 
+# StructureSize, DataOffset, Length, Offset, FileId (low, high), Channel, RemainingBytes, WriteChannelInfoOffset, WriteChannelInfoLength, Flags
+WRITE_REQ_STRUCT = struct.Struct('<HHIQQQIIHHI')
+# StructureSize, Reserved, Count, Remaining, WriteChannelInfoOffset, WriteChannelInfoLength
+WRITE_REPLY_STRUCT = struct.Struct('<HHIIHH')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/e7046961-3318-4350-be2a-a8d69bb59ce8
 class WRITE_REQ:
 	def __init__(self):
@@ -44,18 +50,15 @@ class WRITE_REQ:
 			self.WriteChannelInfoOffset = self.DataOffset + len(self.Buffer)
 			self.WriteChannelInfoLength = len(self.WriteChannelInfo.to_bytes())
 		
-		t  = self.StructureSize.to_bytes(2, byteorder='little', signed = False)
-		t += self.DataOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.Length.to_bytes(4, byteorder='little', signed = False)
-		t += self.Offset.to_bytes(8, byteorder='little', signed = False)
-		t += self.FileId.to_bytes(16, byteorder='little', signed = False)
-		t += self.Channel.value.to_bytes(4, byteorder='little', signed = False)
-		t += self.RemainingBytes.to_bytes(4, byteorder='little', signed = False)
-		t += self.WriteChannelInfoOffset.to_bytes(2, byteorder='little', signed = False)
-		t += self.WriteChannelInfoLength.to_bytes(2, byteorder='little', signed = False)
-		t += self.Flags.value.to_bytes(4, byteorder='little', signed = False)
-		
-		t += self.Buffer
+		#the payload is copied only once, straight after the fixed part
+		t = bytearray(WRITE_REQ_STRUCT.size + len(self.Buffer))
+		WRITE_REQ_STRUCT.pack_into(
+			t, 0,
+			self.StructureSize, self.DataOffset, self.Length, self.Offset,
+			self.FileId & 0xFFFFFFFFFFFFFFFF, self.FileId >> 64, self.Channel.value, self.RemainingBytes,
+			self.WriteChannelInfoOffset, self.WriteChannelInfoLength, self.Flags
+		)
+		t[WRITE_REQ_STRUCT.size:] = self.Buffer
 		return t
 
 	@staticmethod
@@ -124,15 +127,13 @@ class WRITE_REPLY:
 
 	@staticmethod
 	def from_buffer(buff):
+		return WRITE_REPLY.from_view(memoryview(buff.read(WRITE_REPLY_STRUCT.size)), 0)
+
+	@staticmethod
+	def from_view(view, offset):
 		msg = WRITE_REPLY()
-		msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+		msg.StructureSize, msg.Reserved, msg.Count, msg.Remaining, msg.WriteChannelInfoOffset, msg.WriteChannelInfoLength = WRITE_REPLY_STRUCT.unpack_from(view, offset)
 		assert msg.StructureSize == 17
-		msg.Reserved  = int.from_bytes(buff.read(2), byteorder='little')
-		msg.Count  = int.from_bytes(buff.read(4), byteorder='little')
-		msg.Remaining  = int.from_bytes(buff.read(4), byteorder = 'little')
-		msg.WriteChannelInfoOffset  = int.from_bytes(buff.read(2), byteorder = 'little')
-		msg.WriteChannelInfoLength  = int.from_bytes(buff.read(2), byteorder = 'little')
-		
 		return msg
 
 	def __repr__(self):
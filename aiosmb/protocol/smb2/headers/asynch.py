@@ -1,10 +1,14 @@
 
 import enum
 import io
+import struct
 
 from aiosmb.protocol.smb2.command_codes import SMB2Command
 from aiosmb.commons.ntstatus import NTStatus
-from aiosmb.protocol.smb2.headers.common import SMB2HeaderFlag
+from aiosmb.protocol.smb2.headers.common import SMB2HeaderFlag, cached_enum
+
+# ProtocolId, StructureSize, CreditCharge, Status, Command, Credit, Flags, NextCommand, MessageId, AsyncId, SessionId, Signature
+SMB2_HEADER_ASYNC_STRUCT = struct.Struct('<4sHHIHHIIQQQ16s')
 
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/ea4560b7-90da-4803-82b5-344754b92a79
 
@@ -13,39 +17,36 @@ class SMB2Header_ASYNC:
 		self.ProtocolId    = b'\xFESMB'
 		self.StructureSize = 64
 		self.CreditCharge  = None
-		self.Status        = None  # In a request, this field is interpreted in different ways depending on the SMB2 dialect.
+		self.Status        = NTStatus.SUCCESS  # In a request, this field is interpreted in different ways depending on the SMB2 dialect.
 		self.Command       = None
 		self.Credit        = None
-		self.Flags         = None
-		self.NextCommand   = None
+		self.Flags         = SMB2HeaderFlag.SMB2_FLAGS_ASYNC_COMMAND
+		self.NextCommand   = 0
 		self.MessageId     = None
-		self.AsyncId       = None
-		self.SessionId     = None
-		self.Signature     = None
+		self.AsyncId       = 0
+		self.SessionId     = 0
+		self.Signature     = b'\x00'*16
 
 	@staticmethod
-	def from_buffer(buff):
+	def from_bytes(bbuff, offset = 0):
 		hdr = SMB2Header_ASYNC()
-		hdr.ProtocolId = buff.read(4)
+		hdr.ProtocolId, hdr.StructureSize, hdr.CreditCharge, status, command, hdr.Credit, flags, hdr.NextCommand, \
+			hdr.MessageId, hdr.AsyncId, hdr.SessionId, hdr.Signature = SMB2_HEADER_ASYNC_STRUCT.unpack_from(bbuff, offset)
 		assert hdr.ProtocolId == b'\xFESMB'
-		hdr.StructureSize = int.from_bytes(buff.read(2), byteorder='little', signed = False)
 		assert hdr.StructureSize == 64
-		hdr.CreditCharge = int.from_bytes(buff.read(2), byteorder='little', signed = False)
-		hdr.Status = NTStatus(int.from_bytes(buff.read(4), byteorder='little', signed = False))
-		hdr.Command = SMB2Command(int.from_bytes(buff.read(2), byteorder='little', signed = False))
-		hdr.Credit =  int.from_bytes(buff.read(2), byteorder='little', signed = False)
-		hdr.Flags =  SMB2HeaderFlag(int.from_bytes(buff.read(4), byteorder='little', signed = False))
-		hdr.NextCommand = int.from_bytes(buff.read(4), byteorder='little', signed = False)
-		hdr.MessageId = int.from_bytes(buff.read(8), byteorder='little', signed = False)
-		hdr.AsyncId = buff.read(8)
-		hdr.SessionId = buff.read(8)
-		hdr.Signature = buff.read(16)
+		hdr.Status = cached_enum(NTStatus, status)
+		hdr.Command = cached_enum(SMB2Command, command)
+		hdr.Flags =  cached_enum(SMB2HeaderFlag, flags)
 		return hdr
 
+	@staticmethod
+	def from_buffer(buff):
+		return SMB2Header_ASYNC.from_bytes(buff.read(64))
+
 	@staticmethod
 	def construct(cmd, flags, msgid, Credit = 0, NextCommand=0, CreditCharge = 0, 
 					Signature=b'\x00'*16,
-					AsyncId=b'\x00'*8, SessionId = b'\x00'*8, 
+					AsyncId = 0, SessionId = 0, 
 					status = NTStatus.SUCCESS):
 		hdr = SMB2Header_ASYNC()
 		hdr.ProtocolId = b'\xFESMB'
@@ -64,19 +65,20 @@ class SMB2Header_ASYNC:
 		return hdr
 
 	def to_bytes(self):
-		t  = self.ProtocolId
-		t += self.StructureSize.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.CreditCharge.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.Status.value.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.Command.value.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.Credit.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.Flags.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.NextCommand.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.MessageId.to_bytes(8, byteorder = 'little', signed=False)
-		t += self.AsyncId
-		t += self.SessionId
-		t += self.Signature
-		return t
+		return SMB2_HEADER_ASYNC_STRUCT.pack(
+			self.ProtocolId, self.StructureSize, self.CreditCharge, self.Status.value, self.Command.value, self.Credit,
+			self.Flags, self.NextCommand, self.MessageId, self.AsyncId, self.SessionId, self.Signature
+		)
+
+	def pack_into(self, buff, offset = 0):
+		"""
+		Serializes the header directly into buff (bytearray or writable memoryview) at offset
+		"""
+		SMB2_HEADER_ASYNC_STRUCT.pack_into(
+			buff, offset,
+			self.ProtocolId, self.StructureSize, self.CreditCharge, self.Status.value, self.Command.value, self.Credit,
+			self.Flags, self.NextCommand, self.MessageId, self.AsyncId, self.SessionId, self.Signature
+		)
 
 	def __repr__(self):
 		t = '===SMB2 HEADER ASYNC===\r\n'
@@ -11,3 +11,17 @@ class SMB2HeaderFlag(enum.IntFlag):
 	SMB2_FLAGS_REPLAY_OPERATION   = 0x20000000
 
 
+
+# (enum type, value) -> enum member
+ENUM_CACHE = {}
+
+def cached_enum(enumtype, value):
+	"""
+	Returns enumtype(value), the members are cached as enum construction is expensive compared to struct decoding
+	"""
+	try:
+		return ENUM_CACHE[(enumtype, value)]
+	except KeyError:
+		res = enumtype(value)
+		ENUM_CACHE[(enumtype, value)] = res
+		return res
@@ -1,11 +1,15 @@
 import enum
 import io
+import struct
 
 from aiosmb.protocol.smb2.command_codes import SMB2Command
 from aiosmb.commons.ntstatus import NTStatus
-from aiosmb.protocol.smb2.headers.common import SMB2HeaderFlag
+from aiosmb.protocol.smb2.headers.common import SMB2HeaderFlag, cached_enum
 
 
+# ProtocolId, StructureSize, CreditCharge, Status, Command, CreditReq, Flags, NextCommand, MessageId, Reserved, TreeId, SessionId, Signature
+SMB2_HEADER_SYNC_STRUCT = struct.Struct('<4sHHIHHIIQIIQ16s')
+
 # https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/fb188936-5050-48d3-b350-dc43059638a4
 class SMB2Header_SYNC():
 	def __init__(self):
@@ -24,40 +28,36 @@ class SMB2Header_SYNC():
 		self.Signature     = b'\x00'*16
 
 	@staticmethod
-	def from_buffer(buff):
+	def from_bytes(bbuff, offset = 0):
 		hdr = SMB2Header_SYNC()
-		hdr.ProtocolId = buff.read(4)
+		hdr.ProtocolId, hdr.StructureSize, hdr.CreditCharge, status, command, hdr.CreditReq, flags, hdr.NextCommand, \
+			hdr.MessageId, hdr.Reserved, hdr.TreeId, hdr.SessionId, hdr.Signature = SMB2_HEADER_SYNC_STRUCT.unpack_from(bbuff, offset)
 		assert hdr.ProtocolId == b'\xFESMB'
-		hdr.StructureSize = int.from_bytes(buff.read(2), byteorder='little', signed = False)
 		assert hdr.StructureSize == 64
-		hdr.CreditCharge = int.from_bytes(buff.read(2), byteorder='little', signed = False)
-		hdr.Status      = NTStatus(int.from_bytes(buff.read(4), byteorder='little', signed = False))
-		hdr.Command     = SMB2Command(int.from_bytes(buff.read(2), byteorder='little', signed = False))
-		hdr.CreditReq      = int.from_bytes(buff.read(2), byteorder='little', signed = False)
-		hdr.Flags       = SMB2HeaderFlag(int.from_bytes(buff.read(4), byteorder='little', signed = False))
-		hdr.NextCommand = int.from_bytes(buff.read(4), byteorder='little', signed = False)
-		hdr.MessageId   = int.from_bytes(buff.read(8), byteorder='little', signed = False)
-		hdr.Reserved    = int.from_bytes(buff.read(4), byteorder='little', signed = False)
-		hdr.TreeId      = int.from_bytes(buff.read(4), byteorder='little', signed = False)
-		hdr.SessionId   = int.from_bytes(buff.read(8), byteorder='little', signed = False)
-		hdr.Signature   = buff.read(16)
+		hdr.Status      = cached_enum(NTStatus, status)
+		hdr.Command     = cached_enum(SMB2Command, command)
+		hdr.Flags       = cached_enum(SMB2HeaderFlag, flags)
 		return hdr
 
+	@staticmethod
+	def from_buffer(buff):
+		return SMB2Header_SYNC.from_bytes(buff.read(64))
+
 	def to_bytes(self):
-		t  = self.ProtocolId
-		t += self.StructureSize.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.CreditCharge.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.Status.value.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.Command.value.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.CreditReq.to_bytes(2, byteorder = 'little', signed=False)
-		t += self.Flags.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.NextCommand.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.MessageId.to_bytes(8, byteorder = 'little', signed=False)
-		t += self.Reserved.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.TreeId.to_bytes(4, byteorder = 'little', signed=False)
-		t += self.SessionId.to_bytes(8, byteorder = 'little', signed=False)
-		t += self.Signature
-		return t
+		return SMB2_HEADER_SYNC_STRUCT.pack(
+			self.ProtocolId, self.StructureSize, self.CreditCharge, self.Status.value, self.Command.value, self.CreditReq,
+			self.Flags, self.NextCommand, self.MessageId, self.Reserved, self.TreeId, self.SessionId, self.Signature
+		)
+
+	def pack_into(self, buff, offset = 0):
+		"""
+		Serializes the header directly into buff (bytearray or writable memoryview) at offset
+		"""
+		SMB2_HEADER_SYNC_STRUCT.pack_into(
+			buff, offset,
+			self.ProtocolId, self.StructureSize, self.CreditCharge, self.Status.value, self.Command.value, self.CreditReq,
+			self.Flags, self.NextCommand, self.MessageId, self.Reserved, self.TreeId, self.SessionId, self.Signature
+		)
 
 	def __repr__(self):
 		t = '===SMB2 HEADER SYNC===\r\n'
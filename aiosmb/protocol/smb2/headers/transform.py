@@ -1,20 +1,24 @@
 import enum
 import io
-	
+
 #https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/d6ce2327-a4c9-4793-be66-7b5bad2175fa
 class SMB2Header_TRANSFORM:
 	def __init__(self):
 		self.ProtocolId = b'\xFDSMB'
-		self.Signature = None
+		self.Signature = b'\x00'*16
 		self.Nonce = None
 		self.OriginalMessageSize = None
-		self.Reserved = None
-		self.EncryptionAlgorithm = None
+		self.Reserved = 0
+		self.EncryptionAlgorithm = 1 #Flags in SMB 3.1.1, the only valid value is 1 in all dialects
 		self.SessionId = None
-		
+
+	@staticmethod
+	def from_bytes(bbuff):
+		return SMB2Header_TRANSFORM.from_buffer(io.BytesIO(bbuff))
+
 	@staticmethod
 	def from_buffer(buff):
-		hdr = SMB2Header_COMPRESSION_TRANSFORM()
+		hdr = SMB2Header_TRANSFORM()
 		hdr.ProtocolId = buff.read(4)
 		assert hdr.ProtocolId == b'\xFDSMB'
 		hdr.Signature  = buff.read(16)
@@ -25,3 +29,22 @@ class SMB2Header_TRANSFORM:
 		hdr.SessionId = int.from_bytes(buff.read(8), byteorder='little', signed = False)
 		return hdr
 
+	def to_bytes(self):
+		t  = self.ProtocolId
+		t += self.Signature
+		t += self.Nonce
+		t += self.OriginalMessageSize.to_bytes(4, byteorder = 'little', signed=False)
+		t += self.Reserved.to_bytes(2, byteorder = 'little', signed=False)
+		t += self.EncryptionAlgorithm.to_bytes(2, byteorder = 'little', signed=False)
+		t += self.SessionId.to_bytes(8, byteorder = 'little', signed=False)
+		return t
+
+	def __repr__(self):
+		t = '===SMB2 HEADER TRANSFORM===\r\n'
+		t += 'ProtocolId:    %s\r\n' % self.ProtocolId
+		t += 'Signature:     %s\r\n' % self.Signature
+		t += 'Nonce:         %s\r\n' % self.Nonce
+		t += 'OriginalMessageSize: %s\r\n' % self.OriginalMessageSize
+		t += 'EncryptionAlgorithm: %s\r\n' % self.EncryptionAlgorithm
+		t += 'SessionId:     %s\r\n' % self.SessionId
+		return t
@@ -1,18 +1,36 @@
 import enum
 import io
+import struct
 
+from aiosmb import logger
+from aiosmb.exceptions import SMBMessageParseError
 from aiosmb.commons.ntstatus import NTStatus
 from aiosmb.protocol.smb2.headers import *
 from aiosmb.protocol.smb2.commands import *
 from aiosmb.protocol.smb2.command_codes import *
 
+SMB2_FLAGS_STRUCT = struct.Struct('<I')
+SMB2_STRUCTURE_SIZE_STRUCT = struct.Struct('<H')
+SMB2_NEXT_COMMAND_STRUCT = struct.Struct('<I')
+SMB2_FLAGS_ASYNC_COMMAND_VALUE = SMB2HeaderFlag.SMB2_FLAGS_ASYNC_COMMAND.value
+SMB2_FLAGS_SERVER_TO_REDIR_VALUE = SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR.value
+
 class SMB2Transform:
-	def __init__(self):
-		self.header = None
-		self.data   = None
+	"""
+	Encrypted (or compressed) SMB2 message. data is the encrypted payload following the transform header.
+	"""
+	def __init__(self, header = None, data = None):
+		self.header = header
+		self.data   = data
 	
 	@staticmethod
 	def from_bytes(bbuff):
+		if bbuff[0] == 0xFD:
+			#encrypted, not copying the (possibly large) payload
+			msg = SMB2Transform()
+			msg.header = SMB2Header_TRANSFORM.from_bytes(bbuff[:52])
+			msg.data = memoryview(bbuff)[52:]
+			return msg
 		return SMB2Transform.from_buffer(io.BytesIO(bbuff))
 
 	@staticmethod
@@ -21,11 +39,11 @@ class SMB2Transform:
 		pos = buff.tell()
 		t = buff.read(1)
 		buff.seek(pos,0)
-		if t == 0xFD:
+		if t == b'\xFD':
 			#encrypted
 			msg.header = SMB2Header_TRANSFORM.from_buffer(buff)
-		elif t == 0xFD:
-			#encrypted
+		elif t == b'\xFC':
+			#compressed
 			msg.header = SMB2Header_COMPRESSION_TRANSFORM.from_buffer(buff)
 		else:
 			raise Exception('Unknown packet type for SMB2Transform! %s' % t)
@@ -33,14 +51,101 @@ class SMB2Transform:
 		msg.data = buff.read()
 		return msg
 
+	def to_bytes(self):
+		return self.header.to_bytes() + self.data
+
+	def __repr__(self):
+		t = "== SMBv2 Transform =="
+		t += repr(self.header)
+		return t
+
+class SMB2NotImplementedCommand:
+	"""
+	Placeholder for commands without a parser, keeps the raw command bytes
+	"""
+	def __init__(self):
+		self.data = None
+
+	@staticmethod
+	def from_buffer(buff):
+		cmd = SMB2NotImplementedCommand()
+		cmd.data = buff.read()
+		return cmd
+
+	def __repr__(self):
+		t = '==== SMB2 NOT IMPLEMENTED COMMAND ====\r\n'
+		t += 'data: %s\r\n' % self.data
+		return t
+
 class SMB2Message:
 	def __init__(self,header = None,command = None ):
 		self.header    = header
 		self.command   = command
+		
+		#the serialized form of the message as it arrived from or was sent to the network, SMB 3.1.1 preauth integrity needs it
+		self.raw = None
+
+	@property
+	def command(self):
+		"""
+		The command body of messages parsed by from_bytes is only decoded on first access
+		"""
+		if self.__command is None and self.__pending is not None:
+			view, is_reply = self.__pending
+			#a parse error is raised again on the next access
+			self.__command = SMB2Message.command_from_view(self.header, view, is_reply)
+			self.__pending = None
+		return self.__command
+
+	@command.setter
+	def command(self, command):
+		self.__command = command
+		self.__pending = None
 
 	@staticmethod
 	def from_bytes(bbuff):
-		return SMB2Message.from_buffer(io.BytesIO(bbuff))
+		"""
+		Parses one SMB2 message. Only the header is decoded here (with a precompiled struct), the command body
+		is decoded when the command attribute is first accessed, so the receive loop doesn't spend time on it.
+		"""
+		view = memoryview(bbuff)
+		msg = SMB2Message()
+		msg.raw = bbuff
+		flags, = SMB2_FLAGS_STRUCT.unpack_from(view, 16)
+		if flags & SMB2_FLAGS_ASYNC_COMMAND_VALUE:
+			msg.header = SMB2Header_ASYNC.from_bytes(view)
+		else:
+			msg.header = SMB2Header_SYNC.from_bytes(view)
+		msg.__pending = (view, flags & SMB2_FLAGS_SERVER_TO_REDIR_VALUE)
+		return msg
+
+	@staticmethod
+	def command_from_view(header, view, is_reply):
+		"""
+		Decodes the command body of the message in view. Commands having a from_view method are decoded
+		straight from the memoryview, the rest is parsed via io.BytesIO.
+		"""
+		# maybe it's an error...
+		# not sure this is the best way to check fot he error message
+		if is_reply and header.Status is not NTStatus.SUCCESS:
+			if not (header.Status is NTStatus.MORE_PROCESSING_REQUIRED and header.Command is SMB2Command.SESSION_SETUP):
+				structure_size, = SMB2_STRUCTURE_SIZE_STRUCT.unpack_from(view, 64)
+				if structure_size == 9:
+					return ERROR_REPLY.from_view(view, 64)
+
+		classname = header.Command.name + ('_REPLY' if is_reply else '_REQ')
+		
+		cmd = command2object.get(classname)
+		if cmd is not None and hasattr(cmd, 'from_view'):
+			try:
+				return cmd.from_view(view, 64)
+			except Exception as e:
+				logger.debug('Failed to parse %s (MessageId %s): %s' % (classname, header.MessageId, e))
+				raise SMBMessageParseError('Failed to parse %s: %s' % (classname, e), ntstatus = header.Status) from e
+		
+		buff = io.BytesIO(view)
+		buff.seek(64, io.SEEK_SET)
+		return SMB2Message.command_from_buffer(header, classname, buff)
 
 	@staticmethod
 	def from_buffer(buff):
@@ -62,18 +167,23 @@ class SMB2Message:
 					return msg
 
 		classname = msg.header.Command.name
+		if SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR in msg.header.Flags:
+			classname += '_REPLY'
+		else:
+			classname += '_REQ'
+		msg.command = SMB2Message.command_from_buffer(msg.header, classname, buff)
+		return msg
+
+	@staticmethod
+	def command_from_buffer(header, classname, buff):
+		if classname not in command2object:
+			logger.debug('Could not find command implementation for %s' % classname)
+			return SMB2NotImplementedCommand.from_buffer(buff)
 		try:
-			if SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR in msg.header.Flags:
-				classname += '_REPLY'
-			else:
-				classname += '_REQ'
-			msg.command = command2object[classname].from_buffer(buff)
+			return command2object[classname].from_buffer(buff)
 		except Exception as e:
-			traceback.print_exc()
-			print('Could not find command implementation! %s' % str(e))
-			msg.command = SMB2NotImplementedCommand.from_buffer(buff)
-
-		return msg
+			logger.debug('Failed to parse %s (MessageId %s): %s' % (classname, header.MessageId, e))
+			raise SMBMessageParseError('Failed to parse %s: %s' % (classname, e), ntstatus = header.Status) from e
 
 	@staticmethod
 	def isAsync(buff):
@@ -86,9 +196,34 @@ class SMB2Message:
 		buff.seek(pos, io.SEEK_SET)
 		return SMB2HeaderFlag.SMB2_FLAGS_ASYNC_COMMAND in flags
 
+	@staticmethod
+	def from_compound_bytes(bbuff):
+		"""
+		Splits a (possibly) compounded message into a list of SMB2Message objects using the NextCommand field of each header.
+		"""
+		msgs = []
+		offset = 0
+		while True:
+			next_command = int.from_bytes(bbuff[offset+20:offset+24], byteorder='little', signed = False)
+			if next_command == 0:
+				msgs.append(SMB2Message.from_bytes(bbuff[offset:]))
+				break
+			msgs.append(SMB2Message.from_bytes(bbuff[offset:offset+next_command]))
+			offset += next_command
+		return msgs
+
 	def to_bytes(self):
-		t  = self.header.to_bytes()
-		t += self.command.to_bytes()
+		"""
+		Returns a bytearray so signing can patch the header in place without copying the message again
+		"""
+		body = self.command.to_bytes()
+		length = 64 + len(body)
+		if self.header.NextCommand != 0:
+			#part of a compound chain, padding up to the next message
+			length = self.header.NextCommand
+		t = bytearray(length)
+		self.header.pack_into(t, 0)
+		t[64:64+len(body)] = body
 		return t
 
 	def __repr__(self):
@@ -98,6 +233,47 @@ class SMB2Message:
 		return t
 		
 
+# https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/46dd4182-62d3-4e30-9fe5-e2ec124edca1
+# FileId to be used in related compound requests, the server substitutes it with the FileId of the previous operation
+SMB2_RELATED_FILE_ID = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+
+class SMB2Compound:
+	"""
+	Multiple SMB2 messages sent in one transport frame.
+	Every message except the last one is padded to 8 byte boundary and its NextCommand field points to the next message.
+	"""
+	def __init__(self, messages = None):
+		self.messages = messages if messages is not None else []
+
+	def set_next_command(self):
+		"""
+		Fills in the NextCommand fields without keeping the serialized chain, to_bytes does the same
+		"""
+		self.to_bytes()
+
+	def to_bytes(self):
+		"""
+		Serializes every message once. NextCommand is set from the serialized length and patched into the header,
+		the padding is part of the message (and its signature).
+		"""
+		parts = []
+		for i, msg in enumerate(self.messages):
+			msg.header.NextCommand = 0
+			data = msg.to_bytes()
+			if i != len(self.messages) - 1:
+				length = (len(data) + 7) & ~7
+				msg.header.NextCommand = length
+				SMB2_NEXT_COMMAND_STRUCT.pack_into(data, 20, length)
+				data += b'\x00' * (length - len(data))
+			parts.append(data)
+		return bytearray().join(parts)
+
+	def __repr__(self):
+		t = "== SMBv2 Compound ==\r\n"
+		for msg in self.messages:
+			t += repr(msg)
+		return t
+
 command2object = {
 	'NEGOTIATE_REQ'       : NEGOTIATE_REQ,
 	'NEGOTIATE_REPLY'     : NEGOTIATE_REPLY,
@@ -123,4 +299,6 @@ command2object = {
 	'CLOSE_REPLY' : CLOSE_REPLY,
 	'WRITE_REPLY' : WRITE_REPLY,
 	'WRITE_REQ' : WRITE_REQ,
+	'OPLOCK_BREAK_REQ' : OPLOCK_BREAK_REQ,
+	'OPLOCK_BREAK_REPLY' : OPLOCK_BREAK_REPLY,
 }
\ No newline at end of file
@@ -4,17 +4,19 @@ import hmac
 import hashlib
 import platform
 import copy
+import os
 
 from aiosmb import logger
 from aiosmb.exceptions import *
 from aiosmb.network.network import TCPSocket
-from aiosmb.network.netbios_transport import NetBIOSTransport
+from aiosmb.network.netbios_transport import NetBIOSTransport, parse_frame
+from aiosmb.network.buffered_transport import SMBBufferedTransport
 from aiosmb.protocol.smb.command_codes import SMBCommand
 from aiosmb.commons.ntstatus import NTStatus
 from aiosmb.protocol.smb.header import SMBHeader, SMBHeaderFlags2Enum
 from aiosmb.protocol.smb.message import SMBMessage
 from aiosmb.protocol.smb.commands import *
-from aiosmb.protocol.smb2.message import SMB2Message, SMB2Transform
+from aiosmb.protocol.smb2.message import SMB2Message, SMB2Transform, SMB2Compound, SMB2_RELATED_FILE_ID
 from aiosmb.protocol.smb2.commands import *
 from aiosmb.protocol.smb2.headers import *
 from aiosmb.protocol.smb2.command_codes import *
@@ -23,16 +25,33 @@ from aiosmb.dtyp.constrcuted_security.guid import *
 from aiosmb.commons.access_mask import *
 from aiosmb.fscc.structures.fileinfoclass import *
 from aiosmb.fscc.structures.FileFullDirectoryInformation import *
+from aiosmb.fscc.structures.DirectoryInformation import DirectoryInformationList, DIRECTORY_INFORMATION_TYPES
 from aiosmb.fscc.FileAttributes import FileAttributes
 
 from aiosmb.dtyp.constrcuted_security.security_descriptor import SECURITY_DESCRIPTOR
 
 from aiosmb.commons.smbcontainer import *
 from aiosmb.commons.smbtarget import *
+from aiosmb.commons.smbcredits import SMBCreditWindow
+from aiosmb.commons.smbdispatcher import SMBResponseDispatcher
+from aiosmb.commons.smbleasecache import SMBLeaseCache
+from aiosmb.crypto.kdf import KDF_CounterMode
+from aiosmb.crypto.aead import SMBEncryption, ENCRYPTION_AVAILABLE
+from aiosmb.crypto.signing import get_signer, SIGNING_AES_AVAILABLE
 from aiosmb.filereader import SMBFileReader
 
 
 
+#file information that only changes with the content or the attributes of the file, so it can be cached under a read lease
+#per-handle information (position, mode, access) is always queried
+LEASE_CACHED_INFO_CLASSES = [
+	FileInfoClass.FileBasicInformation,
+	FileInfoClass.FileStandardInformation,
+	FileInfoClass.FileNetworkOpenInformation,
+	FileInfoClass.FileAttributeTagInformation,
+	FileInfoClass.FileInternalInformation,
+]
+
 class SMBConnectionStatus(enum.Enum):
 	NEGOTIATING = 'NEGOTIATING'
 	SESSIONSETUP = 'SESSIONSETUP'
@@ -74,24 +93,50 @@ class FileHandle:
 		self.is_resilient = None
 		self.last_disconnect_time = None
 		self.file_name = None
+		
+		#durable handles, needed to reclaim the handle after a reconnect
+		self.durable_version = None #1 or 2
+		self.durable_timeout = None
+		self.create_guid = None
+		self.create_params = None #(desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level)
+		
+		#leases, only set if the server granted one
+		self.lease_key = None
+		self.lease_state = None
+		self.lease_epoch = 0
 	
 	@staticmethod	
 	def from_create_reply(reply, tree_id, file_name, oplock_level):
 		fh = FileHandle()
 		fh.file_id = reply.command.FileId
 		fh.tree_id = tree_id
-		fh.oplock_level = oplock_level
+		fh.oplock_level = reply.command.OplockLevel if reply.command.OplockLevel is not None else oplock_level
 		fh.is_durable = False
 		fh.is_resilient = False
 		fh.last_disconnect_time = 0
 		fh.file_name = file_name
+		
+		contexts = reply.command.CreateContext or []
+		for ctx in contexts:
+			#the server only sends the durable response context if the handle was made durable
+			if ctx.Name == SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2:
+				fh.is_durable = True
+				fh.durable_version = 2
+				fh.durable_timeout = ctx.Data.Timeout
+			elif ctx.Name == SMB2CreateContextName.DURABLE_HANDLE_REQUEST:
+				fh.is_durable = True
+				fh.durable_version = 1
+			elif ctx.Name == SMB2CreateContextName.REQUEST_LEASE and fh.oplock_level == OplockLevel.SMB2_OPLOCK_LEVEL_LEASE:
+				fh.lease_key = ctx.Data.LeaseKey
+				fh.lease_state = LeaseState(ctx.Data.LeaseState)
+				fh.lease_epoch = getattr(ctx.Data, 'Epoch', 0)
 		return fh
 
 class SMBConnection:
 	"""
 	Connection class for network connectivity and SMB messages management (sending/recieveing/singing/encrypting).
 	"""
-	def __init__(self, gssapi, target, dialects = [NegotiateDialects.SMB202], shutdown_evt = asyncio.Event()):
+	def __init__(self, gssapi, target, dialects = None, shutdown_evt = asyncio.Event()):
 		self.gssapi = gssapi
 		self.original_gssapi = copy.deepcopy(gssapi) #preserving a copy of the original
 		self.shutdown_evt = shutdown_evt
@@ -99,31 +144,44 @@ class SMBConnection:
 		self.target = target
 		
 		#######DONT CHANGE THIS
-		self.supported_dialects = [NegotiateDialects.WILDCARD, NegotiateDialects.SMB202, NegotiateDialects.SMB210]
+		self.supported_dialects = [NegotiateDialects.WILDCARD, NegotiateDialects.SMB202, NegotiateDialects.SMB210, NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]
 		#######
 		
 		self.settings = None
 		self.network_transport = None 
 		self.netbios_transport = None #this class is used by the netbios transport class, keeping it here also maybe you like to go in raw
 		self.dialects = dialects #list of SMBDialect
+		if self.dialects is None:
+			self.dialects = [NegotiateDialects.SMB202, NegotiateDialects.SMB210]
+			if SIGNING_AES_AVAILABLE == True:
+				#SMB 3.x signing needs AES-CMAC/GMAC
+				self.dialects += [NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]
 		
 		self.selected_dialect = None
 		self.signing_required = False
 		self.encryption_required = False
+		self.SessionFlags = 0 #of the final SESSION_SETUP reply, guest and anonymous sessions can't sign
 		
 		self.status = SMBConnectionStatus.NEGOTIATING
+		self.timeout = None #default per-request timeout in seconds, used when an operation is called without a timeout
 		
-		self.OutstandingResponsesEvent = {}
-		self.OutstandingRequests = {}
-		self.OutstandingResponses = {}
+		#matches the incoming replies to the requests waiting for them, also dispatches oplock/lease break notifications
+		self.dispatcher = SMBResponseDispatcher()
 		
 		#two dicts for the same data, but with different lookup key
+		#entries are shared between the users of the same share, TreeEntry.number_of_users counts the references
 		self.TreeConnectTable_id = {}
 		self.TreeConnectTable_share = {}
+		self.__tree_connect_locks = {} #share_name -> asyncio.Lock, serializes the first connection to a share
 		
 		self.FileHandleTable = {}
 		
-		self.SequenceWindow = 0
+		#file data and metadata cached under leases, see create's lease_state parameter
+		self.lease_cache = SMBLeaseCache()
+		
+		#credit accounting, also responsible for handing out MessageIds
+		#large MTU requests can be charged up to 128 credits (8MiB), the window must be big enough to keep a few of them in flight
+		self.credits = SMBCreditWindow(target = 512)
 		self.MaxTransactSize = 0
 		self.MaxReadSize = 0
 		self.MaxWriteSize = 0
@@ -147,14 +205,37 @@ class SMBConnection:
 		
 		
 		self.SessionId = 0
+		self.PreviousSessionId = 0 #set by reconnect, lets the server clean up the session lost with the old connection
 		self.SessionKey = None
 		
+		#SMB 3.x
+		self.PreauthIntegrityHashValue = None #connection level, the session level hash starts from this value
+		self.SessionPreauthIntegrityHashValue = None
+		self.CipherId = None
+		self.SigningAlgorithmId = None
+		self.signer = None #signer object for the session, created after session setup
+		self.SigningKey = None
+		self.ApplicationKey = None
+		self.EncryptionKey = None
+		self.DecryptionKey = None
+		self.encryption = None #SMBEncryption object, created after session setup if the server supports encryption
+		
+		#SMB 3.x multichannel, additional connections bound to this session. each channel has its own credits, dispatcher and signing key
+		#the session level state (tree and file tables, encryption) is shared with the channels
+		self.channels = []
+		
 		#ignore_close is there to skip the logoff/closing of the channel
 		#this is useful because there could be certain errors after a scusessful logon
 		#that invalidates the whole session (eg. STATUS_USER_SESSION_DELETED)
 		#if this happens then logoff will fail as well!
 		self.session_closed = False 
 		
+		self.generation = 0 #incremented by every successful reconnect
+		self.__reconnect_lock = asyncio.Lock()
+		self.__incoming_task = None
+		
+		self.dispatcher.add_notification_handler(SMB2Command.OPLOCK_BREAK, self.__handle_oplock_break)
+		
 	async def __aenter__(self):
 		return self
 		
@@ -164,29 +245,69 @@ class SMBConnection:
 	def get_extra_info(self):
 		return self.gssapi.get_extra_info()
 		
-	async def __handle_smb_in(self):
+	async def __handle_smb_in(self, netbios_transport, shutdown_evt):
 		"""
 		Waits from SMB messages from the NetBIOSTransport in_queue, and fills the connection table.
 		This function started automatically when calling connect.
 		"""
-		while not self.shutdown_evt.is_set():
-			msg = await self.netbios_transport.in_queue.get()
+		try:
+			while not shutdown_evt.is_set():
+				msg = await netbios_transport.in_queue.get()
+				self.__process_smb_in(msg)
+		
+		except asyncio.CancelledError:
+			pass
+		except Exception as e:
+			logger.exception('__handle_smb_in')
+		finally:
+			#nobody will resolve the outstanding requests anymore, unless the transport was already replaced
+			if self.netbios_transport is netbios_transport:
+				self.dispatcher.fail_all(SMBConnectionTerminated('Connection terminated'))
 			
-			logger.log(1, '__handle_smb_in got new message with Id %s' % msg.header.MessageId)
+	async def __watch_transport(self, network_transport):
+		"""
+		Fails the outstanding requests when the TCP connection is lost
+		"""
+		await network_transport.disconnected.wait()
+		self.__handle_transport_closed(None, network_transport)
 			
-			if isinstance(msg, SMB2Transform):
-				#message is encrypted
-				#this point we should decrypt it and only store the decrypted part in the OutstandingResponses table
-				#but for now we just thropw exception bc encryption is not implemented
-				raise Exception('Encrypted SMBv2 message recieved, but encryption is not yet supported!')
+	def __handle_frame_in(self, msg_data):
+		"""
+		Frame handler of the buffered transport, called directly from the event loop with every incoming NetBIOS frame
+		"""
+		for msg in parse_frame(msg_data):
+			self.__process_smb_in(msg)
 			
-			self.OutstandingResponses[msg.header.MessageId] = msg
-			if msg.header.MessageId in self.OutstandingResponsesEvent:
-				self.OutstandingResponsesEvent[msg.header.MessageId].set()
-			else:
-				#here we are loosing messages, the functionality for "PENDING" and "SHARING_VIOLATION" should be written
-				continue
+	def __handle_transport_closed(self, exc, transport = None):
+		if transport is not None and transport is not self.network_transport:
+			#a transport torn down by disconnect or reconnect
+			return
+		self.credits.close(SMBConnectionTerminated('Connection terminated'))
+		self.dispatcher.fail_all(SMBConnectionTerminated('Connection terminated'))
 			
+	def __process_smb_in(self, msg):
+		if isinstance(msg, SMB2Transform):
+			#message is encrypted, only the decrypted message(s) are dispatched
+			try:
+				msgs = self.decrypt_message(msg)
+			except Exception as e:
+				logger.exception('Failed to decrypt incoming message')
+				return
+			for dmsg in msgs:
+				self.__dispatch_smb_in(dmsg)
+			return
+		
+		self.__dispatch_smb_in(msg)
+			
+	def __dispatch_smb_in(self, msg):
+		logger.log(1, '__handle_smb_in got new message with Id %s' % msg.header.MessageId)
+		
+		if isinstance(msg, SMB2Message):
+			#every reply carries the number of credits granted by the server, interim replies included
+			credits_granted = msg.header.Credit if isinstance(msg.header, SMB2Header_ASYNC) else msg.header.CreditReq
+			self.credits.grant(msg.header.MessageId, credits_granted, is_final = msg.header.Status != NTStatus.PENDING)
+		
+		self.dispatcher.dispatch(msg)
 			
 	async def login(self):
 		"""
@@ -212,6 +333,15 @@ class SMBConnection:
 		"""
 		Establishes socket connection to the remote endpoint. Also starts the internal reading procedures.
 		"""
+		if self.target.buffered_transport == True:
+			#reading, framing and dispatching is done in the event loop callbacks, no queues and tasks needed
+			transport = SMBBufferedTransport(self.__handle_frame_in)
+			transport.close_handler = lambda exc: self.__handle_transport_closed(exc, transport)
+			self.network_transport = transport
+			await self.network_transport.connect(self.target)
+			self.netbios_transport = self.network_transport
+			return
+		
 		self.network_transport = TCPSocket(shutdown_evt = self.shutdown_evt)
 		
 		res = await asyncio.gather(*[self.network_transport.connect(self.target)], return_exceptions=True)
@@ -224,7 +354,8 @@ class SMBConnection:
 		if isinstance(res[0], Exception):
 			raise res[0]
 		
-		asyncio.ensure_future(self.__handle_smb_in())
+		self.__incoming_task = asyncio.ensure_future(self.__handle_smb_in(self.netbios_transport, self.shutdown_evt))
+		asyncio.ensure_future(self.__watch_transport(self.network_transport))
 		
 	async def disconnect(self):
 		"""
@@ -236,13 +367,33 @@ class SMBConnection:
 			return
 		
 		self.status = SMBConnectionStatus.CLOSED
+		await self.__teardown_transport(SMBConnectionTerminated('Connection closed'))
+		
+	async def __teardown_transport(self, exc):
+		"""
+		Fails everything in flight and closes the transports. The transports are detached first,
+		so their late close notifications don't affect a new connection set up by reconnect.
+		"""
+		netbios_transport = self.netbios_transport
+		network_transport = self.network_transport
+		incoming_task = self.__incoming_task
+		self.netbios_transport = None
+		self.network_transport = None
+		self.__incoming_task = None
+		
 		self.shutdown_evt.set()
-		await self.netbios_transport.stop()
-		await self.network_transport.disconnect()
+		self.credits.close(exc)
+		self.dispatcher.fail_all(exc)
+		if incoming_task is not None:
+			incoming_task.cancel()
+		if netbios_transport is not None:
+			await netbios_transport.stop()
+		if network_transport is not None and network_transport is not netbios_transport:
+			await network_transport.disconnect()
 		
 		
 		
-	async def negotiate(self):
+	async def negotiate(self, timeout = None):
 		"""
 		Initiates protocol negotiation.
 		First we send an SMB_COM_NEGOTIATE_REQ with our supported dialects
@@ -262,28 +413,36 @@ class SMBConnection:
 		message_id = await self.sendSMB(msg)
 		
 		#recieveing reply, should be version2, because currently we dont support v1 :(
-		rply = await self.recvSMB(message_id) #negotiate MessageId should be 1
+		rply = await self.recvSMB(message_id, timeout = timeout) #negotiate MessageId should be 1
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			if isinstance(rply, SMB2Message):
 				
+				negotiate_req_data = None
 				if rply.command.DialectRevision == NegotiateDialects.WILDCARD:
 					command = NEGOTIATE_REQ()
 					command.SecurityMode    = NegotiateSecurityMode.SMB2_NEGOTIATE_SIGNING_ENABLED | NegotiateSecurityMode.SMB2_NEGOTIATE_SIGNING_REQUIRED
-					command.Capabilities    = 0
+					command.Capabilities    = NegotiateCapabilities.LARGE_MTU
+					if any(dialect != NegotiateDialects.SMB202 for dialect in self.dialects):
+						command.Capabilities |= NegotiateCapabilities.LEASING
+					if any(dialect in self.dialects for dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]):
+						command.Capabilities |= NegotiateCapabilities.MULTI_CHANNEL
+					if ENCRYPTION_AVAILABLE == True:
+						command.Capabilities |= NegotiateCapabilities.ENCRYPTION
 					command.ClientGuid      = self.ClientGUID
 					command.Dialects        = self.dialects
+					if NegotiateDialects.SMB311 in self.dialects:
+						command.NegotiateContextList = self.__get_negotiate_contexts()
 						
 					header = SMB2Header_SYNC()
 					header.Command  = SMB2Command.NEGOTIATE
-					header.CreditReq = 0
 					
 					msg = SMB2Message(header, command)
 					message_id = await self.sendSMB(msg)
-					rply = await self.recvSMB(message_id) #negotiate MessageId should be 1
+					negotiate_req_data = msg.raw
+					rply = await self.recvSMB(message_id, timeout = timeout) #negotiate MessageId should be 1
 					if rply.header.Status != NTStatus.SUCCESS:
-						print('session got reply!')
-						print(rply)
+						logger.debug('Negotiate failed, reply: %s' % repr(rply))
 						raise Exception('session_setup_1 (authentication probably failed) reply: %s' % rply.header.Status)
 					
 				if rply.command.DialectRevision not in self.supported_dialects:
@@ -293,10 +452,35 @@ class SMBConnection:
 				self.signing_required = NegotiateSecurityMode.SMB2_NEGOTIATE_SIGNING_REQUIRED in rply.command.SecurityMode
 				logger.log(1, 'Server selected dialect: %s' % self.selected_dialect)
 				
-				self.MaxTransactSize = min(0x100000, rply.command.MaxTransactSize)
-				self.MaxReadSize = min(0x100000, rply.command.MaxReadSize)
-				self.MaxWriteSize = min(0x100000, rply.command.MaxWriteSize)
+				self.MaxTransactSize = rply.command.MaxTransactSize
+				self.MaxReadSize = rply.command.MaxReadSize
+				self.MaxWriteSize = rply.command.MaxWriteSize
 				self.ServerGuid = rply.command.ServerGuid
+				self.ServerCapabilities = rply.command.Capabilities
+				#multi-credit requests are only possible from SMB 2.1 on, and only if the server supports them
+				self.SupportsMultiCredit = self.selected_dialect != NegotiateDialects.SMB202 and NegotiateCapabilities.LARGE_MTU in rply.command.Capabilities
+				self.SupportsFileLeasing = self.selected_dialect != NegotiateDialects.SMB202 and NegotiateCapabilities.LEASING in rply.command.Capabilities
+				
+				if self.selected_dialect in [NegotiateDialects.SMB202, NegotiateDialects.SMB210]:
+					self.SigningAlgorithmId = SMB2SigningAlgorithm.HMAC_SHA256
+				else:
+					#can be overridden by the signing capabilities context in 3.1.1
+					self.SigningAlgorithmId = SMB2SigningAlgorithm.AES_CMAC
+				
+				if self.selected_dialect == NegotiateDialects.SMB311:
+					self.PreauthIntegrityHashValue = hashlib.sha512(b'\x00'*64 + negotiate_req_data).digest()
+					self.PreauthIntegrityHashValue = hashlib.sha512(self.PreauthIntegrityHashValue + rply.raw).digest()
+					for ctx in rply.command.NegotiateContextList:
+						if ctx.ContextType == SMB2ContextType.SMB2_ENCRYPTION_CAPABILITIES and ctx.Data.CipherCount > 0:
+							self.CipherId = ctx.Data.Ciphers[0]
+						elif ctx.ContextType == SMB2ContextType.SMB2_SIGNING_CAPABILITIES and ctx.Data.SigningAlgorithmCount > 0:
+							self.SigningAlgorithmId = ctx.Data.SigningAlgorithms[0]
+				
+				elif self.selected_dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302]:
+					if NegotiateCapabilities.ENCRYPTION in rply.command.Capabilities:
+						self.CipherId = SMB2Cipher.AES_128_CCM
+				
+				self.SupportsEncryption = self.CipherId is not None
 				self.SupportsMultiChannel = NegotiateCapabilities.MULTI_CHANNEL in rply.command.Capabilities
 				
 			else:
@@ -304,15 +488,77 @@ class SMBConnection:
 				raise SMBUnsupportedSMBVersion()
 			
 		else:
-			print('session got reply!')
-			print(rply)
+			logger.debug('Negotiate failed, reply: %s' % repr(rply))
 			raise Exception('session_setup_1 (authentication probably failed) reply: %s' % rply.header.Status)
 			
 			
 			
 		self.status = SMBConnectionStatus.SESSIONSETUP
 		
-	async def session_setup(self, fake_auth = False):
+	def __get_negotiate_contexts(self):
+		"""
+		Negotiate contexts sent in the SMB 3.1.1 NEGOTIATE request
+		"""
+		preauth = SMB2PreauthIntegrityCapabilities()
+		preauth.HashAlgorithms = [SMB2HashAlgorithm.SHA_512]
+		preauth.Salt = os.urandom(32)
+		contexts = [SMB2NegotiateContext(SMB2ContextType.SMB2_PREAUTH_INTEGRITY_CAPABILITIES, preauth)]
+		
+		if ENCRYPTION_AVAILABLE == True:
+			encryption = SMB2EncryptionCapabilities()
+			encryption.Ciphers = [SMB2Cipher.AES_128_GCM, SMB2Cipher.AES_128_CCM]
+			contexts.append(SMB2NegotiateContext(SMB2ContextType.SMB2_ENCRYPTION_CAPABILITIES, encryption))
+		
+		if SIGNING_AES_AVAILABLE == True:
+			signing = SMB2SigningCapabilities()
+			signing.SigningAlgorithms = [SMB2SigningAlgorithm.AES_GMAC, SMB2SigningAlgorithm.AES_CMAC]
+			contexts.append(SMB2NegotiateContext(SMB2ContextType.SMB2_SIGNING_CAPABILITIES, signing))
+		
+		return contexts
+		
+	def __update_session_preauth_hash(self, data):
+		if self.selected_dialect == NegotiateDialects.SMB311:
+			self.SessionPreauthIntegrityHashValue = hashlib.sha512(self.SessionPreauthIntegrityHashValue + data).digest()
+		
+	def __derive_session_keys(self):
+		"""
+		Derives the SMB 3.x signing/encryption keys from the session key and sets up the signer and the encryption for the session
+		"""
+		if self.selected_dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302]:
+			self.SigningKey      = KDF_CounterMode(self.SessionKey, b"SMB2AESCMAC\x00", b"SmbSign\x00", 128)
+			self.ApplicationKey  = KDF_CounterMode(self.SessionKey, b"SMB2APP\x00", b"SmbRpc\x00", 128)
+			self.EncryptionKey   = KDF_CounterMode(self.SessionKey, b"SMB2AESCCM\x00", b"ServerIn \x00", 128)
+			self.DecryptionKey   = KDF_CounterMode(self.SessionKey, b"SMB2AESCCM\x00", b"ServerOut\x00", 128)
+		
+		elif self.selected_dialect == NegotiateDialects.SMB311:
+			self.SigningKey      = KDF_CounterMode(self.SessionKey, b"SMBSigningKey\x00", self.SessionPreauthIntegrityHashValue, 128)
+			self.ApplicationKey  = KDF_CounterMode(self.SessionKey, b"SMBAppKey\x00", self.SessionPreauthIntegrityHashValue, 128)
+			self.EncryptionKey   = KDF_CounterMode(self.SessionKey, b"SMBC2SCipherKey\x00", self.SessionPreauthIntegrityHashValue, 128)
+			self.DecryptionKey   = KDF_CounterMode(self.SessionKey, b"SMBS2CCipherKey\x00", self.SessionPreauthIntegrityHashValue, 128)
+		
+		else:
+			self.signer = get_signer(SMB2SigningAlgorithm.HMAC_SHA256, self.SessionKey)
+			return
+		
+		try:
+			self.signer = get_signer(self.SigningAlgorithmId, self.SigningKey)
+		except Exception as e:
+			#only a problem if the server asks for signing, sign_message will raise then
+			logger.debug('No signer available for %s: %s' % (self.SigningAlgorithmId, e))
+		
+		if self.CipherId is not None and ENCRYPTION_AVAILABLE == True:
+			self.encryption = SMBEncryption(self.CipherId, self.EncryptionKey, self.DecryptionKey)
+		
+	async def session_setup(self, fake_auth = False, timeout = None, bind_to = None):
+		"""
+		bind_to: SMBConnection holding an established SMB 3.x session, this connection will be bound to it as a new channel
+		"""
+		self.SessionPreauthIntegrityHashValue = self.PreauthIntegrityHashValue
+		if bind_to is not None:
+			#binding requests carry the existing SessionId and must be signed with the session's signing key
+			self.SessionId = bind_to.SessionId
+			self.signer = bind_to.signer
+			self.signing_required = True
 		
 		authdata = None
 		status = NTStatus.MORE_PROCESSING_REQUIRED
@@ -333,21 +579,21 @@ class SMBConnection:
 					raise e
 					#raise SMBKerberosPreauthFailed()
 			
-			command.Flags = 0
+			command.Flags = SessionSetupFlag.SMB2_SESSION_FLAG_BINDING if bind_to is not None else 0
 			command.SecurityMode = NegotiateSecurityMode.SMB2_NEGOTIATE_SIGNING_ENABLED
 			command.Capabilities = 0
 			command.Channel      = 0
-			command.PreviousSessionId    = 0
+			command.PreviousSessionId    = self.PreviousSessionId
 			
 			header = SMB2Header_SYNC()
 			header.Command  = SMB2Command.SESSION_SETUP
-			header.CreditReq = 127
 			
-			msg = SMBMessage(header, command)
+			msg = SMB2Message(header, command)
 			message_id = await self.sendSMB(msg)
+			#the binding request is signed, the hash has to cover the signature as well
+			self.__update_session_preauth_hash(msg.raw)
 			
-			
-			rply = await self.recvSMB(message_id)
+			rply = await self.recvSMB(message_id, timeout = timeout)
 			
 			if self.SessionId == 0:
 				self.SessionId = rply.header.SessionId
@@ -355,19 +601,29 @@ class SMBConnection:
 			if rply.header.Status not in [NTStatus.SUCCESS, NTStatus.MORE_PROCESSING_REQUIRED]:
 				break
 			
+			if rply.header.Status == NTStatus.MORE_PROCESSING_REQUIRED:
+				#the final (successful) reply is not part of the preauth hash
+				self.__update_session_preauth_hash(rply.raw)
+			
 			authdata = rply.command.Buffer
 			status = rply.header.Status
 			maxiter -= 1
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			self.SessionKey = self.gssapi.get_session_key()[:16]
+			self.__derive_session_keys()
+			self.SessionFlags = rply.command.SessionFlags
+			
+			if SessionFlags.SMB2_SESSION_FLAG_ENCRYPT_DATA in rply.command.SessionFlags:
+				self.encryption_required = True
 			
-			# TODO: key calc
-			if self.signing_required and self.selected_dialect in [NegotiateDialects.SMB300 , NegotiateDialects.SMB302 , NegotiateDialects.SMB311]:
-				self.SigningKey      = crypto.KDF_CounterMode(self.SessionKey, b"SMB2AESCMAC\x00", "SmbSign\x00", 128)
-				self.ApplicationKey  = crypto.KDF_CounterMode(self.SessionKey, b"SMB2APP\x00", "SmbRpc\x00", 128)
-				self.EncryptionKey   = crypto.KDF_CounterMode(self.SessionKey, b"SMB2AESCCM\x00", "ServerIn \x00", 128)
-				self.DecryptionKey   = crypto.KDF_CounterMode(self.SessionKey, b"SMB2AESCCM\x00", "ServerOut\x00", 128)
+			if bind_to is not None:
+				#only the signing key belongs to the channel, encryption keys are session wide
+				self.ApplicationKey = bind_to.ApplicationKey
+				self.EncryptionKey = bind_to.EncryptionKey
+				self.DecryptionKey = bind_to.DecryptionKey
+				self.encryption = bind_to.encryption
+				self.encryption_required = bind_to.encryption_required
 			
 			self.status = SMBConnectionStatus.RUNNING
 		
@@ -379,94 +635,239 @@ class SMBConnection:
 			
 		
 		
-	async def recvSMB(self, message_id):
+	async def recvSMB(self, message_id, timeout = None):
 		"""
-		Returns an SMB message from the outstandingresponse dict, OR waits until the expected message_id appears.
+		Waits for the final reply to the request with message_id. Interim (STATUS_PENDING) replies are handled by the dispatcher.
+		timeout: seconds to wait for the reply, defaults to self.timeout. On expiry the request is cancelled on the server side,
+		its credits are freed up and SMBRequestTimeoutException is raised.
 		"""
-		if message_id not in self.OutstandingResponses:
-			#print('Waiting on messageID : %s' % message_id)
-			await self.OutstandingResponsesEvent[message_id].wait()
+		if timeout is None:
+			timeout = self.timeout
+		try:
+			return await self.dispatcher.wait(message_id, timeout = timeout)
+		except asyncio.TimeoutError:
+			async_id = self.dispatcher.get_async_id(message_id)
+			self.dispatcher.forget(message_id)
+			self.credits.release(message_id)
+			if self.status == SMBConnectionStatus.RUNNING:
+				try:
+					await self.cancel(message_id, async_id = async_id)
+				except Exception:
+					logger.debug('Failed to cancel request with MessageId %s' % message_id)
+			raise SMBRequestTimeoutException('No reply for MessageId %s in %s seconds' % (message_id, timeout))
 		
-		msg = self.OutstandingResponses.pop(message_id)
 		
-		if msg.header.Status != NTStatus.PENDING:
-			if message_id in self.OutstandingResponsesEvent:
-				del self.OutstandingResponsesEvent[message_id]
-		else:
-			self.OutstandingResponsesEvent[message_id].clear()
+	def sign_message(self, data):
+		"""
+		Signs one serialized SMB2 message in place.
+		data: writable buffer (bytearray or memoryview of one) holding exactly one message, including the compound padding if any
+		"""
+		if self.signer is None:
+			if not self.SessionKey:
+				#session setup is not finished yet
+				return
+			raise SMBUnsupportedDialectSign()
 		
-		return msg
+		flags = int.from_bytes(data[16:20], byteorder = 'little', signed = False) | SMB2HeaderFlag.SMB2_FLAGS_SIGNED
+		data[16:20] = flags.to_bytes(4, byteorder = 'little', signed = False)
+		data[48:64] = b'\x00'*16
+		data[48:64] = self.signer.sign(data)
 		
 		
-	def sign_message(self, msg):
-		if self.selected_dialect in [NegotiateDialects.SMB202, NegotiateDialects.SMB210]:
-			if self.SessionKey:
-				msg.header.Flags = msg.header.Flags ^ SMB2HeaderFlag.SMB2_FLAGS_SIGNED ##maybe move this flag settings to sendsmb since singing is determined there?
-				digest = hmac.new(self.SessionKey, msg.to_bytes(), hashlib.sha256).digest()
-				msg.header.Signature = digest[:16]
-		else:
-			raise SMBUnsupportedDialectSign()
+	def is_encryption_needed(self, tree_id):
+		"""
+		Messages must be encrypted if the whole session requires it or the tree connect was made to a share requiring encryption
+		"""
+		if self.encryption_required == True:
+			return True
+		if tree_id in self.TreeConnectTable_id and self.TreeConnectTable_id[tree_id].encrypt == True:
+			return True
+		return False
 		
+	def is_signing_needed(self, command):
+		"""
+		Messages are signed if the server requires it. SMB 3.1.1 clients always sign TREE_CONNECT of authenticated sessions,
+		the server drops the connection on an unsigned one.
+		"""
+		if self.signing_required == True:
+			return True
+		if command == SMB2Command.TREE_CONNECT and self.selected_dialect == NegotiateDialects.SMB311 and self.signer is not None:
+			if self.SessionFlags & (SessionFlags.SMB2_SESSION_FLAG_IS_GUEST | SessionFlags.SMB2_SESSION_FLAG_IS_NULL) == 0:
+				return True
+		return False
+		
+	def encrypt_message(self, data):
+		"""
+		Encrypts the serialized SMB2 message (or compound) and returns the transform message to be sent instead
+		"""
+		if self.encryption is None:
+			raise SMBException('Server requires encryption but it is not available (cryptography package missing or no common cipher)')
+		
+		return self.encryption.encrypt(data, self.SessionId)
+		
+	def decrypt_message(self, msg):
+		"""
+		Decrypts the incoming SMB2Transform message, returns the list of SMB2Messages in it (it may be compounded)
+		"""
+		if self.encryption is None:
+			raise SMBException('Encrypted message received but encryption is not set up on this connection')
+		if msg.header.SessionId != self.SessionId:
+			raise SMBException('Encrypted message received for unknown session %s' % msg.header.SessionId)
+		
+		data = self.encryption.decrypt(msg.header, msg.data)
+		return SMB2Message.from_compound_bytes(data)
 		
 	async def sendSMB(self, msg):
 		"""
 		Sends an SMB message to teh remote endpoint.
+		Reserves the credits needed for the message first, this might block if the server's credit window is exhausted.
 		msg: SMB2Message or SMBMessage
 		Returns: MessageId integer
 		"""
 		if self.status == SMBConnectionStatus.NEGOTIATING:
 			if isinstance(msg, SMBMessage):
-				#creating an event for outstanding response
-				self.OutstandingResponsesEvent[0] = asyncio.Event()
-				await self.netbios_transport.out_queue.put(msg)
-				self.SequenceWindow += 1
-				return 0
+				#SMBv1 negotiate, no credit fields in the header but it still consumes MessageId 0
+				message_id, _ = await self.credits.reserve(1)
+				self.dispatcher.register(message_id)
+				await self.netbios_transport.send(msg.to_bytes())
+				return message_id
 			else:
 				msg.header.CreditCharge = 1
-				msg.header.CreditReq = 127
-				msg.header.MessageId = self.SequenceWindow
-				message_id = self.SequenceWindow
-				self.SequenceWindow += 1
+				message_id, msg.header.CreditReq = await self.credits.reserve(1)
+				msg.header.MessageId = message_id
 				
-				self.OutstandingResponsesEvent[message_id] = asyncio.Event()
-				await self.netbios_transport.out_queue.put(msg)
+				msg.raw = msg.to_bytes()
+				self.dispatcher.register(message_id)
+				await self.netbios_transport.send(msg.raw)
 				return message_id
 				
 
-		if msg.header.Command is not SMB2Command.CANCEL:
-			msg.header.MessageId = self.SequenceWindow
-			self.SequenceWindow += 1
-		
-		msg.header.SessionId = self.SessionId
-		
 		if not msg.header.CreditCharge:
 			msg.header.CreditCharge = 1
 		
-		if self.status != SMBConnectionStatus.SESSIONSETUP:
-			msg.header.CreditReq = 127
+		if msg.header.Command is not SMB2Command.CANCEL:
+			#CANCEL reuses the MessageId of the request to be cancelled and doesn't consume credits
+			msg.header.MessageId, msg.header.CreditReq = await self.credits.reserve(msg.header.CreditCharge)
+		elif isinstance(msg.header, SMB2Header_ASYNC):
+			msg.header.Credit = 0
+		else:
+			msg.header.CreditReq = 0
+		
+		msg.header.SessionId = self.SessionId
 		
 		message_id = msg.header.MessageId
 		
-		if self.signing_required == True:
-			self.sign_message(msg)
+		#the message is serialized only once, signing and encryption work on the serialized buffer
+		data = msg.to_bytes()
+		#the message as it was sent (signed, before encryption), SMB 3.1.1 preauth integrity needs these bytes
+		msg.raw = data
+		if self.is_encryption_needed(getattr(msg.header, 'TreeId', 0)) == True:
+			#encrypted messages are not signed
+			data = self.encrypt_message(data)
 		
-		if self.encryption_required == True:
-			raise Exception('SMB Encryption not implemented yet :(')
-			#self.encrypt_message(msg)
+		elif self.is_signing_needed(msg.header.Command) == True:
+			#signs msg.raw as well, it is the same buffer
+			self.sign_message(data)
 		
-		#creating an event for outstanding response
-		self.OutstandingResponsesEvent[message_id] = asyncio.Event()
+		if msg.header.Command is not SMB2Command.CANCEL:
+			#CANCEL has no reply of its own, the cancelled request gets the reply
+			self.dispatcher.register(message_id)
 		
-		await self.netbios_transport.out_queue.put(msg)
+		await self.netbios_transport.send(data)
 		
 		return message_id
 		
-	async def tree_connect(self, share_name):
+	async def sendSMBCompound(self, msgs, related = True):
+		"""
+		Sends multiple SMB2 messages in one compounded transport frame.
+		msgs: list of SMB2Message
+		related: marks all messages after the first one as related operations, those can use SMB2_RELATED_FILE_ID as FileId
+		Returns: list of MessageIds in the order of msgs
+		"""
+		message_ids = []
+		try:
+			for i, msg in enumerate(msgs):
+				if not msg.header.CreditCharge:
+					msg.header.CreditCharge = 1
+				msg.header.MessageId, msg.header.CreditReq = await self.credits.reserve(msg.header.CreditCharge)
+				message_ids.append(msg.header.MessageId)
+				msg.header.SessionId = self.SessionId
+				if related == True and i > 0:
+					msg.header.Flags |= SMB2HeaderFlag.SMB2_FLAGS_RELATED_OPERATIONS
+			
+			#NextCommand fields are filled in while serializing
+			data = SMB2Compound(msgs).to_bytes()
+			
+			if self.is_encryption_needed(msgs[0].header.TreeId) == True:
+				#the whole chain is encrypted as one message
+				data = self.encrypt_message(data)
+			
+			elif self.signing_required == True:
+				#every message is signed separately, padding included
+				view = memoryview(data)
+				offset = 0
+				for msg in msgs:
+					end = offset + msg.header.NextCommand if msg.header.NextCommand != 0 else len(data)
+					self.sign_message(view[offset:end])
+					offset = end
+				view.release()
+		
+		except BaseException:
+			#nothing was sent, the credits reserved so far can be used again. Newest first, so the MessageIds can be rolled back
+			for message_id in reversed(message_ids):
+				self.credits.release(message_id, refund = True)
+			raise
+		
+		for message_id in message_ids:
+			self.dispatcher.register(message_id)
+		
+		await self.netbios_transport.send(data)
+		
+		return message_ids
+		
+	async def compound(self, msgs, related = True, timeout = None):
+		"""
+		Sends the messages as one compound request and waits for all replies.
+		Returns the list of final (non-PENDING) replies in the order of msgs. Error checking is up to the caller,
+		in a related compound a failing operation makes all subsequent operations fail with the same status.
+		"""
+		if self.session_closed == True:
+			raise SMBConnectionTerminated('Session closed')
+		
+		message_ids = await self.sendSMBCompound(msgs, related = related)
+		replies = []
+		for i, message_id in enumerate(message_ids):
+			try:
+				rply = await self.recvSMB(message_id, timeout = timeout)
+			except SMBRequestTimeoutException:
+				#the rest of the chain is abandoned as well
+				for mid in message_ids[i+1:]:
+					self.dispatcher.forget(mid)
+					self.credits.release(mid)
+				raise
+			replies.append(rply)
+		return replies
+		
+	async def tree_connect(self, share_name, timeout = None):
 		"""
 		share_name MUST be in "\\server\share" format! Server can be NetBIOS name OR IP4 OR IP6 OR FQDN
+		If the share is already connected the existing tree is reused and its reference count is incremented.
+		Every successful call must be paired with a tree_disconnect.
 		"""
 		if self.session_closed == True:
-			return
+			raise SMBConnectionTerminated('Session closed')
+		
+		if share_name not in self.__tree_connect_locks:
+			self.__tree_connect_locks[share_name] = asyncio.Lock()
+		async with self.__tree_connect_locks[share_name]:
+			if share_name in self.TreeConnectTable_share:
+				te = self.TreeConnectTable_share[share_name]
+				te.number_of_users += 1
+				return te
+			
+			return await self.__tree_connect(share_name, timeout)
+		
+	async def __tree_connect(self, share_name, timeout):
 		command = TREE_CONNECT_REQ()
 		command.Path = share_name
 		command.Flags = 0
@@ -474,10 +875,10 @@ class SMBConnection:
 		header = SMB2Header_SYNC()
 		header.Command  = SMB2Command.TREE_CONNECT
 		
-		msg = SMBMessage(header, command)
+		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 		
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			te = TreeEntry.from_tree_reply(rply, share_name)
@@ -496,13 +897,7 @@ class SMBConnection:
 		else:
 			raise SMBGenericException()
 		
-	async def create(self, tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level = ImpersonationLevel.Impersonation, oplock_level = OplockLevel.SMB2_OPLOCK_LEVEL_NONE, create_contexts = None, return_reply = False):
-		if self.session_closed == True:
-			return
-		
-		if tree_id not in self.TreeConnectTable_id:
-			raise Exception('Unknown Tree ID!')
-		
+	async def __create_request(self, tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level, oplock_level, create_contexts, timeout):
 		command = CREATE_REQ()
 		command.RequestedOplockLevel  = oplock_level
 		command.ImpersonationLevel  = impresonation_level
@@ -512,19 +907,60 @@ class SMBConnection:
 		command.CreateDisposition       = create_disposition
 		command.CreateOptions        = create_options
 		command.Name = file_path
-		command.CreateContext = create_contexts
+		command.CreateContext = create_contexts if create_contexts else None
 		
 		header = SMB2Header_SYNC()
 		header.Command  = SMB2Command.CREATE
 		header.TreeId = tree_id
 		
-		msg = SMBMessage(header, command)
+		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 		
-		rply = await self.recvSMB(message_id)
+		return await self.recvSMB(message_id, timeout = timeout)
+		
+	async def create(self, tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level = ImpersonationLevel.Impersonation, oplock_level = OplockLevel.SMB2_OPLOCK_LEVEL_NONE, create_contexts = None, return_reply = False, timeout = None, durable = False, durable_timeout = 0, lease_state = None):
+		"""
+		create_contexts: list of SMB2_CREATE_CONTEXT objects to send with the request
+		lease_state: LeaseState flags to ask for (SMB 2.1+). With read caching granted, reads and file information queries on the handle
+		are served from lease_cache when possible. Ignored if the server doesn't support leasing.
+		durable: asks for a durable handle (v2 on SMB 3.x, v1 otherwise) which can be reclaimed by reconnect after a network failure.
+		The server only makes the handle durable with a batch oplock, so it is requested if no oplock was given.
+		durable_timeout: milliseconds the server keeps the durable handle after a disconnect, 0 lets the server decide (v2 only)
+		"""
+		if self.session_closed == True:
+			return
+		
+		if tree_id not in self.TreeConnectTable_id:
+			raise Exception('Unknown Tree ID!')
+		
+		contexts = SMB2CreateContextList(create_contexts if create_contexts is not None else [])
+		if lease_state is not None and self.SupportsFileLeasing is True:
+			lease_key = self.lease_cache.get_lease_key(self.TreeConnectTable_id[tree_id].share_name, file_path)
+			contexts.append(self.__get_lease_context(lease_key, lease_state))
+			oplock_level = OplockLevel.SMB2_OPLOCK_LEVEL_LEASE
+		
+		create_guid = None
+		if durable is True:
+			if oplock_level == OplockLevel.SMB2_OPLOCK_LEVEL_NONE:
+				oplock_level = OplockLevel.SMB2_OPLOCK_LEVEL_BATCH
+			if self.selected_dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]:
+				create_guid = GUID.random()
+				request = SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2()
+				request.Timeout = durable_timeout
+				request.CreateGuid = create_guid
+				contexts.append(SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2, request))
+			else:
+				contexts.append(SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_REQUEST, SMB2_CREATE_DURABLE_HANDLE_REQUEST()))
+		
+		rply = await self.__create_request(tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level, oplock_level, contexts, timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			fh = FileHandle.from_create_reply(rply, tree_id, file_path, oplock_level)
+			if fh.is_durable == True:
+				fh.create_guid = create_guid
+				fh.create_params = (desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level)
+			if fh.lease_key is not None:
+				self.lease_cache.opened(fh.lease_key, fh.lease_state, fh.lease_epoch, rply.command)
 			self.FileHandleTable[fh.file_id] = fh
 			
 			if return_reply == True:
@@ -537,20 +973,302 @@ class SMBConnection:
 			
 		else:
 			raise SMBGenericException()
-	
-	async def read(self, tree_id, file_id, offset = 0, length = 0):
-		"""
-		Will issue one read command only then waits for reply. To read a whole file you must use a filereader logic! 
-		returns the data bytes and the remaining data length
+			
+	def __get_lease_context(self, lease_key, lease_state):
+		if self.selected_dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]:
+			request = SMB2_CREATE_REQUEST_LEASE_V2()
+		else:
+			request = SMB2_CREATE_REQUEST_LEASE()
+		request.LeaseKey = lease_key
+		request.LeaseState = lease_state
+		return SMB2_CREATE_CONTEXT(SMB2CreateContextName.REQUEST_LEASE, request)
 		
-		IMPORTANT: remaning data length is dependent on the length of the requested chunk (length param) not on the actual file length.
-		to get the remaining length for the actual file you must set the length parameter to the correct file size!
+	async def __reclaim_handle(self, fh, tree_id, timeout = None):
+		"""
+		Reopens a durable handle on the new connection, returns the CREATE reply or None if the server doesn't have it anymore
+		"""
+		if fh.durable_version == 2:
+			request = SMB2_CREATE_DURABLE_HANDLE_RECONNECT_V2()
+			request.FileId = fh.file_id
+			request.CreateGuid = fh.create_guid
+			ctx = SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_RECONNECT_V2, request)
+		else:
+			request = SMB2_CREATE_DURABLE_HANDLE_RECONNECT()
+			request.FileId = fh.file_id
+			ctx = SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_RECONNECT, request)
+		
+		contexts = SMB2CreateContextList([ctx])
+		if fh.lease_key is not None:
+			#the lease the handle was opened with must be asked for again
+			contexts.append(self.__get_lease_context(fh.lease_key, fh.lease_state))
+		
+		desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level = fh.create_params
+		rply = await self.__create_request(tree_id, fh.file_name, desired_access, share_mode, create_options, create_disposition, file_attrs, impresonation_level, fh.oplock_level, contexts, timeout)
+		if rply.header.Status != NTStatus.SUCCESS:
+			logger.debug('Failed to reclaim durable handle of %s, status %s' % (fh.file_name, rply.header.Status))
+			return None
+		return rply.command
 		
-		If and EOF happens the function returns an empty byte array and the remaining data is set to 0
+	def __handle_oplock_break(self, msg):
 		"""
-		if self.session_closed == True:
+		Acknowledges oplock break notifications of our handles, the server holds back the competing open until then.
+		"""
+		notification = msg.command
+		if isinstance(notification, LEASE_BREAK_NOTIFICATION):
+			return self.__handle_lease_break(notification)
+		if not isinstance(notification, OPLOCK_BREAK_NOTIFICATION) or notification.FileId not in self.FileHandleTable:
 			return
+		fh = self.FileHandleTable[notification.FileId]
+		fh.oplock_level = notification.OplockLevel
+		if notification.OplockLevel != OplockLevel.SMB2_OPLOCK_LEVEL_BATCH:
+			#without a batch oplock the handle doesn't survive a disconnect
+			fh.is_durable = False
+		return self.__acknowledge_oplock_break(fh.tree_id, notification.FileId, notification.OplockLevel)
+		
+	async def __acknowledge_oplock_break(self, tree_id, file_id, oplock_level):
+		try:
+			command = OPLOCK_BREAK_NOTIFICATION()
+			command.OplockLevel = oplock_level
+			command.FileId = file_id
+			
+			header = SMB2Header_SYNC()
+			header.Command  = SMB2Command.OPLOCK_BREAK
+			header.TreeId = tree_id
+			msg = SMB2Message(header, command)
+			message_id = await self.sendSMB(msg)
+			await self.recvSMB(message_id)
+		except Exception as e:
+			logger.debug('Failed to acknowledge oplock break. Reason: %s' % e)
 			
+	def __handle_lease_break(self, notification):
+		"""
+		Drops the cached data of the file if read caching is lost, then acknowledges the break if the server asks for it
+		"""
+		self.lease_cache.lease_break(notification.LeaseKey, notification.NewLeaseState, notification.NewEpoch)
+		tree_id = 0
+		for fh in self.FileHandleTable.values():
+			if fh.lease_key == notification.LeaseKey:
+				fh.lease_state = notification.NewLeaseState
+				if LeaseState.SMB2_LEASE_HANDLE_CACHING not in notification.NewLeaseState:
+					#a leased handle is only durable with handle caching
+					fh.is_durable = False
+				tree_id = fh.tree_id
+		if LeaseBreakFlag.SMB2_NOTIFY_BREAK_LEASE_FLAG_ACK_REQUIRED in notification.Flags:
+			return self.__acknowledge_lease_break(tree_id, notification.LeaseKey, notification.NewLeaseState)
+		
+	async def __acknowledge_lease_break(self, tree_id, lease_key, lease_state):
+		try:
+			command = LEASE_BREAK_ACK()
+			command.LeaseKey = lease_key
+			command.LeaseState = lease_state
+			
+			header = SMB2Header_SYNC()
+			header.Command  = SMB2Command.OPLOCK_BREAK
+			header.TreeId = tree_id
+			msg = SMB2Message(header, command)
+			message_id = await self.sendSMB(msg)
+			await self.recvSMB(message_id)
+		except Exception as e:
+			logger.debug('Failed to acknowledge lease break. Reason: %s' % e)
+			
+	async def reconnect(self, generation = None, timeout = None):
+		"""
+		Re-establishes the connection and the session after a network failure, then connects the trees again and reclaims the durable handles.
+		TreeConnectTable and FileHandleTable keep their entries with the new ids, handles that could not be reclaimed are dropped.
+		generation: the value of self.generation seen before the failure. If another task already reconnected since, nothing is done.
+		"""
+		async with self.__reconnect_lock:
+			if generation is not None and generation != self.generation:
+				return
+			
+			trees = list(self.TreeConnectTable_id.values())
+			handles = list(self.FileHandleTable.values())
+			channel_targets = [channel.target for channel in self.channels]
+			for channel in self.channels:
+				try:
+					await channel.disconnect()
+				except:
+					pass
+			self.channels = []
+			
+			await self.__teardown_transport(SMBConnectionTerminated('Connection reset'))
+			
+			#everything session related starts from scratch, only the notification handlers are kept
+			notification_handlers = self.dispatcher.notification_handlers
+			self.dispatcher = SMBResponseDispatcher()
+			self.dispatcher.notification_handlers = notification_handlers
+			self.credits = SMBCreditWindow(target = self.credits.target)
+			self.shutdown_evt = asyncio.Event()
+			self.gssapi = copy.deepcopy(self.original_gssapi)
+			self.status = SMBConnectionStatus.NEGOTIATING
+			self.PreviousSessionId = self.SessionId
+			self.SessionId = 0
+			self.SessionKey = None
+			self.signer = None
+			self.encryption = None
+			self.signing_required = False
+			self.encryption_required = False
+			self.SessionFlags = 0
+			self.PreauthIntegrityHashValue = None
+			self.CipherId = None
+			self.session_closed = False
+			self.TreeConnectTable_id.clear()
+			self.TreeConnectTable_share.clear()
+			self.FileHandleTable.clear()
+			#the leases are gone with the session, the files could have been changed in the meantime
+			self.lease_cache.reset()
+			
+			await self.connect()
+			await self.negotiate(timeout = timeout)
+			await self.session_setup(timeout = timeout)
+			self.PreviousSessionId = 0
+			
+			tree_ids = {} #old tree_id -> new tree_id
+			for te in trees:
+				try:
+					new_te = await self.__tree_connect(te.share_name, timeout)
+				except Exception as e:
+					logger.debug('Failed to reconnect tree %s. Reason: %s' % (te.share_name, e))
+					continue
+				new_te.number_of_users = te.number_of_users
+				tree_ids[te.tree_id] = new_te.tree_id
+			
+			for fh in handles:
+				if fh.is_durable is False or fh.tree_id not in tree_ids:
+					continue
+				try:
+					reply = await self.__reclaim_handle(fh, tree_ids[fh.tree_id], timeout = timeout)
+				except Exception as e:
+					logger.debug('Failed to reclaim durable handle of %s. Reason: %s' % (fh.file_name, e))
+					continue
+				if reply is None:
+					continue
+				#the FileHandle object is kept, its users can pick up the new ids from it
+				fh.file_id = reply.FileId
+				fh.tree_id = tree_ids[fh.tree_id]
+				if fh.lease_key is not None:
+					lease_ctx = reply.CreateContext.get(SMB2CreateContextName.REQUEST_LEASE) if reply.CreateContext is not None else None
+					if lease_ctx is not None:
+						fh.lease_state = LeaseState(lease_ctx.Data.LeaseState)
+						self.lease_cache.opened(fh.lease_key, fh.lease_state, getattr(lease_ctx.Data, 'Epoch', 0), reply)
+					else:
+						fh.lease_key = None
+				self.FileHandleTable[fh.file_id] = fh
+			
+			self.generation += 1
+			
+			for target in channel_targets:
+				try:
+					await self.bind_channel(target = target, timeout = timeout)
+				except Exception as e:
+					logger.debug('Failed to bind channel again. Reason: %s' % e)
+	
+	def select_channel(self):
+		"""
+		Returns the channel the next read/write should go to: this connection or one of the bound channels, whichever has the most credits to spend
+		"""
+		best = self
+		best_score = self.credits.available - self.credits.pending
+		for channel in self.channels:
+			if channel.status != SMBConnectionStatus.RUNNING or channel.credits.closed is True:
+				continue
+			score = channel.credits.available - channel.credits.pending
+			if score > best_score:
+				best = channel
+				best_score = score
+		return best
+		
+	def get_granted_credits(self):
+		"""
+		Credits owned on this connection and all usable bound channels together
+		"""
+		granted = self.credits.granted
+		for channel in self.channels:
+			if channel.status == SMBConnectionStatus.RUNNING and channel.credits.closed is False:
+				granted += channel.credits.granted
+		return granted
+		
+	async def bind_channel(self, target = None, timeout = None):
+		"""
+		Opens a new TCP connection and binds it to the current session as an additional channel (SMB 3.x multichannel).
+		target: SMBTarget of the other server interface to use, defaults to the target of this connection
+		Reads and writes are spread over all channels afterwards. Returns the new channel.
+		"""
+		if self.status != SMBConnectionStatus.RUNNING:
+			raise SMBException('Session must be established before binding channels')
+		if self.selected_dialect not in [NegotiateDialects.SMB300, NegotiateDialects.SMB302, NegotiateDialects.SMB311]:
+			raise SMBMultiChannelNotSupported('Multichannel requires SMB 3.x, negotiated dialect is %s' % self.selected_dialect)
+		if self.SupportsMultiChannel is False:
+			raise SMBMultiChannelNotSupported('Server does not support multichannel')
+		
+		channel = SMBConnection(copy.deepcopy(self.original_gssapi), target if target is not None else self.target, dialects = [self.selected_dialect], shutdown_evt = asyncio.Event())
+		#the server finds the session by SessionId, but the channel must come from the same client and negotiate the same dialect
+		channel.ClientGUID = self.ClientGUID
+		channel.timeout = self.timeout
+		try:
+			await channel.connect()
+			await channel.negotiate(timeout = timeout)
+			if channel.selected_dialect != self.selected_dialect or channel.ServerGuid.to_bytes() != self.ServerGuid.to_bytes():
+				raise SMBMultiChannelNotSupported('Channel negotiated a different dialect or server')
+			await channel.session_setup(timeout = timeout, bind_to = self)
+		except:
+			try:
+				await channel.disconnect()
+			except:
+				pass
+			raise
+		
+		channel.TreeConnectTable_id = self.TreeConnectTable_id
+		channel.TreeConnectTable_share = self.TreeConnectTable_share
+		channel.FileHandleTable = self.FileHandleTable
+		channel.lease_cache = self.lease_cache
+		self.channels.append(channel)
+		return channel
+		
+	def __get_max_io_size(self, server_max):
+		"""
+		Without multi-credit support every request is limited to 64KiB.
+		With multi-credit support a request can be as large as the server allows, but its credit charge (one credit per 64KiB)
+		can't be more than the credits we own, otherwise it would wait for credits forever.
+		"""
+		if self.SupportsMultiCredit == True:
+			return min(server_max, max(1, self.credits.granted) * 65536)
+		return min(65536, server_max)
+		
+	def get_max_read_size(self):
+		"""
+		Returns the maximum data length a single READ request can ask for on this connection
+		"""
+		return self.__get_max_io_size(self.MaxReadSize)
+		
+	def get_max_write_size(self):
+		"""
+		Returns the maximum data length a single WRITE request can carry on this connection
+		"""
+		return self.__get_max_io_size(self.MaxWriteSize)
+		
+	def get_max_transact_size(self):
+		"""
+		Returns the maximum output buffer length a single QUERY_DIRECTORY/QUERY_INFO request can ask for on this connection
+		"""
+		return self.__get_max_io_size(self.MaxTransactSize)
+		
+	def __get_lease_cache_entry(self, file_id):
+		"""
+		Returns the lease cache entry of the handle if reads can be served from it, otherwise None
+		"""
+		fh = self.FileHandleTable.get(file_id)
+		if fh is None or fh.lease_key is None:
+			return None
+		entry = self.lease_cache.get_entry(fh.lease_key)
+		if entry is None or entry.is_readable() is False:
+			return None
+		return entry
+		
+	async def __read_request(self, tree_id, file_id, offset, length, timeout):
+		"""
+		Sends one READ request and waits for the reply
+		"""
 		if tree_id not in self.TreeConnectTable_id:
 			raise Exception('Unknown Tree ID!')
 		if file_id not in self.FileHandleTable:
@@ -560,13 +1278,12 @@ class SMBConnection:
 		header.Command  = SMB2Command.READ
 		header.TreeId = tree_id
 		
-		if length < self.MaxReadSize:
-			length = self.MaxReadSize
+		#length 0 means "as much as possible", this is used by pipe reads
+		if length == 0 or length > self.get_max_read_size():
+			length = self.get_max_read_size()
 		
-		if self.selected_dialect != NegotiateDialects.SMB202 and self.SupportsMultiCredit == True:
+		if self.SupportsMultiCredit == True:
 			header.CreditCharge = ( 1 + (length - 1) // 65536)
-		else: 
-			length = min(65536,length)
 			
 		command = READ_REQ()
 		command.Length = length
@@ -575,12 +1292,37 @@ class SMBConnection:
 		command.MinimumCount = 0
 		command.RemainingBytes = 0
 		
-		msg = SMBMessage(header, command)
+		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 		
-		rply = await self.recvSMB(message_id)
+		return await self.recvSMB(message_id, timeout = timeout)
+		
+	async def read(self, tree_id, file_id, offset = 0, length = 0, timeout = None):
+		"""
+		Will issue one read command only then waits for reply. To read a whole file you must use a filereader logic! 
+		returns the data bytes and the remaining data length
+		
+		IMPORTANT: remaning data length is dependent on the length of the requested chunk (length param) not on the actual file length.
+		to get the remaining length for the actual file you must set the length parameter to the correct file size!
+		
+		If and EOF happens the function returns an empty byte array and the remaining data is set to 0
+		"""
+		if self.session_closed == True:
+			raise SMBConnectionTerminated('Session closed')
+		
+		entry = self.__get_lease_cache_entry(file_id)
+		if entry is not None:
+			data = self.lease_cache.read(entry, offset, length if length != 0 else self.get_max_read_size())
+			if data is not None:
+				return data, 0
+			version = entry.version
+		
+		channel = self.select_channel()
+		rply = await channel.__read_request(tree_id, file_id, offset, length, timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
+			if entry is not None:
+				self.lease_cache.store(entry, version, offset, rply.command.BufferView)
 			return rply.command.Buffer, rply.command.DataRemaining
 		
 		elif rply.header.Status == NTStatus.END_OF_FILE:
@@ -589,8 +1331,45 @@ class SMBConnection:
 		else:
 			raise SMBGenericException()
 			
+	async def readinto(self, tree_id, file_id, buffer, offset = 0, timeout = None):
+		"""
+		Same as read, but the data is copied straight from the received message into buffer (bytearray, mmap or writable memoryview).
+		At most len(buffer) bytes are requested (capped by the maximum read size).
+		returns the number of bytes read and the remaining data length, on EOF (0, 0) is returned
+		"""
+		if self.session_closed == True:
+			raise SMBConnectionTerminated('Session closed')
+		
+		view = memoryview(buffer)
+		if len(view) == 0:
+			return 0, 0
+		
+		entry = self.__get_lease_cache_entry(file_id)
+		if entry is not None:
+			count = self.lease_cache.readinto(entry, offset, view)
+			if count is not None:
+				return count, 0
+			version = entry.version
+		
+		channel = self.select_channel()
+		rply = await channel.__read_request(tree_id, file_id, offset, len(view), timeout)
+		
+		if rply.header.Status == NTStatus.SUCCESS:
+			data = rply.command.BufferView
+			if entry is not None:
+				self.lease_cache.store(entry, version, offset, data)
+			count = min(len(data), len(view))
+			view[:count] = data[:count]
+			return count, rply.command.DataRemaining
+		
+		elif rply.header.Status == NTStatus.END_OF_FILE:
+			return 0, 0
+			
+		else:
+			raise SMBGenericException()
+			
 			
-	async def write(self, tree_id, file_id, data, offset = 0):
+	async def write(self, tree_id, file_id, data, offset = 0, timeout = None):
 		"""
 		This function will send one packet only! The data size can be larger than what one packet allows, but it will be truncated
 		to the maximum. 
@@ -599,7 +1378,11 @@ class SMBConnection:
 		
 		"""
 		if self.session_closed == True:
-			return
+			raise SMBConnectionTerminated('Session closed')
+		
+		channel = self.select_channel()
+		if channel is not self:
+			return await channel.write(tree_id, file_id, data, offset = offset, timeout = timeout)
 			
 		if tree_id not in self.TreeConnectTable_id:
 			raise Exception('Unknown Tree ID!')
@@ -610,13 +1393,11 @@ class SMBConnection:
 		header.Command  = SMB2Command.WRITE
 		header.TreeId = tree_id
 			
-		if len(data) > self.MaxWriteSize:
-			data = data[:self.MaxWriteSize]
+		if len(data) > self.get_max_write_size():
+			data = data[:self.get_max_write_size()]
 			
-		if self.selected_dialect != NegotiateDialects.SMB202 and self.SupportsMultiCredit == True:
+		if self.SupportsMultiCredit == True:
 			header.CreditCharge = ( 1 + (len(data) - 1) // 65536)
-		else: 
-			data = data[:min(65536,len(data))]
 		
 		command = WRITE_REQ()
 		command.Length = len(data)
@@ -624,18 +1405,23 @@ class SMBConnection:
 		command.FileId = file_id
 		command.Data = data
 		
-		msg = SMBMessage(header, command)
+		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 		
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
+			fh = self.FileHandleTable.get(file_id)
+			if fh is not None and fh.lease_key is not None:
+				entry = self.lease_cache.get_entry(fh.lease_key)
+				if entry is not None:
+					self.lease_cache.written(entry, offset, rply.command.Count)
 			return rply.command.Count
 		
 		else:
 			raise SMBGenericException()
 		
-	async def query_info(self, tree_id, file_id, info_type = QueryInfoType.FILE, information_class = FileInfoClass.FileStandardInformation, additional_information = 0, flags = 0, data_in = ''):
+	async def query_info(self, tree_id, file_id, info_type = QueryInfoType.FILE, information_class = FileInfoClass.FileStandardInformation, additional_information = 0, flags = 0, data_in = '', timeout = None):
 		"""
 		Queires the file or directory for specific information. The information returned is depending on the input parameters, check the documentation on msdn for a better understanding.
 		The resturned data can by raw bytes or an actual object, depending on wther your info is implemented in the library.
@@ -649,6 +1435,16 @@ class SMBConnection:
 			raise Exception('Unknown Tree ID!')
 		if file_id not in self.FileHandleTable:
 			raise Exception('Unknown File ID!')
+		
+		entry = None
+		if info_type == QueryInfoType.FILE and information_class in LEASE_CACHED_INFO_CLASSES and flags == 0 and not data_in:
+			entry = self.__get_lease_cache_entry(file_id)
+		if entry is not None:
+			info_key = (information_class, additional_information)
+			data = self.lease_cache.get_info(entry, info_key)
+			if data is not None:
+				return data
+			version = entry.version
 			
 		command = QUERY_INFO_REQ()
 		command.InfoType = info_type
@@ -662,10 +1458,10 @@ class SMBConnection:
 		header.Command  = SMB2Command.QUERY_INFO
 		header.TreeId = tree_id
 		
-		msg = SMBMessage(header, command)
+		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			#https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-smb2/3b1b3598-a898-44ca-bfac-2dcae065247f
@@ -677,6 +1473,8 @@ class SMBConnection:
 					return FileFullDirectoryInformationList.from_bytes(rply.command.Data)
 					
 				else:
+					if entry is not None:
+						self.lease_cache.store_info(entry, version, info_key, rply.command.Data)
 					return rply.command.Data
 					
 			elif info_type == QueryInfoType.FILESYSTEM:
@@ -695,41 +1493,156 @@ class SMBConnection:
 			raise SMBGenericException()
 			
 		
-	async def query_directory(self, tree_id, file_id, search_pattern = '*', resume_index = 0, information_class = FileInfoClass.FileFullDirectoryInformation, maxBufferSize = None, flags = 0):
+	async def query_security_info(self, tree_id, file_path, additional_information = SecurityInfo.OWNER_SECURITY_INFORMATION | SecurityInfo.GROUP_SECURITY_INFORMATION | SecurityInfo.DACL_SECURITY_INFORMATION, timeout = None):
+		"""
+		Fetches the raw security descriptor of a file or directory by path, in one round trip.
+		The CREATE, QUERY_INFO and CLOSE requests are sent as a related compound, the handle is never added to FileHandleTable.
+		"""
+		if self.session_closed == True:
+			raise SMBConnectionTerminated('Session closed')
+		if tree_id not in self.TreeConnectTable_id:
+			raise Exception('Unknown Tree ID!')
+
+		desired_access = FileAccessMask.READ_CONTROL
+		if additional_information & SecurityInfo.SACL_SECURITY_INFORMATION:
+			desired_access |= FileAccessMask.ACCESS_SYSTEM_SECURITY
+
+		create = CREATE_REQ()
+		create.RequestedOplockLevel = OplockLevel.SMB2_OPLOCK_LEVEL_NONE
+		create.ImpersonationLevel = ImpersonationLevel.Impersonation
+		create.DesiredAccess = desired_access
+		create.FileAttributes = 0
+		create.ShareAccess = ShareAccess.FILE_SHARE_READ | ShareAccess.FILE_SHARE_WRITE | ShareAccess.FILE_SHARE_DELETE
+		create.CreateDisposition = CreateDisposition.FILE_OPEN
+		create.CreateOptions = 0 #opens files and directories alike
+		create.Name = file_path
+		create.CreateContext = None
+
+		query = QUERY_INFO_REQ()
+		query.InfoType = QueryInfoType.SECURITY
+		query.FileInfoClass = FileInfoClass.NONE
+		query.AdditionalInformation = additional_information
+		query.Flags = 0
+		query.FileId = SMB2_RELATED_FILE_ID
+		query.Data = ''
+
+		close = CLOSE_REQ()
+		close.Flags = CloseFlag.NONE
+		close.FileId = SMB2_RELATED_FILE_ID
+
+		msgs = []
+		for command, code in [(create, SMB2Command.CREATE), (query, SMB2Command.QUERY_INFO), (close, SMB2Command.CLOSE)]:
+			header = SMB2Header_SYNC()
+			header.Command = code
+			header.TreeId = tree_id
+			msgs.append(SMB2Message(header, command))
+
+		create_rply, query_rply, close_rply = await self.compound(msgs, related = True, timeout = timeout)
+
+		if create_rply.header.Status == NTStatus.ACCESS_DENIED:
+			raise SMBCreateAccessDenied(ntstatus = create_rply.header.Status)
+		elif create_rply.header.Status != NTStatus.SUCCESS:
+			raise SMBGenericException(ntstatus = create_rply.header.Status)
+
+		if close_rply.header.Status != NTStatus.SUCCESS:
+			#servers may skip the rest of the chain after a failed query, the handle must not be leaked
+			try:
+				await self.close(tree_id, create_rply.command.FileId, timeout = timeout)
+			except Exception as e:
+				logger.debug('Failed to close handle of %s. Reason: %s' % (file_path, e))
+
+		if query_rply.header.Status != NTStatus.SUCCESS:
+			raise SMBGenericException(ntstatus = query_rply.header.Status)
+
+		return query_rply.command.Data
+
+	async def query_directory(self, tree_id, file_id, search_pattern = '*', resume_index = 0, information_class = FileInfoClass.FileFullDirectoryInformation, maxBufferSize = None, flags = 0, timeout = None):
 		"""
+		Issues one QUERY_DIRECTORY request and returns one page of directory entries.
+		maxBufferSize: output buffer length of the request, defaults to the largest one the connection allows (see get_max_transact_size)
 		
 		IMPORTANT: in case you are requesting big amounts of data, the result will arrive in chunks. You will need to invoke this function until None is returned to get the full data!!!
+		Use query_directory_iter to get the entries one by one.
 		"""
 		if self.session_closed == True:
 			return
-			
+		
+		message_id = await self.__query_directory_request(tree_id, file_id, search_pattern, resume_index, information_class, maxBufferSize, flags)
+		rply = await self.recvSMB(message_id, timeout = timeout)
+		return self.__get_query_directory_page(rply, information_class)
+		
+	async def query_directory_iter(self, tree_id, file_id, search_pattern = '*', information_class = FileInfoClass.FileFullDirectoryInformation, maxBufferSize = None, timeout = None):
+		"""
+		Async generator yielding the directory entries one by one.
+		information_class: FileIdBothDirectoryInformation, FileIdFullDirectoryInformation and FileNamesInformation give compact records
+		(raw timestamps, FileId), pick the cheapest one that has the fields you need
+		The entries are requested in pages of maxBufferSize bytes (by default the largest the connection allows),
+		the request for the next page is sent as soon as a page arrives, so the server works on it while the caller consumes the current one.
+		Information classes without a parser yield the raw page data instead of entries.
+		"""
+		if self.session_closed == True:
+			return
+		
+		message_id = await self.__query_directory_request(tree_id, file_id, search_pattern, 0, information_class, maxBufferSize, 0)
+		try:
+			while True:
+				rply = await self.recvSMB(message_id, timeout = timeout)
+				message_id = None
+				page = self.__get_query_directory_page(rply, information_class)
+				if not page:
+					return
+				message_id = await self.__query_directory_request(tree_id, file_id, search_pattern, 0, information_class, maxBufferSize, 0)
+				if isinstance(page, (bytes, bytearray)):
+					yield page
+					continue
+				for info in page:
+					yield info
+		finally:
+			if message_id is not None:
+				#the enumeration is abandoned, but the reply of the request in flight must be consumed
+				try:
+					await self.recvSMB(message_id, timeout = timeout)
+				except Exception:
+					pass
+		
+	async def __query_directory_request(self, tree_id, file_id, search_pattern, resume_index, information_class, maxBufferSize, flags):
+		"""
+		Sends one QUERY_DIRECTORY request, returns its MessageId
+		"""
 		if tree_id not in self.TreeConnectTable_id:
 			raise Exception('Unknown Tree ID!')
 		if file_id not in self.FileHandleTable:
 			raise Exception('Unknown File ID!')
 			
+		if maxBufferSize is None or maxBufferSize > self.get_max_transact_size():
+			maxBufferSize = self.get_max_transact_size()
 		
 		command = QUERY_DIRECTORY_REQ()
 		command.FileInformationClass  = information_class
-		command.Flags = 0
+		command.Flags = flags
 		if resume_index != 0 :
 			command.Flags |= QueryDirectoryFlag.SMB2_INDEX_SPECIFIED
 		command.FileIndex  = resume_index
 		command.FileId  = file_id
 		command.FileName = search_pattern
+		command.OutputBufferLength = maxBufferSize
 		
 		header = SMB2Header_SYNC()
 		header.Command  = SMB2Command.QUERY_DIRECTORY
 		header.TreeId = tree_id
+		if self.SupportsMultiCredit == True:
+			header.CreditCharge = ( 1 + (maxBufferSize - 1) // 65536)
 		
 		msg = SMB2Message(header, command)
-		message_id = await self.sendSMB(msg)
-
-		rply = await self.recvSMB(message_id)
+		return await self.sendSMB(msg)
 		
+	def __get_query_directory_page(self, rply, information_class):
 		if rply.header.Status == NTStatus.SUCCESS:
 			if information_class == FileInfoClass.FileFullDirectoryInformation:
 				return FileFullDirectoryInformationList.from_bytes(rply.command.Data)
+			
+			elif information_class in DIRECTORY_INFORMATION_TYPES:
+				return DirectoryInformationList.from_bytes(rply.command.Data, information_class)
 				
 			else:
 				return rply.command.Data
@@ -739,7 +1652,7 @@ class SMBConnection:
 		else:
 			raise Exception('query_directory reply: %s' % rply.header.Status)
 			
-	async def close(self, tree_id, file_id, flags = CloseFlag.NONE):
+	async def close(self, tree_id, file_id, flags = CloseFlag.NONE, timeout = None):
 		"""
 		Closes the file/directory/pipe/whatever based on file_id. It will automatically remove all traces of the file handle.
 		"""
@@ -756,12 +1669,14 @@ class SMBConnection:
 		message_id = await self.sendSMB(msg)
 		
 
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		if rply.header.Status == NTStatus.SUCCESS:
-			del self.FileHandleTable[file_id]
+			fh = self.FileHandleTable.pop(file_id, None)
+			if fh is not None and fh.lease_key is not None:
+				self.lease_cache.closed(fh.lease_key)
 			
 			
-	async def flush(tree_id, file_id):
+	async def flush(self, tree_id, file_id, timeout = None):
 		"""
 		Flushes all cached data that may be on the server for the given file.
 		"""
@@ -777,9 +1692,9 @@ class SMBConnection:
 		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
-	async def logoff(self):
+	async def logoff(self, timeout = None):
 		"""
 		Logs off from the server, effectively terminates the session. 
 		The underlying connection will still be active, so please either clean it up manually or dont touch this function
@@ -798,9 +1713,9 @@ class SMBConnection:
 		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 	
-	async def echo(self):
+	async def echo(self, timeout = None):
 		"""
 		Issues an ECHO request to the server. Server will reply with and ECHO response, if it's still alive
 		"""
@@ -811,14 +1726,25 @@ class SMBConnection:
 		header.Command  = SMB2Command.ECHO
 		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
-	async def tree_disconnect(self, tree_id):
+	async def tree_disconnect(self, tree_id, timeout = None, force = False):
 		"""
-		Disconnects from tree, removes all file entries associated to the tree
+		Releases one reference to the tree. The tree is only disconnected when the last user released it (or force is set),
+		then all file entries associated to the tree are removed
 		"""
 		if self.session_closed == True:
 			return
+		
+		if tree_id in self.TreeConnectTable_id:
+			te = self.TreeConnectTable_id[tree_id]
+			te.number_of_users -= 1
+			if te.number_of_users > 0 and force is False:
+				return
+			#removing the entry before the request is sent, a tree_connect in the meantime must not get the dying tree
+			del self.TreeConnectTable_id[tree_id]
+			if self.TreeConnectTable_share.get(te.share_name) is te:
+				del self.TreeConnectTable_share[te.share_name]
 			
 		command = TREE_DISCONNECT_REQ()
 		
@@ -828,36 +1754,38 @@ class SMBConnection:
 		msg = SMB2Message(header, command)
 		message_id = await self.sendSMB(msg)
 
-		rply = await self.recvSMB(message_id)
+		rply = await self.recvSMB(message_id, timeout = timeout)
 		
 		if rply.header.Status == NTStatus.SUCCESS:
 			del_fiel_ids = []
-			share_name = self.TreeConnectTable_id[tree_id].share_name
-			for fe in self.FileHandleTable:
+			for fe in self.FileHandleTable.values():
 				if fe.tree_id == tree_id:
 					del_fiel_ids.append(fe.file_id)
 			
 			for file_id in del_fiel_ids:
 				del self.FileHandleTable[file_id]
-			
-			del self.TreeConnectTable_id[tree_id]
-			del self.TreeConnectTable_share[share_name]
 
 		
-	async def cancel(self, message_id):
+	async def cancel(self, message_id, async_id = None):
 		"""
-		Issues a CANCEL command for the given message_id
+		Issues a CANCEL command for the given message_id.
+		async_id: the AsyncId from the interim reply, if the server has already sent one
+		The server doesn't reply to CANCEL, the cancelled request gets a reply (usually STATUS_CANCELLED) instead.
 		"""
 		if self.session_closed == True:
 			return
 			
 		command = CANCEL_REQ()
-		header = SMB2Header_SYNC()
+		if async_id is not None:
+			header = SMB2Header_ASYNC()
+			header.Flags = SMB2HeaderFlag.SMB2_FLAGS_ASYNC_COMMAND
+			header.AsyncId = async_id
+		else:
+			header = SMB2Header_SYNC()
 		header.Command  = SMB2Command.CANCEL
-		msg.header.MessageId = message_id
+		header.MessageId = message_id
 		msg = SMB2Message(header, command)
-		message_id = await self.sendSMB(msg)
-		rply = await self.recvSMB(message_id)
+		await self.sendSMB(msg)
 		
 	async def terminate(self):
 		"""
@@ -871,10 +1799,18 @@ class SMBConnection:
 			#only doing the proper disconnection if the connection was already running
 			for tree_id in list(self.TreeConnectTable_id.keys()):
 				try:
-					await self.tree_diconnect(tree_id)
+					await self.tree_disconnect(tree_id, force = True)
 				except:
 					pass
 					
+			#bound channels are just disconnected, the logoff on this channel ends the session for all of them
+			for channel in self.channels:
+				try:
+					await channel.disconnect()
+				except:
+					pass
+			self.channels = []
+			
 			#logging off
 			try:
 				await self.logoff()
@@ -0,0 +1,253 @@
+import asyncio
+import collections
+
+from aiosmb import logger
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+
+
+async def create_connection(target, credential):
+	"""
+	Default connection factory of the pool, returns a logged in SMBConnection
+	"""
+	#imported here so the pool can be used with a custom factory without the authenticator dependencies
+	from aiosmb.commons.authenticator_builder import AuthenticatorBuilder
+	gssapi = AuthenticatorBuilder.to_spnego_cred(credential, target)
+	#every connection needs its own shutdown event, the default one is shared between all connections
+	connection = SMBConnection(gssapi, target, shutdown_evt = asyncio.Event())
+	try:
+		await connection.login()
+	except:
+		await connection.disconnect()
+		raise
+	return connection
+
+class SMBPoolIdleEntry:
+	def __init__(self, connection, last_used):
+		self.connection = connection
+		self.last_used = last_used
+
+class SMBPoolCheckout:
+	"""
+	Async context manager returned by SMBConnectionPool.checkout, gives the connection back to the pool on exit
+	"""
+	def __init__(self, pool, target, credential):
+		self.pool = pool
+		self.target = target
+		self.credential = credential
+		self.connection = None
+
+	async def __aenter__(self):
+		self.connection = await self.pool.acquire(self.target, self.credential)
+		return self.connection
+
+	async def __aexit__(self, exc_type, exc, traceback):
+		connection = self.connection
+		self.connection = None
+		await self.pool.release(connection)
+
+class SMBConnectionPool:
+	"""
+	Keeps authenticated SMB sessions open and hands them out for reuse.
+	Connections are keyed by (target, credential), the number of connections to a single host (idle and checked out) is limited by max_per_host.
+	Idle connections are closed after idle_timeout seconds. Connections that were idle for more than health_check_interval seconds
+	are checked with an ECHO before they are handed out again.
+
+	usage:
+		async with SMBConnectionPool() as pool:
+			async with pool.checkout(target, credential) as connection:
+				...
+	"""
+	def __init__(self, max_per_host = 4, idle_timeout = 60, health_check_interval = 10, health_check_timeout = 5, connection_factory = create_connection):
+		self.max_per_host = max_per_host
+		self.idle_timeout = idle_timeout
+		self.health_check_interval = health_check_interval
+		self.health_check_timeout = health_check_timeout
+		self.connection_factory = connection_factory #coroutine function taking target and credential, returns a logged in connection
+
+		self.idle = {} #connection key -> deque of SMBPoolIdleEntry, most recently used at the right
+		self.host_slots = {} #host key -> asyncio.Semaphore
+		self.checked_out = {} #connection -> (connection key, host key)
+		self.closed = False
+		self.__reaper_task = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc, traceback):
+		await self.close()
+
+	@staticmethod
+	def get_host_key(target):
+		return (target.get_ip(), int(target.get_port()))
+
+	@staticmethod
+	def get_host_key_from_connection_key(key):
+		return (key[0][0], key[0][1])
+
+	@staticmethod
+	def get_connection_key(target, credential):
+		"""
+		SMBTarget and SMBCredential are plain objects, the key is built from the fields that affect the session
+		"""
+		target_key = (target.get_ip(), int(target.get_port()), target.hostname, target.domain, target.dc_ip, target.buffered_transport)
+		credential_key = (credential.domain, credential.username, credential.authentication_type, credential.secret_type, credential.secret)
+		return (target_key, credential_key)
+
+	def checkout(self, target, credential):
+		"""
+		Returns an async context manager that gives an authenticated connection for the target/credential pair
+		"""
+		return SMBPoolCheckout(self, target, credential)
+
+	async def acquire(self, target, credential):
+		"""
+		Returns a connection for the target/credential pair, reusing an idle one if possible.
+		Waits if max_per_host connections to the host are already checked out. The connection must be given back with release.
+		"""
+		if self.closed is True:
+			raise Exception('Connection pool is closed!')
+		self.__start_reaper()
+
+		host_key = SMBConnectionPool.get_host_key(target)
+		key = SMBConnectionPool.get_connection_key(target, credential)
+		if host_key not in self.host_slots:
+			self.host_slots[host_key] = asyncio.Semaphore(self.max_per_host)
+		slots = self.host_slots[host_key]
+
+		await slots.acquire()
+		try:
+			connection = await self.__get_idle(key)
+			if connection is None:
+				self.__trim_idle_host(host_key)
+				connection = await self.connection_factory(target, credential)
+		except:
+			slots.release()
+			raise
+
+		self.checked_out[connection] = (key, host_key)
+		return connection
+
+	async def release(self, connection, discard = False):
+		"""
+		Gives the connection back to the pool. Broken connections (and all of them if discard is set) are closed instead of kept.
+		"""
+		if connection not in self.checked_out:
+			raise Exception('Connection was not checked out from this pool!')
+		key, host_key = self.checked_out.pop(connection)
+		try:
+			if discard is True or self.closed is True or SMBConnectionPool.is_usable(connection) is False:
+				await SMBConnectionPool.__terminate(connection)
+			else:
+				now = asyncio.get_event_loop().time()
+				if key not in self.idle:
+					self.idle[key] = collections.deque()
+				self.idle[key].append(SMBPoolIdleEntry(connection, now))
+		finally:
+			self.host_slots[host_key].release()
+
+	@staticmethod
+	def is_usable(connection):
+		return connection.status == SMBConnectionStatus.RUNNING and connection.session_closed is False
+
+	async def __get_idle(self, key):
+		"""
+		Pops the most recently used idle connection of key that is still alive, expired and broken connections are closed
+		"""
+		while True:
+			#the health check awaits, other acquires, the reaper or close can change self.idle meanwhile
+			entries = self.idle.get(key)
+			if not entries:
+				self.idle.pop(key, None)
+				return None
+			entry = entries.pop()
+			if len(entries) == 0:
+				del self.idle[key]
+			now = asyncio.get_event_loop().time()
+			if now - entry.last_used > self.idle_timeout or SMBConnectionPool.is_usable(entry.connection) is False:
+				await SMBConnectionPool.__terminate(entry.connection)
+				continue
+
+			if now - entry.last_used > self.health_check_interval:
+				try:
+					await entry.connection.echo(timeout = self.health_check_timeout)
+				except Exception as e:
+					logger.debug('[SMBConnectionPool] Health check failed, dropping connection. Reason: %s' % e)
+					await SMBConnectionPool.__terminate(entry.connection)
+					continue
+
+			return entry.connection
+
+	def __trim_idle_host(self, host_key):
+		"""
+		Idle connections with other credentials count against max_per_host as well,
+		the least recently used ones are closed to make room for a new connection to the host
+		"""
+		open_count = 1 + sum(1 for _, other_host_key in self.checked_out.values() if other_host_key == host_key)
+		candidates = []
+		for other_key in self.idle:
+			if SMBConnectionPool.get_host_key_from_connection_key(other_key) == host_key:
+				for entry in self.idle[other_key]:
+					candidates.append((entry.last_used, other_key, entry))
+		open_count += len(candidates)
+		candidates.sort(key = lambda x: x[0])
+
+		for _, other_key, entry in candidates:
+			if open_count <= self.max_per_host:
+				break
+			self.idle[other_key].remove(entry)
+			if len(self.idle[other_key]) == 0:
+				del self.idle[other_key]
+			asyncio.ensure_future(SMBConnectionPool.__terminate(entry.connection))
+			open_count -= 1
+
+	@staticmethod
+	async def __terminate(connection):
+		try:
+			await connection.terminate()
+		except Exception as e:
+			logger.debug('[SMBConnectionPool] Error while closing connection. Reason: %s' % e)
+
+	def __start_reaper(self):
+		if self.__reaper_task is None or self.__reaper_task.done():
+			self.__reaper_task = asyncio.ensure_future(self.__reaper())
+
+	async def __reaper(self):
+		"""
+		Closes the connections that were idle for more than idle_timeout seconds
+		"""
+		try:
+			while self.closed is False:
+				await asyncio.sleep(max(self.idle_timeout / 2, 1))
+				now = asyncio.get_event_loop().time()
+				expired = []
+				for key in list(self.idle.keys()):
+					entries = self.idle[key]
+					while len(entries) > 0 and now - entries[0].last_used > self.idle_timeout:
+						expired.append(entries.popleft().connection)
+					if len(entries) == 0:
+						self.idle.pop(key, None)
+				for connection in expired:
+					await SMBConnectionPool.__terminate(connection)
+		except asyncio.CancelledError:
+			return
+
+	async def close(self):
+		"""
+		Closes all idle connections. Checked out connections are closed when they are released.
+		"""
+		self.closed = True
+		if self.__reaper_task is not None:
+			self.__reaper_task.cancel()
+			self.__reaper_task = None
+		idle = self.idle
+		self.idle = {}
+		for entries in idle.values():
+			for entry in entries:
+				await SMBConnectionPool.__terminate(entry.connection)
+
+	def __str__(self):
+		t = '==== SMBConnectionPool ====\r\n'
+		t += 'idle: %s\r\n' % sum(len(entries) for entries in self.idle.values())
+		t += 'checked_out: %s\r\n' % len(self.checked_out)
+		t += 'closed: %s\r\n' % self.closed
+		return t
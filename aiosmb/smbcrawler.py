@@ -0,0 +1,147 @@
+import asyncio
+
+from aiosmb import logger
+from aiosmb.protocol.smb2.commands import ShareAccess, CreateOptions, CreateDisposition
+from aiosmb.commons.access_mask import FileAccessMask
+from aiosmb.fscc.FileAttributes import FileAttributes
+from aiosmb.fscc.structures.fileinfoclass import FileInfoClass
+
+class SMBCrawlEntry:
+	"""
+	One file or directory found by the crawler.
+	info: the directory information record of the entry (see aiosmb.fscc.structures.DirectoryInformation), None for errors
+	error: set if the directory at path could not be listed
+	"""
+	__slots__ = ('path', 'depth', 'info', 'error')
+
+	def __init__(self, path, depth, info = None, error = None):
+		self.path = path
+		self.depth = depth
+		self.info = info
+		self.error = error
+
+	@property
+	def name(self):
+		return self.path.rsplit('\\', 1)[-1]
+
+	@property
+	def is_directory(self):
+		#FileNamesInformation has no attributes, nothing is entered with it
+		return self.info is not None and getattr(self.info, 'FileAttributes', 0) & FileAttributes.FILE_ATTRIBUTE_DIRECTORY != 0
+
+	def __str__(self):
+		t = '===== SMBCrawlEntry =====\r\n'
+		t += 'path : %s\r\n' % self.path
+		t += 'depth : %s\r\n' % self.depth
+		t += 'is_directory : %s\r\n' % self.is_directory
+		t += 'error : %s\r\n' % self.error
+		return t
+
+class SMBCrawler:
+	"""
+	Enumerates a share (or a part of it) listing many directories at the same time over one connection.
+	At most concurrency directories are open at once, the results are streamed by the crawl async generator as they arrive.
+	The order of the results is not deterministic, every directory is yielded before its content.
+
+	max_depth: number of directory levels listed below the starting directory, None for no limit (0 lists the starting directory only)
+	exclude_dirs: directory names (case insensitive) that are reported but not entered
+	exclude: callable taking an SMBCrawlEntry, directories it returns True for are reported but not entered
+	follow_reparse_points: junctions and symlinks to directories are not entered by default, they can form loops
+	information_class: one of the DirectoryInformation classes, FileIdBothDirectoryInformation gives the most fields
+	page_size: QUERY_DIRECTORY output buffer length, the credits of all requests in flight must fit in the credit window
+	"""
+	def __init__(self, connection, concurrency = 16, max_depth = None, exclude_dirs = None, exclude = None, follow_reparse_points = False, information_class = FileInfoClass.FileIdBothDirectoryInformation, page_size = 256*1024, queue_size = 10000):
+		self.connection = connection
+		self.concurrency = concurrency
+		self.max_depth = max_depth
+		self.exclude_dirs = set(name.upper() for name in (exclude_dirs or []))
+		self.exclude = exclude
+		self.follow_reparse_points = follow_reparse_points
+		self.information_class = information_class
+		self.page_size = page_size
+		self.queue_size = queue_size #results waiting for the consumer, workers stop listing when it is full
+
+	def should_enter(self, entry):
+		"""
+		Decides if a directory found by the crawler is listed
+		"""
+		if self.max_depth is not None and entry.depth > self.max_depth:
+			return False
+		if entry.name.upper() in self.exclude_dirs:
+			return False
+		if self.follow_reparse_points is False and entry.info.FileAttributes & FileAttributes.FILE_ATTRIBUTE_REPARSE_POINT:
+			return False
+		if self.exclude is not None and self.exclude(entry) is True:
+			return False
+		return True
+
+	async def crawl(self, share_path, path = ''):
+		"""
+		Async generator yielding SMBCrawlEntry objects for everything below path on the share.
+		share_path: \\\\<server>\\<share>
+		path: directory to start from, relative to the share root
+		"""
+		tree_entry = await self.connection.tree_connect(share_path)
+		tree_id = tree_entry.tree_id
+		work = asyncio.Queue() #(path, depth) of the directories to list
+		results = asyncio.Queue(self.queue_size)
+		work.put_nowait((path, 0))
+
+		async def finish():
+			await work.join()
+			await results.put(None)
+
+		tasks = [asyncio.ensure_future(self.__worker(tree_id, work, results)) for _ in range(self.concurrency)]
+		tasks.append(asyncio.ensure_future(finish()))
+		try:
+			while True:
+				entry = await results.get()
+				if entry is None:
+					return
+				yield entry
+
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions = True)
+			try:
+				await self.connection.tree_disconnect(tree_id)
+			except Exception as e:
+				logger.debug('[SMBCrawler] Tree disconnect failed. Reason: %s' % e)
+
+	async def __worker(self, tree_id, work, results):
+		while True:
+			path, depth = await work.get()
+			try:
+				await self.__list_directory(tree_id, path, depth, work, results)
+			except asyncio.CancelledError:
+				raise
+			except Exception as e:
+				logger.debug('[SMBCrawler] Failed to list %s. Reason: %s' % (path, e))
+				await results.put(SMBCrawlEntry(path, depth, error = e))
+			finally:
+				work.task_done()
+
+	async def __list_directory(self, tree_id, path, depth, work, results):
+		desired_access = FileAccessMask.FILE_READ_DATA
+		share_mode = ShareAccess.FILE_SHARE_READ
+		create_options = CreateOptions.FILE_DIRECTORY_FILE | CreateOptions.FILE_SYNCHRONOUS_IO_NONALERT
+		file_id = await self.connection.create(tree_id, path, desired_access, share_mode, create_options, CreateDisposition.FILE_OPEN, 0)
+		try:
+			async for info in self.connection.query_directory_iter(tree_id, file_id, information_class = self.information_class, maxBufferSize = self.page_size):
+				name = info.FileName
+				if name == '.' or name == '..':
+					continue
+				entry = SMBCrawlEntry('%s\\%s' % (path, name) if path != '' else name, depth + 1, info)
+				await results.put(entry)
+				if entry.is_directory and self.should_enter(entry):
+					work.put_nowait((entry.path, entry.depth))
+		finally:
+			#the handle is closed even if the crawl is cancelled meanwhile
+			await asyncio.shield(self.__close(tree_id, file_id))
+
+	async def __close(self, tree_id, file_id):
+		try:
+			await self.connection.close(tree_id, file_id)
+		except Exception as e:
+			logger.debug('[SMBCrawler] Failed to close directory handle. Reason: %s' % e)
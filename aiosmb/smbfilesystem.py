@@ -1,21 +1,27 @@
 
 import traceback
 import asyncio
+from aiosmb import logger
 from aiosmb.commons.smbcontainer import *
 from aiosmb.protocol.smb2.commands import *
 from aiosmb.commons.access_mask import *
 from aiosmb.fscc.FileAttributes import FileAttributes
 from aiosmb.fscc.structures.fileinfoclass import FileInfoClass
+from aiosmb.smbcrawler import SMBCrawler
+from aiosmb.commons.smbsdcache import SMBSecurityDescriptorCache
 
 class SMBFileSystem:
-	def __init__(self, connection):
+	def __init__(self, connection, sd_cache = None):
 		self.connection = connection
+		self.sd_cache = sd_cache if sd_cache is not None else SMBSecurityDescriptorCache() #can be shared between SMBFileSystem objects
+		self.__tree_ids = [] #one entry for every tree reference taken by connect_share, released by close
 		
 	async def connect_share(self, share):
 		"""
 		Connect to the share and fills connection related info in the SMBShare object
 		"""
 		tree_entry = await self.connection.tree_connect(share.fullpath)
+		self.__tree_ids.append(tree_entry.tree_id)
 		share.tree_id = tree_entry.tree_id
 		share.maximal_access = tree_entry.maximal_access
 		init_dir = SMBDirectory()
@@ -31,6 +37,18 @@ class SMBFileSystem:
 		directory: SMBDirectory
 		fills the SMBDirectory's data
 		"""
+		async for entry in self.list_directory_iter(directory):
+			if isinstance(entry, SMBDirectory):
+				directory.subdirs[entry.name] = entry
+			else:
+				directory.files[entry.name] = entry
+		
+	async def list_directory_iter(self, directory, search_pattern = '*'):
+		"""
+		Async generator yielding the files (SMBFile) and folders (SMBDirectory) of the directory one by one, without storing them in the SMBDirectory.
+		Large directories are fetched in MaxTransactSize pages with the next page already requested while the current one is processed.
+		directory: SMBDirectory
+		"""
 		if not directory.parent_share.tree_id:
 			await self.connect_share(directory.parent_share)
 			
@@ -45,49 +63,36 @@ class SMBFileSystem:
 		except Exception as e:
 			print(e)
 			return
-		while True:
-			fileinfos = await self.connection.query_directory(directory.parent_share.tree_id, file_id)
-			if not fileinfos:
-				break
-			for info in fileinfos:
+		
+		try:
+			async for info in self.connection.query_directory_iter(directory.parent_share.tree_id, file_id, search_pattern = search_pattern):
+				if info.FileName in ['.','..']:
+					continue
+				if directory.fullpath != '':
+					fullpath = '%s\\%s' % (directory.fullpath, info.FileName)
+				else:
+					fullpath = info.FileName
+				
 				if info.FileAttributes & FileAttributes.FILE_ATTRIBUTE_DIRECTORY:
-					dirname = info.FileName 
-					if info.FileName in ['.','..']:
-						continue
-					subdir = SMBDirectory()
-					subdir.parent_share = directory.parent_share
-					if directory.fullpath != '':
-						subdir.fullpath = '%s\\%s' % (directory.fullpath, info.FileName)
-					else:
-						subdir.fullpath = info.FileName
-					subdir.name = info.FileName
-					subdir.creation_time = info.CreationTime
-					subdir.last_access_time = info.LastAccessTime
-					subdir.last_write_time = info.LastWriteTime
-					subdir.change_time = info.ChangeTime
-					subdir.allocation_size = info.AllocationSize
-					subdir.attributes = info.FileAttributes
-					
-					directory.subdirs[subdir.name] = subdir
-					
+					entry = SMBDirectory()
 				else:
-					file = SMBFile()
-					file.parent_share = directory.parent_share
-					file.parent_dir = None
-					if directory.fullpath != '':
-						file.fullpath = '%s\\%s' % (directory.fullpath, info.FileName)
-					else:
-						file.fullpath = info.FileName
-					file.name = info.FileName
-					file.size = info.EndOfFile
-					file.creation_time = info.CreationTime
-					file.last_access_time = info.LastAccessTime
-					file.last_write_time = info.LastWriteTime
-					file.change_time = info.ChangeTime
-					file.allocation_size = info.AllocationSize
-					file.attributes = info.FileAttributes		
-					directory.files[file.name] = file
-		
+					entry = SMBFile()
+					entry.size = info.EndOfFile
+				entry.parent_share = directory.parent_share
+				entry.fullpath = fullpath
+				entry.name = info.FileName
+				entry.creation_time = info.CreationTime
+				entry.last_access_time = info.LastAccessTime
+				entry.last_write_time = info.LastWriteTime
+				entry.change_time = info.ChangeTime
+				entry.allocation_size = info.AllocationSize
+				entry.attributes = info.FileAttributes
+				yield entry
+		finally:
+			try:
+				await self.connection.close(directory.parent_share.tree_id, file_id)
+			except Exception as e:
+				pass
 		
 	def get_file(self, file, destination_path):
 		"""
@@ -101,15 +106,75 @@ class SMBFileSystem:
 		Gets the file's SID and fills the file object's attribute
 		file: SMBFile
 		"""
-		if not dof.file_id:
+		if not dof.parent_share.tree_id:
+			await self.connect_share(dof.parent_share)
+		
+		try:
+			data = await self.connection.query_security_info(dof.parent_share.tree_id, dof.fullpath)
+		except Exception as e:
+			return
+		
+		if data:
+			dof.sid = self.sd_cache.from_bytes(data)
+			
+	async def get_sids(self, directory):
+		"""
+		Fills the sid attribute of all files and folders already listed in the directory, fetching the descriptors concurrently
+		directory: SMBDirectory
+		"""
+		entries = {}
+		for dof in list(directory.files.values()) + list(directory.subdirs.values()):
+			entries[dof.fullpath] = dof
+		async for path, res in self.get_security_descriptors(directory.parent_share, list(entries.keys())):
+			if isinstance(res, Exception):
+				continue
+			entries[path].sid = res
+			
+	async def get_security_descriptors(self, share, paths, additional_information = SecurityInfo.OWNER_SECURITY_INFORMATION | SecurityInfo.GROUP_SECURITY_INFORMATION | SecurityInfo.DACL_SECURITY_INFORMATION, concurrency = 16):
+		"""
+		Async generator yielding (path, SECURITY_DESCRIPTOR) tuples for many files and directories of the share, in completion order.
+		Each path costs one compound round trip and at most concurrency of them are in flight. Failed paths are yielded with the exception instead.
+		The descriptors come from sd_cache, files with identical descriptors get the same object.
+		share: SMBShare
+		paths: iterable or async iterable of paths relative to the share root (e.g. the paths of a crawl)
+		"""
+		if not share.tree_id:
+			await self.connect_share(share)
+		
+		async def fetch(path):
 			try:
-				await self.get_fileid(dof)
+				data = await self.connection.query_security_info(share.tree_id, path, additional_information = additional_information)
+				return path, self.sd_cache.from_bytes(data)
+			except asyncio.CancelledError:
+				raise
 			except Exception as e:
-				return
+				return path, e
 		
-		res = await self.connection.query_info(dof.parent_share.tree_id, dof.file_id, info_type = QueryInfoType.SECURITY, information_class = FileInfoClass.NONE, additional_information = SecurityInfo.OWNER_SECURITY_INFORMATION | SecurityInfo.GROUP_SECURITY_INFORMATION | SecurityInfo.DACL_SECURITY_INFORMATION)
-		if res:
-			dof.sid = res
+		pending = set()
+		try:
+			async for path in self.__iterate(paths):
+				if len(pending) >= concurrency:
+					done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+					for task in done:
+						yield task.result()
+				pending.add(asyncio.ensure_future(fetch(path)))
+			
+			while len(pending) > 0:
+				done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+				for task in done:
+					yield task.result()
+		finally:
+			#the handles are closed by the compounds themselves, nothing else to clean up
+			for task in pending:
+				task.cancel()
+	
+	async def __iterate(self, paths):
+		if hasattr(paths, '__aiter__'):
+			async for path in paths:
+				yield path
+		else:
+			for path in paths:
+				yield path
 			
 	async def get_fileid(self, dof):
 		"""
@@ -144,11 +209,23 @@ class SMBFileSystem:
 		"""
 		pass
 		
+	async def close(self):
+		"""
+		Releases the shares connected by this object, the connection itself stays open
+		"""
+		tree_ids = self.__tree_ids
+		self.__tree_ids = []
+		for tree_id in tree_ids:
+			try:
+				await self.connection.tree_disconnect(tree_id)
+			except Exception as e:
+				logger.debug('Failed to disconnect tree %s. Reason: %s' % (tree_id, e))
+		
 	async def quit(self):
-		self.connection.terminate()
+		await self.close()
+		await self.connection.terminate()
 		
 	async def enumerate_directory_stack(self, directory, maxdepth = 4, with_sid = False, exclude_dirs = ['Windows','Program Files','Program Files (x86)']):
-		input('enumerate_directory_stack %s' % directory.fullpath)
 		dirs = [(directory, maxdepth)]
 		
 		while len(dirs) != 0:
@@ -158,14 +235,11 @@ class SMBFileSystem:
 			await self.list_directory(directory)
 			await asyncio.sleep(0) #give other tasks a chance...
 			if with_sid == True:
-				for file_name in directory.files:
-					await self.get_sid(directory.files[file_name])
-				for directory_name in directory.subdirs:
-					await self.get_sid(directory.subdirs[directory_name])
+				await self.get_sids(directory)
 			
 			await self.close_directory(directory)		
 			yield directory			
-			if md > maxdepth:
+			if md <= 0:
 				continue
 			
 			for directory_name in directory.subdirs:
@@ -176,12 +250,9 @@ class SMBFileSystem:
 		await asyncio.sleep(0) #give other tasks a chance...
 		
 		if with_sid == True:
-			for file_name in directory.files:
-				await self.get_sid(directory.files[file_name])
-			for directory_name in directory.subdirs:
-				await self.get_sid(directory.subdirs[directory_name])
+			await self.get_sids(directory)
 		
-		if max_depth == 0:
+		if maxdepth == 0:
 			return
 		
 		for directory_name in directory.subdirs:
@@ -193,10 +264,18 @@ class SMBFileSystem:
 		except Exception as e:
 			return
 		
-		await self.list_share(share)
+		await self.list_directory(share.subdirs[''])
 		
-		for directory_name in share.subdirs:
-			await self.enumerate_directory(share.subdirs[directory_name], maxdepth = maxdepth, with_sid = with_sid)
+		for directory_name in share.subdirs[''].subdirs:
+			await self.enumerate_directory(share.subdirs[''].subdirs[directory_name], maxdepth = maxdepth, with_sid = with_sid)
+			
+	def crawl(self, share, path = '', **kwargs):
+		"""
+		Async generator enumerating everything below path on the share, many directories are listed at the same time.
+		share: SMBShare
+		kwargs: crawl policy (concurrency, max_depth, exclude_dirs...), see SMBCrawler
+		"""
+		return SMBCrawler(self.connection, **kwargs).crawl(share.fullpath, path)
 			
 	def print_tree(self, share):
 		print(str(share))
@@ -0,0 +1,28 @@
+import unittest
+
+from aiosmb.network.buffered_transport import SMBBufferedTransport
+
+def frame(payload):
+	return b'\x00' + len(payload).to_bytes(3, byteorder='big', signed = False) + payload
+
+def feed(transport, data, chunk_size):
+	pos = 0
+	while pos < len(data):
+		buff = transport.get_buffer(-1)
+		n = min(len(buff), chunk_size, len(data) - pos)
+		buff[:n] = data[pos:pos+n]
+		transport.buffer_updated(n)
+		pos += n
+
+class TestBufferedTransport(unittest.TestCase):
+	def test_frames(self):
+		payloads = [b'\xFE' + bytes([i % 256])*(i*37) for i in range(1, 60)]
+		data = b''.join(frame(p) for p in payloads) + frame(b'')
+		for chunk_size in [1, 5, 1000, 1 << 20]:
+			frames = []
+			transport = SMBBufferedTransport(frames.append, buffer_size = 512)
+			feed(transport, data, chunk_size)
+			self.assertEqual([bytes(f) for f in frames], payloads)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.exceptions import SMBMessageParseError
+from aiosmb.protocol.smb2.message import SMB2Message
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC, SMB2Header_ASYNC, SMB2HeaderFlag
+from aiosmb.protocol.smb2.commands import CLOSE_REQ, READ_REPLY, CloseFlag
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+
+def build_header(command, flags = SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR):
+	header = SMB2Header_SYNC()
+	header.Command = command
+	header.CreditCharge = 1
+	header.CreditReq = 10
+	header.Flags = flags
+	header.MessageId = 0x1122334455667788
+	header.TreeId = 5
+	header.SessionId = 0xAABBCCDDEEFF0011
+	return header
+
+class TestCodecs(unittest.TestCase):
+	def test_sync_header(self):
+		header = build_header(SMB2Command.READ)
+		data = header.to_bytes()
+		self.assertEqual(len(data), 64)
+		self.assertEqual(data[24:32], (0x1122334455667788).to_bytes(8, byteorder='little'))
+		hdr = SMB2Header_SYNC.from_bytes(data)
+		self.assertEqual(hdr.MessageId, header.MessageId)
+		self.assertEqual(hdr.SessionId, header.SessionId)
+		self.assertEqual(hdr.Command, SMB2Command.READ)
+		self.assertIn(SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR, hdr.Flags)
+
+	def test_async_header(self):
+		header = SMB2Header_ASYNC()
+		header.Command = SMB2Command.CANCEL
+		header.CreditCharge = 0
+		header.Credit = 0
+		header.MessageId = 7
+		header.AsyncId = 0x0102030405060708
+		hdr = SMB2Header_ASYNC.from_bytes(header.to_bytes())
+		self.assertEqual(hdr.AsyncId, 0x0102030405060708)
+		self.assertIn(SMB2HeaderFlag.SMB2_FLAGS_ASYNC_COMMAND, hdr.Flags)
+
+	def test_file_id(self):
+		cmd = CLOSE_REQ()
+		cmd.Flags = CloseFlag.NONE
+		cmd.FileId = 0x0102030405060708090A0B0C0D0E0F10
+		self.assertEqual(cmd.to_bytes()[8:], cmd.FileId.to_bytes(16, byteorder='little'))
+
+	def test_read_reply(self):
+		payload = b'A' * 100
+		body  = (17).to_bytes(2, byteorder='little')
+		body += (80).to_bytes(1, byteorder='little') + b'\x00'
+		body += len(payload).to_bytes(4, byteorder='little') + b'\x00' * 8
+		data = build_header(SMB2Command.READ).to_bytes() + body + payload
+		msg = SMB2Message.from_bytes(data)
+		self.assertEqual(msg.header.Status, NTStatus.SUCCESS)
+		self.assertIsInstance(msg.command, READ_REPLY)
+		self.assertEqual(msg.command.Buffer, payload)
+
+	def test_read_reply_view(self):
+		payload = bytes(range(100))
+		body  = (17).to_bytes(2, byteorder='little')
+		body += (80).to_bytes(1, byteorder='little') + b'\x00'
+		body += len(payload).to_bytes(4, byteorder='little') + b'\x00' * 8
+		data = build_header(SMB2Command.READ).to_bytes() + body + payload
+		msg = SMB2Message.from_bytes(data)
+		target = bytearray(len(payload))
+		memoryview(target)[:] = msg.command.BufferView
+		self.assertEqual(bytes(target), payload)
+
+	def test_lazy_command(self):
+		#the body is invalid, but it is only parsed when the command is accessed
+		data = build_header(SMB2Command.CLOSE).to_bytes() + b'\xFF' * 60
+		msg = SMB2Message.from_bytes(data)
+		self.assertEqual(msg.header.Command, SMB2Command.CLOSE)
+		with self.assertRaises(SMBMessageParseError):
+			msg.command
+		#still fails on the next access instead of returning None
+		with self.assertRaises(SMBMessageParseError):
+			msg.command
+
+	def test_parse_error(self):
+		#commands parsed from io.BytesIO
+		data = build_header(SMB2Command.TREE_CONNECT).to_bytes() + b'\x59\x00' + b'\x00' * 14
+		msg = SMB2Message.from_bytes(data)
+		with self.assertRaises(SMBMessageParseError) as ctx:
+			msg.command
+		self.assertIn('TREE_CONNECT_REPLY', str(ctx.exception))
+
+if __name__ == '__main__':
+	unittest.main()
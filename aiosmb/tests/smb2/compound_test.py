@@ -0,0 +1,102 @@
+import unittest
+import asyncio
+
+from aiosmb.protocol.smb2.message import SMB2Message, SMB2Compound, SMB2_RELATED_FILE_ID
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC
+from aiosmb.protocol.smb2.commands import READ_REQ, ECHO_REQ
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.exceptions import SMBConnectionTerminated
+
+def build_msg(command, message_id):
+	header = SMB2Header_SYNC()
+	header.Command = command
+	header.CreditCharge = 1
+	header.CreditReq = 1
+	header.MessageId = message_id
+	if command == SMB2Command.READ:
+		cmd = READ_REQ()
+		cmd.Length = 10
+		cmd.Offset = 0
+		cmd.FileId = SMB2_RELATED_FILE_ID
+		cmd.MinimumCount = 0
+		cmd.RemainingBytes = 0
+	else:
+		cmd = ECHO_REQ()
+	return SMB2Message(header, cmd)
+
+class TestCompound(unittest.TestCase):
+	def test_padding(self):
+		compound = SMB2Compound([build_msg(SMB2Command.READ, 1), build_msg(SMB2Command.ECHO, 2)])
+		compound.set_next_command()
+		first = compound.messages[0]
+		self.assertEqual(first.header.NextCommand % 8, 0)
+		self.assertEqual(len(first.to_bytes()), first.header.NextCommand)
+		self.assertEqual(compound.messages[1].header.NextCommand, 0)
+
+	def test_split(self):
+		compound = SMB2Compound([build_msg(SMB2Command.READ, 1), build_msg(SMB2Command.ECHO, 2), build_msg(SMB2Command.READ, 3)])
+		compound.set_next_command()
+		msgs = SMB2Message.from_compound_bytes(compound.to_bytes())
+		self.assertEqual([msg.header.MessageId for msg in msgs], [1, 2, 3])
+		self.assertEqual(msgs[0].command.FileId, SMB2_RELATED_FILE_ID)
+		self.assertIsInstance(msgs[1].command, ECHO_REQ)
+
+	def test_single(self):
+		data = build_msg(SMB2Command.ECHO, 5).to_bytes()
+		msgs = SMB2Message.from_compound_bytes(data)
+		self.assertEqual(len(msgs), 1)
+		self.assertEqual(msgs[0].header.MessageId, 5)
+
+	def test_single_serialization(self):
+		msgs = [build_msg(SMB2Command.READ, 1), build_msg(SMB2Command.ECHO, 2)]
+		calls = []
+		for msg in msgs:
+			to_bytes = msg.command.to_bytes
+			def counted(to_bytes = to_bytes):
+				calls.append(1)
+				return to_bytes()
+			msg.command.to_bytes = counted
+		data = SMB2Compound(msgs).to_bytes()
+		self.assertEqual(len(calls), 2)
+		self.assertEqual(msgs[0].header.NextCommand % 8, 0)
+		self.assertEqual(int.from_bytes(data[20:24], 'little'), msgs[0].header.NextCommand)
+		self.assertEqual(len(data), msgs[0].header.NextCommand + 64 + len(ECHO_REQ().to_bytes()))
+
+class TestCompoundSend(unittest.TestCase):
+	def build_connection(self, available):
+		connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+		connection.status = SMBConnectionStatus.RUNNING
+		connection.credits.available = available
+		return connection
+
+	def test_session_closed(self):
+		async def run():
+			connection = self.build_connection(10)
+			connection.session_closed = True
+			with self.assertRaises(SMBConnectionTerminated):
+				await connection.compound([build_msg(SMB2Command.ECHO, 0)])
+
+		asyncio.run(run())
+
+	def test_credits_released(self):
+		async def run():
+			#the second message has to wait for credits that never arrive
+			connection = self.build_connection(1)
+			msgs = [build_msg(SMB2Command.ECHO, 0), build_msg(SMB2Command.ECHO, 0)]
+			task = asyncio.ensure_future(connection.sendSMBCompound(msgs))
+			await asyncio.sleep(0)
+			self.assertEqual(connection.credits.available, 0)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			self.assertEqual(connection.credits.available, 1)
+			self.assertEqual(connection.credits.in_flight, 0)
+			#the MessageId of the unsent first message is handed out again
+			self.assertEqual((await connection.credits.reserve(1))[0], 0)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import asyncio
+
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.smbcredential import SMBCredential
+from aiosmb.smbconnection import SMBConnectionStatus
+from aiosmb.smbconnectionpool import SMBConnectionPool
+
+class FakeConnection:
+	def __init__(self, target, credential):
+		self.target = target
+		self.credential = credential
+		self.status = SMBConnectionStatus.RUNNING
+		self.session_closed = False
+		self.echo_ok = True
+		self.echo_count = 0
+
+	async def echo(self, timeout = None):
+		self.echo_count += 1
+		await asyncio.sleep(0)
+		if self.echo_ok is False:
+			raise Exception('dead')
+
+	async def terminate(self):
+		self.status = SMBConnectionStatus.CLOSED
+
+def build(ip, username):
+	target = SMBTarget()
+	target.ip = ip
+	credential = SMBCredential()
+	credential.domain = 'TEST'
+	credential.username = username
+	credential.secret = 'Passw0rd!1'
+	return target, credential
+
+class TestConnectionPool(unittest.TestCase):
+	def setUp(self):
+		self.created = []
+
+	async def factory(self, target, credential):
+		connection = FakeConnection(target, credential)
+		self.created.append(connection)
+		return connection
+
+	def test_reuse(self):
+		async def run():
+			async with SMBConnectionPool(connection_factory = self.factory) as pool:
+				target, credential = build('10.0.0.1', 'victim')
+				async with pool.checkout(target, credential) as first:
+					pass
+				#new objects with the same fields must map to the same session
+				target, credential = build('10.0.0.1', 'victim')
+				async with pool.checkout(target, credential) as second:
+					pass
+				self.assertIs(first, second)
+				target, credential = build('10.0.0.1', 'other')
+				async with pool.checkout(target, credential) as third:
+					pass
+				self.assertIsNot(first, third)
+				self.assertEqual(len(self.created), 2)
+			self.assertEqual(first.status, SMBConnectionStatus.CLOSED)
+
+		asyncio.run(run())
+
+	def test_max_per_host(self):
+		async def run():
+			pool = SMBConnectionPool(max_per_host = 1, connection_factory = self.factory)
+			target, credential = build('10.0.0.1', 'victim')
+			first = await pool.acquire(target, credential)
+			task = asyncio.ensure_future(pool.acquire(target, credential))
+			await asyncio.sleep(0)
+			self.assertFalse(task.done())
+			await pool.release(first)
+			self.assertIs(await task, first)
+			await pool.release(first)
+
+			#an idle connection with other credentials is closed to stay within the limit
+			target, credential = build('10.0.0.1', 'other')
+			other = await pool.acquire(target, credential)
+			await asyncio.sleep(0)
+			self.assertEqual(first.status, SMBConnectionStatus.CLOSED)
+			await pool.release(other)
+			await pool.close()
+
+		asyncio.run(run())
+
+	def test_health_check(self):
+		async def run():
+			pool = SMBConnectionPool(health_check_interval = 0, connection_factory = self.factory)
+			target, credential = build('10.0.0.1', 'victim')
+			async with pool.checkout(target, credential) as first:
+				first.echo_ok = False
+			await asyncio.sleep(0.01)
+			async with pool.checkout(target, credential) as second:
+				pass
+			self.assertEqual(first.echo_count, 1)
+			self.assertEqual(first.status, SMBConnectionStatus.CLOSED)
+			self.assertIsNot(first, second)
+			await pool.close()
+
+		asyncio.run(run())
+
+	def test_concurrent_acquire(self):
+		async def run():
+			pool = SMBConnectionPool(health_check_interval = 0, connection_factory = self.factory)
+			target, credential = build('10.0.0.1', 'victim')
+			first = await pool.acquire(target, credential)
+			second = await pool.acquire(target, credential)
+			await pool.release(first)
+			await pool.release(second)
+
+			#the idle connections are health checked at the same time, the third acquire finds none left
+			connections = await asyncio.gather(*[pool.acquire(target, credential) for _ in range(3)])
+			self.assertEqual(set(connections[:2]), set([first, second]))
+			self.assertEqual(len(self.created), 3)
+			self.assertEqual(pool.idle, {})
+			for connection in connections:
+				self.assertEqual(connection.status, SMBConnectionStatus.RUNNING)
+				await pool.release(connection)
+			await pool.close()
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
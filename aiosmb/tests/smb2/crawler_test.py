@@ -0,0 +1,121 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.smbcrawler import SMBCrawler
+from aiosmb.smbconnection import SMBConnection
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.exceptions import SMBConnectionTerminated
+from aiosmb.fscc.FileAttributes import FileAttributes
+
+DIR = FileAttributes.FILE_ATTRIBUTE_DIRECTORY
+
+class FakeConnection:
+	"""
+	Serves a directory tree from a dict, path -> {name: subtree or None for files}
+	"""
+	def __init__(self, tree):
+		self.tree = tree
+		self.handles = {}
+		self.max_open = 0
+		self.disconnected = False
+
+	async def tree_connect(self, share_name):
+		return SimpleNamespace(tree_id = 1)
+
+	async def tree_disconnect(self, tree_id):
+		self.disconnected = True
+
+	def lookup(self, path):
+		node = self.tree
+		for part in path.split('\\') if path else []:
+			node = node[part]
+		return node
+
+	async def create(self, tree_id, path, desired_access, share_mode, create_options, create_disposition, file_attrs):
+		await asyncio.sleep(0)
+		node = self.lookup(path)
+		if node == 'denied':
+			raise Exception('access denied')
+		file_id = len(self.handles) + 100
+		self.handles[file_id] = node
+		self.max_open = max(self.max_open, len([h for h in self.handles.values() if h is not None]))
+		return file_id
+
+	async def query_directory_iter(self, tree_id, file_id, information_class = None, maxBufferSize = None):
+		for name in ['.', '..'] + sorted(self.handles[file_id].keys()):
+			await asyncio.sleep(0)
+			child = self.handles[file_id].get(name)
+			yield SimpleNamespace(FileName = name, FileAttributes = DIR if name in ['.', '..'] or child is not None else 0)
+
+	async def close(self, tree_id, file_id):
+		self.handles[file_id] = None
+
+def build_tree():
+	tree = {}
+	for i in range(10):
+		tree['dir%d' % i] = {'file%d' % j: None for j in range(5)}
+		tree['dir%d' % i]['sub'] = {'deep.txt': None}
+	tree['Windows'] = {'system.ini': None}
+	tree['secret'] = 'denied'
+	tree['root.txt'] = None
+	return tree
+
+async def collect(crawler, **kwargs):
+	return [entry async for entry in crawler.crawl('\\\\srv\\share', **kwargs)]
+
+class TestCrawler(unittest.TestCase):
+	def test_crawl(self):
+		async def run():
+			connection = FakeConnection(build_tree())
+			entries = await collect(SMBCrawler(connection, concurrency = 4, exclude_dirs = ['windows']))
+			paths = set(entry.path for entry in entries if entry.error is None)
+			self.assertIn('dir3\\sub\\deep.txt', paths)
+			self.assertIn('Windows', paths)
+			self.assertNotIn('Windows\\system.ini', paths)
+			self.assertEqual(len(paths), 1 + 1 + 1 + 10 * (1 + 5 + 1 + 1))
+			errors = [entry for entry in entries if entry.error is not None]
+			self.assertEqual([entry.path for entry in errors], ['secret'])
+			self.assertLessEqual(connection.max_open, 4)
+			self.assertTrue(all(handle is None for handle in connection.handles.values()))
+			self.assertTrue(connection.disconnected)
+
+			#every directory comes before its content
+			seen = set([''])
+			for entry in entries:
+				self.assertIn(entry.path.rsplit('\\', 1)[0] if '\\' in entry.path else '', seen)
+				seen.add(entry.path)
+
+		asyncio.run(run())
+
+	def test_depth_and_break(self):
+		async def run():
+			connection = FakeConnection(build_tree())
+			entries = await collect(SMBCrawler(connection, max_depth = 1), path = 'dir1')
+			self.assertEqual(sorted(entry.path for entry in entries), sorted(['dir1\\file%d' % j for j in range(5)] + ['dir1\\sub', 'dir1\\sub\\deep.txt']))
+			entries = await collect(SMBCrawler(connection, max_depth = 0))
+			self.assertEqual(max(entry.depth for entry in entries), 1)
+
+			#stopping early closes everything
+			connection = FakeConnection(build_tree())
+			results = SMBCrawler(connection, concurrency = 8).crawl('\\\\srv\\share')
+			async for entry in results:
+				if entry.depth == 2:
+					break
+			await results.aclose()
+			self.assertTrue(all(handle is None for handle in connection.handles.values()))
+			self.assertTrue(connection.disconnected)
+
+		asyncio.run(run())
+
+	def test_session_closed(self):
+		async def run():
+			connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+			connection.session_closed = True
+			with self.assertRaises(SMBConnectionTerminated):
+				await collect(SMBCrawler(connection))
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
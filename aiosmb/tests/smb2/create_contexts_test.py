@@ -0,0 +1,74 @@
+import unittest
+
+from aiosmb.protocol.smb2.message import SMB2Message
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.protocol.smb2.commands import CREATE_REQ, OplockLevel, ImpersonationLevel, ShareAccess, CreateDisposition, CreateOptions, \
+	SMB2CreateContextList, SMB2_CREATE_CONTEXT, SMB2CreateContextName, SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2, SMB2_CREATE_DURABLE_HANDLE_RECONNECT, \
+	SMB2_CREATE_REQUEST_LEASE, SMB2_CREATE_REQUEST_LEASE_V2, LeaseState
+from aiosmb.dtyp.constrcuted_security.guid import GUID
+
+def build_contexts():
+	request = SMB2_CREATE_DURABLE_HANDLE_REQUEST_V2()
+	request.Timeout = 30000
+	request.CreateGuid = GUID.random()
+	reconnect = SMB2_CREATE_DURABLE_HANDLE_RECONNECT()
+	reconnect.FileId = (7 << 64) | 3
+	return SMB2CreateContextList([
+		SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2, request),
+		SMB2_CREATE_CONTEXT(SMB2CreateContextName.DURABLE_HANDLE_RECONNECT, reconnect),
+		SMB2_CREATE_CONTEXT(b'XXXX', b'\x01\x02\x03'),
+	])
+
+class TestCreateContexts(unittest.TestCase):
+	def test_context_chain(self):
+		contexts = build_contexts()
+		data = contexts.to_bytes()
+		parsed = SMB2CreateContextList.from_bytes(data, is_reply = False)
+		self.assertEqual([ctx.Name for ctx in parsed], [b'DH2Q', b'DHnC', b'XXXX'])
+		#every context starts 8 byte aligned
+		self.assertEqual(parsed[0].Next % 8, 0)
+		self.assertEqual(parsed[1].Next % 8, 0)
+		self.assertEqual(parsed[2].Next, 0)
+		self.assertEqual(parsed[0].Data.Timeout, 30000)
+		self.assertIn(contexts[0].Data.CreateGuid.to_bytes(), data)
+		self.assertEqual(parsed.get(SMB2CreateContextName.DURABLE_HANDLE_RECONNECT).Data.FileId, (7 << 64) | 3)
+		self.assertEqual(parsed[2].Data, b'\x01\x02\x03')
+
+	def test_lease_contexts(self):
+		for cls, size in [(SMB2_CREATE_REQUEST_LEASE, 32), (SMB2_CREATE_REQUEST_LEASE_V2, 52)]:
+			request = cls()
+			request.LeaseKey = bytes(range(16))
+			request.LeaseState = LeaseState.SMB2_LEASE_READ_CACHING | LeaseState.SMB2_LEASE_HANDLE_CACHING
+			data = SMB2CreateContextList([SMB2_CREATE_CONTEXT(SMB2CreateContextName.REQUEST_LEASE, request)]).to_bytes()
+			ctx = SMB2CreateContextList.from_bytes(data)[0]
+			self.assertEqual(ctx.DataLength, size)
+			#the version is told apart by the data length
+			self.assertIsInstance(ctx.Data, cls)
+			self.assertEqual(ctx.Data.LeaseKey, bytes(range(16)))
+			self.assertEqual(ctx.Data.LeaseState, 3)
+
+	def test_create_request(self):
+		command = CREATE_REQ()
+		command.RequestedOplockLevel = OplockLevel.SMB2_OPLOCK_LEVEL_BATCH
+		command.ImpersonationLevel = ImpersonationLevel.Impersonation
+		command.DesiredAccess = 0x120089
+		command.FileAttributes = 0
+		command.ShareAccess = ShareAccess.FILE_SHARE_READ
+		command.CreateDisposition = CreateDisposition.FILE_OPEN
+		command.CreateOptions = CreateOptions.FILE_NON_DIRECTORY_FILE
+		command.Name = 'dir\\file.txt'
+		command.CreateContext = build_contexts()
+		header = SMB2Header_SYNC()
+		header.Command = SMB2Command.CREATE
+		header.CreditCharge = 1
+		header.CreditReq = 1
+		header.MessageId = 2
+
+		msg = SMB2Message.from_bytes(SMB2Message(header, command).to_bytes())
+		self.assertEqual(msg.command.Name, 'dir\\file.txt')
+		self.assertEqual(msg.command.CreateContextsOffset % 8, 0)
+		self.assertEqual(msg.command.CreateContext.get(SMB2CreateContextName.DURABLE_HANDLE_REQUEST_V2).Data.Timeout, 30000)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.commons.smbcredits import SMBCreditWindow
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus, FileHandle
+from aiosmb.exceptions import SMBException
+
+class TestCreditWindow(unittest.TestCase):
+	def test_message_ids(self):
+		async def run():
+			window = SMBCreditWindow(initial = 10)
+			self.assertEqual((await window.reserve(1))[0], 0)
+			self.assertEqual((await window.reserve(4))[0], 1)
+			self.assertEqual((await window.reserve(1))[0], 5)
+			self.assertEqual(window.available, 4)
+			self.assertEqual(window.in_flight, 6)
+
+		asyncio.run(run())
+
+	def test_queue_on_exhausted_window(self):
+		async def run():
+			window = SMBCreditWindow(initial = 1)
+			message_id, _ = await window.reserve(1)
+			task = asyncio.ensure_future(window.reserve(2))
+			await asyncio.sleep(0)
+			self.assertFalse(task.done())
+			self.assertEqual(window.pending, 1)
+
+			window.grant(message_id, 1)
+			await asyncio.sleep(0)
+			self.assertFalse(task.done())
+
+			window.grant(0xFFFFFFFFFFFFFFFF, 1) #unsolicited
+			await asyncio.sleep(0)
+			self.assertEqual((await task)[0], 1)
+			self.assertEqual(window.available, 0)
+
+		asyncio.run(run())
+
+	def test_interim_reply(self):
+		async def run():
+			window = SMBCreditWindow(initial = 1)
+			message_id, _ = await window.reserve(1)
+			window.grant(message_id, 1, is_final = False)
+			self.assertIn(message_id, window.outstanding)
+			window.grant(message_id, 0)
+			self.assertNotIn(message_id, window.outstanding)
+			self.assertEqual(window.available, 1)
+			self.assertEqual(window.in_flight, 0)
+
+		asyncio.run(run())
+
+	def test_credit_request(self):
+		async def run():
+			window = SMBCreditWindow(target = 16, initial = 1)
+			_, credit_request = await window.reserve(1)
+			self.assertEqual(credit_request, 16)
+			window.grant(0, 16)
+			_, credit_request = await window.reserve(1)
+			self.assertEqual(credit_request, 1)
+
+		asyncio.run(run())
+
+	def test_close(self):
+		async def run():
+			window = SMBCreditWindow(initial = 0)
+			task = asyncio.ensure_future(window.reserve(1))
+			await asyncio.sleep(0)
+			window.close()
+			with self.assertRaises(SMBException):
+				await task
+			with self.assertRaises(SMBException):
+				await window.reserve(1)
+
+		asyncio.run(run())
+
+	def test_refund(self):
+		async def run():
+			window = SMBCreditWindow(initial = 10)
+			first, _ = await window.reserve(2)
+			second, _ = await window.reserve(3)
+			#the most recent reservation was never sent, its MessageIds are used by the next request
+			window.release(second, refund = True)
+			self.assertEqual(window.available, 8)
+			self.assertEqual((await window.reserve(1))[0], 2)
+
+			#a gap can't be refunded, the MessageIds after it are already taken
+			window.release(first, refund = True)
+			self.assertEqual(window.available, 7)
+			self.assertEqual((await window.reserve(1))[0], 3)
+			self.assertEqual(window.in_flight, 2)
+
+		asyncio.run(run())
+
+	def test_refund_cancelled(self):
+		async def run():
+			window = SMBCreditWindow(initial = 1)
+			message_id, _ = await window.reserve(1)
+			task = asyncio.ensure_future(window.reserve(1))
+			await asyncio.sleep(0)
+			#credits arrive, but the waiting request is cancelled before it could use them
+			window.grant(message_id, 1)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			self.assertEqual(window.available, 1)
+			self.assertEqual((await window.reserve(1))[0], 1)
+
+		asyncio.run(run())
+
+class FakeTransport:
+	def __init__(self):
+		self.sent = []
+
+	async def send(self, data):
+		self.sent.append(bytes(data))
+
+class TestCreditCharge(unittest.TestCase):
+	def build_connection(self, multi_credit):
+		connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+		connection.status = SMBConnectionStatus.RUNNING
+		connection.netbios_transport = FakeTransport()
+		connection.TreeConnectTable_id[1] = SimpleNamespace(tree_id = 1, encrypt = False)
+		connection.FileHandleTable[5] = FileHandle()
+		connection.SupportsMultiCredit = multi_credit
+		connection.MaxReadSize = 8*1024*1024
+		connection.MaxWriteSize = 8*1024*1024
+		connection.credits.available = 64
+		self.charges = []
+		async def recvSMB(message_id, timeout = None):
+			#the charge of the request as it went out on the wire
+			self.charges.append(int.from_bytes(connection.netbios_transport.sent[-1][6:8], 'little'))
+			self.assertEqual(connection.credits.in_flight, self.charges[-1])
+			connection.credits.grant(message_id, self.charges[-1])
+			header = SimpleNamespace(Status = NTStatus.SUCCESS)
+			return SimpleNamespace(header = header, command = SimpleNamespace(Buffer = b'', BufferView = memoryview(b''), DataRemaining = 0, Count = 1))
+		connection.recvSMB = recvSMB
+		return connection
+
+	def test_multi_credit(self):
+		async def run():
+			connection = self.build_connection(True)
+			for length in [1, 65536, 65537, 1024*1024]:
+				await connection.read(1, 5, offset = 0, length = length)
+				await connection.write(1, 5, b'\x00' * length)
+			self.assertEqual(self.charges, [1, 1, 1, 1, 2, 2, 16, 16])
+			#capped by the credits we own
+			await connection.read(1, 5, offset = 0, length = 8*1024*1024)
+			self.assertEqual(self.charges[-1], 64)
+
+		asyncio.run(run())
+
+	def test_single_credit(self):
+		async def run():
+			connection = self.build_connection(False)
+			await connection.read(1, 5, offset = 0, length = 1024*1024)
+			await connection.write(1, 5, b'\x00' * 1024*1024)
+			self.assertEqual(self.charges, [1, 1])
+			self.assertEqual(connection.get_max_read_size(), 65536)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import datetime
+
+from aiosmb.fscc.structures.fileinfoclass import FileInfoClass
+from aiosmb.fscc.structures.DirectoryInformation import DirectoryInformationList, FileIdBothDirectoryInformation, \
+	FILE_ID_BOTH_DIRECTORY_INFORMATION_STRUCT, FILE_ID_FULL_DIRECTORY_INFORMATION_STRUCT, FILE_NAMES_INFORMATION_STRUCT, filetime_to_datetime
+from aiosmb.fscc.FileAttributes import FileAttributes
+
+FT = 132000000000000000 #2019-04-17
+
+def build_page(entries):
+	"""
+	entries: list of (fixed part, name), the entries are 8 byte aligned
+	"""
+	data = b''
+	for i, (fixed, name) in enumerate(entries):
+		entry = fixed + name.encode('utf-16-le')
+		if i < len(entries) - 1:
+			entry += b'\x00' * ((8 - len(entry) % 8) % 8)
+			entry = len(entry).to_bytes(4, byteorder = 'little') + entry[4:]
+		data += entry
+	return data
+
+class TestDirectoryInformation(unittest.TestCase):
+	def test_id_both(self):
+		entries = []
+		for i, name in enumerate(['.', 'report.docx']):
+			short_name = 'REPORT~1.DOC'.encode('utf-16-le') if i == 1 else b''
+			fixed = FILE_ID_BOTH_DIRECTORY_INFORMATION_STRUCT.pack(0, i, FT, FT, FT+1, FT+2, 1000*i, 4096*i, FileAttributes.FILE_ATTRIBUTE_ARCHIVE if i else FileAttributes.FILE_ATTRIBUTE_DIRECTORY,
+				len(name)*2, 0, len(short_name), 0, short_name.ljust(24, b'\x00'), 0, 0x1000 + i)
+			entries.append((fixed, name))
+		infos = DirectoryInformationList.from_bytes(build_page(entries), FileInfoClass.FileIdBothDirectoryInformation)
+		self.assertEqual(len(infos), 2)
+		self.assertTrue(infos[0].FileAttributes & FileAttributes.FILE_ATTRIBUTE_DIRECTORY)
+		info = infos[1]
+		self.assertIsInstance(info, FileIdBothDirectoryInformation)
+		self.assertFalse(hasattr(info, '__dict__'))
+		self.assertIsNone(info._name)
+		self.assertEqual(info.FileName, 'report.docx')
+		self.assertEqual(info.ShortName, 'REPORT~1.DOC')
+		self.assertEqual(info.FileId, 0x1001)
+		self.assertEqual(info.EndOfFile, 1000)
+		self.assertEqual(info.LastWriteTime, FT+1)
+		self.assertEqual(filetime_to_datetime(FT).date(), datetime.date(2019, 4, 17))
+
+	def test_id_full_and_names(self):
+		entries = []
+		for i, name in enumerate(['a.txt', 'bb.txt', 'ccc.txt']):
+			entries.append((FILE_ID_FULL_DIRECTORY_INFORMATION_STRUCT.pack(0, i, FT, FT, FT, FT, i, i, 0x20, len(name)*2, 0, 0, 77 + i), name))
+		infos = DirectoryInformationList.from_bytes(build_page(entries), FileInfoClass.FileIdFullDirectoryInformation)
+		self.assertEqual([info.FileName for info in infos], ['a.txt', 'bb.txt', 'ccc.txt'])
+		self.assertEqual([info.FileId for info in infos], [77, 78, 79])
+
+		entries = [(FILE_NAMES_INFORMATION_STRUCT.pack(0, i, len(name)*2), name) for i, name in enumerate(['x', 'long name.bin'])]
+		infos = DirectoryInformationList.from_bytes(build_page(entries), FileInfoClass.FileNamesInformation)
+		self.assertEqual([info.FileName for info in infos], ['x', 'long name.bin'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.commons.smbdispatcher import SMBResponseDispatcher, SMB2_UNSOLICITED_MESSAGE_ID
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.exceptions import SMBConnectionTerminated
+
+def build_msg(message_id, status = NTStatus.SUCCESS, command = SMB2Command.READ, async_id = None):
+	header = SimpleNamespace(MessageId = message_id, Status = status, Command = command)
+	if async_id is not None:
+		header.AsyncId = async_id
+	return SimpleNamespace(header = header)
+
+class TestDispatcher(unittest.TestCase):
+	def test_interim_reply(self):
+		async def run():
+			dispatcher = SMBResponseDispatcher()
+			dispatcher.register(5)
+			task = asyncio.ensure_future(dispatcher.wait(5))
+			dispatcher.dispatch(build_msg(5, NTStatus.PENDING, async_id = b'\x01'*8))
+			await asyncio.sleep(0)
+			self.assertFalse(task.done())
+			self.assertEqual(dispatcher.get_async_id(5), b'\x01'*8)
+
+			dispatcher.dispatch(build_msg(5, async_id = b'\x01'*8))
+			msg = await task
+			self.assertEqual(msg.header.Status, NTStatus.SUCCESS)
+			self.assertEqual(dispatcher.pending, {})
+			self.assertEqual(dispatcher.async_ids, {})
+
+		asyncio.run(run())
+
+	def test_cancelled_wait(self):
+		async def run():
+			dispatcher = SMBResponseDispatcher()
+			dispatcher.register(1)
+			task = asyncio.ensure_future(dispatcher.wait(1))
+			await asyncio.sleep(0)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			self.assertNotIn(1, dispatcher.pending)
+			#late reply is dropped
+			dispatcher.dispatch(build_msg(1))
+
+		asyncio.run(run())
+
+	def test_wait_timeout(self):
+		async def run():
+			dispatcher = SMBResponseDispatcher()
+			dispatcher.register(3)
+			dispatcher.dispatch(build_msg(3, NTStatus.PENDING, async_id = 7))
+			with self.assertRaises(asyncio.TimeoutError):
+				await dispatcher.wait(3, timeout = 0.01)
+			#entry is kept so the request can be cancelled
+			self.assertIn(3, dispatcher.pending)
+			self.assertEqual(dispatcher.get_async_id(3), 7)
+
+		asyncio.run(run())
+
+	def test_notification(self):
+		async def run():
+			dispatcher = SMBResponseDispatcher()
+			received = []
+			dispatcher.add_notification_handler(SMB2Command.OPLOCK_BREAK, received.append)
+			dispatcher.dispatch(build_msg(SMB2_UNSOLICITED_MESSAGE_ID, command = SMB2Command.OPLOCK_BREAK))
+			self.assertEqual(len(received), 1)
+
+		asyncio.run(run())
+
+	def test_fail_all(self):
+		async def run():
+			dispatcher = SMBResponseDispatcher()
+			dispatcher.register(1)
+			task = asyncio.ensure_future(dispatcher.wait(1))
+			await asyncio.sleep(0)
+			dispatcher.fail_all()
+			with self.assertRaises(SMBConnectionTerminated):
+				await task
+			with self.assertRaises(SMBConnectionTerminated):
+				dispatcher.register(2)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
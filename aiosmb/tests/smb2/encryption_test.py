@@ -0,0 +1,99 @@
+import unittest
+import asyncio
+from unittest import mock
+
+from aiosmb.crypto.aead import SMBEncryption, ENCRYPTION_AVAILABLE
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.protocol.smb2.message import SMB2Message, SMB2Transform
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC, SMB2HeaderFlag
+from aiosmb.protocol.smb2.commands import SMB2Cipher, ECHO_REPLY
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+
+KEY = b'\xff' * 16
+PLAINTEXT = b'\x01\x02\x03\x04'
+
+def build_transform(signature, nonce, data):
+	#transform header of a 4 byte message of session 1
+	return b'\xfdSMB' + signature + nonce + (4).to_bytes(4, 'little') + b'\x00\x00' + b'\x01\x00' + (1).to_bytes(8, 'little') + data
+
+def fixed_urandom(length):
+	return b'\xff' * length
+
+@unittest.skipUnless(ENCRYPTION_AVAILABLE, 'cryptography package is not installed')
+class TestEncryption(unittest.TestCase):
+	def test_ccm_vector(self):
+		#same vector as the smbprotocol test suite
+		expected = build_transform(bytes.fromhex('c8730c9ba7e59f1cfd3751a195f2b3ac'), b'\xff' * 11 + b'\x00' * 5, bytes.fromhex('2191e30e'))
+		with mock.patch('os.urandom', fixed_urandom):
+			data = SMBEncryption(SMB2Cipher.AES_128_CCM, KEY, KEY).encrypt(PLAINTEXT, 1)
+		self.assertEqual(bytes(data), expected)
+
+	def test_gcm_vector(self):
+		expected = build_transform(bytes.fromhex('39d83234d753d08ec0fcbe33015f19bd'), b'\xff' * 12 + b'\x00' * 4, bytes.fromhex('da265733'))
+		with mock.patch('os.urandom', fixed_urandom):
+			data = SMBEncryption(SMB2Cipher.AES_128_GCM, KEY, KEY).encrypt(PLAINTEXT, 1)
+		self.assertEqual(bytes(data), expected)
+
+	def test_round_trip(self):
+		client_key, server_key = b'\x01' * 16, b'\x02' * 16
+		message = bytes(range(200))
+		for cipher in [SMB2Cipher.AES_128_CCM, SMB2Cipher.AES_128_GCM]:
+			client = SMBEncryption(cipher, client_key, server_key)
+			server = SMBEncryption(cipher, server_key, client_key)
+			msg = SMB2Transform.from_bytes(bytes(client.encrypt(message, 0x1234)))
+			self.assertEqual(msg.header.SessionId, 0x1234)
+			self.assertEqual(msg.header.OriginalMessageSize, len(message))
+			self.assertEqual(bytes(server.decrypt(msg.header, msg.data)), message)
+			#a client can't decrypt its own messages
+			with self.assertRaises(Exception):
+				client.decrypt(msg.header, msg.data)
+
+	def test_tamper(self):
+		for cipher in [SMB2Cipher.AES_128_CCM, SMB2Cipher.AES_128_GCM]:
+			enc = SMBEncryption(cipher, KEY, KEY)
+			data = enc.encrypt(b'some SMB2 message', 1)
+
+			tampered = bytearray(data)
+			tampered[-1] ^= 1
+			msg = SMB2Transform.from_bytes(bytes(tampered))
+			with self.assertRaises(Exception):
+				enc.decrypt(msg.header, msg.data)
+
+			#the SessionId is authenticated as part of the AAD
+			msg = SMB2Transform.from_bytes(bytes(data))
+			msg.header.SessionId = 2
+			with self.assertRaises(Exception):
+				enc.decrypt(msg.header, msg.data)
+
+	def test_dispatch(self):
+		async def run():
+			client_key, server_key = b'\x01' * 16, b'\x02' * 16
+			connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+			connection.status = SMBConnectionStatus.RUNNING
+			connection.SessionId = 7
+			connection.encryption = SMBEncryption(SMB2Cipher.AES_128_GCM, client_key, server_key)
+			server = SMBEncryption(SMB2Cipher.AES_128_GCM, server_key, client_key)
+
+			header = SMB2Header_SYNC()
+			header.Command = SMB2Command.ECHO
+			header.Flags = SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR
+			header.Status = NTStatus.SUCCESS
+			header.MessageId = 3
+			header.CreditCharge = 1
+			header.CreditReq = 1
+			header.SessionId = 7
+			reply = SMB2Message(header, ECHO_REPLY()).to_bytes()
+
+			fut = connection.dispatcher.register(3)
+			msg = SMB2Transform.from_bytes(bytes(server.encrypt(reply, 7)))
+			connection._SMBConnection__process_smb_in(msg)
+			rply = await asyncio.wait_for(fut, 1)
+			self.assertEqual(rply.header.Command, SMB2Command.ECHO)
+			self.assertEqual(rply.header.Status, NTStatus.SUCCESS)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,300 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.filereader import SMBFileReader
+from aiosmb.smbconnection import SMBConnection
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.exceptions import SMBException, SMBConnectionTerminated
+
+class FakeConnection:
+	"""
+	Serves a file in 4 byte READs, the connection breaks once when the read at fail_offset is issued
+	"""
+	def __init__(self, content, fail_offset = None):
+		self.content = content
+		self.fail_offset = fail_offset
+		self.broken = False
+		self.generation = 0
+		self.FileHandleTable = {}
+		self.read_file_ids = []
+
+	async def tree_connect(self, share_name):
+		return SimpleNamespace(tree_id = 1, maximal_access = 0)
+
+	async def create(self, tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = False, durable = False, lease_state = None):
+		self.FileHandleTable[10] = SimpleNamespace(file_id = 10, tree_id = tree_id, is_durable = durable)
+		return 10, SimpleNamespace(EndofFile = len(self.content))
+
+	def get_max_read_size(self):
+		return 4
+
+	def get_granted_credits(self):
+		return 8
+
+	async def read(self, tree_id, file_id, offset = 0, length = 0):
+		await asyncio.sleep(0)
+		if self.fail_offset is not None and offset >= self.fail_offset:
+			self.fail_offset = None
+			self.broken = True
+		if self.broken is True or file_id not in self.FileHandleTable:
+			raise SMBConnectionTerminated('Connection terminated')
+		self.read_file_ids.append(file_id)
+		return self.content[offset:offset+length], 0
+
+	async def readinto(self, tree_id, file_id, buffer, offset = 0):
+		data, remaining = await self.read(tree_id, file_id, offset = offset, length = len(buffer))
+		buffer[:len(data)] = data
+		return len(data), remaining
+
+	async def reconnect(self, generation = None):
+		if generation is not None and generation != self.generation:
+			return
+		self.broken = False
+		fh = self.FileHandleTable.pop(10)
+		if fh.is_durable is True:
+			fh.file_id = 11
+			self.FileHandleTable[11] = fh
+		self.generation += 1
+
+async def open_reader(connection, durable):
+	reader = SMBFileReader(connection, durable = durable)
+	await reader.open('\\\\srv\\share\\file.bin', 'r')
+	return reader
+
+class TestFileReaderResume(unittest.TestCase):
+	content = bytes(range(64))
+
+	def test_read_resumes(self):
+		async def run():
+			connection = FakeConnection(self.content, fail_offset = 20)
+			reader = await open_reader(connection, True)
+			data = await reader.read()
+			self.assertEqual(data, self.content)
+			self.assertEqual(connection.generation, 1)
+			self.assertEqual(connection.read_file_ids[-1], 11)
+			self.assertEqual(reader.position, len(self.content))
+
+		asyncio.run(run())
+
+	def test_readinto_resumes(self):
+		async def run():
+			connection = FakeConnection(self.content, fail_offset = 36)
+			reader = await open_reader(connection, True)
+			buffer = bytearray(len(self.content))
+			self.assertEqual(await reader.readinto(buffer), len(self.content))
+			self.assertEqual(bytes(buffer), self.content)
+
+		asyncio.run(run())
+
+	def test_not_durable(self):
+		async def run():
+			connection = FakeConnection(self.content, fail_offset = 20)
+			reader = await open_reader(connection, False)
+			with self.assertRaises(SMBConnectionTerminated):
+				await reader.read()
+			self.assertEqual(connection.generation, 0)
+
+		asyncio.run(run())
+
+class PipelineConnection(FakeConnection):
+	"""
+	Counts the READs in flight, reads starting at short_offset return one byte less than asked.
+	Reads after the first one wait for gate if it is given.
+	"""
+	def __init__(self, content, credits = 8, short_offset = None, end_of_file = None, gate = None):
+		super().__init__(content)
+		self.gate = gate
+		self.credits = credits
+		self.short_offset = short_offset
+		self.end_of_file = end_of_file if end_of_file is not None else len(content)
+		self.in_flight = 0
+		self.max_in_flight = 0
+		self.offsets = []
+
+	async def create(self, tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = False, durable = False, lease_state = None):
+		file_id, reply = await super().create(tree_id, file_path, desired_access, share_mode, create_options, create_disposition, file_attrs, return_reply = return_reply, durable = durable)
+		return file_id, SimpleNamespace(EndofFile = self.end_of_file)
+
+	def get_granted_credits(self):
+		return self.credits
+
+	async def read(self, tree_id, file_id, offset = 0, length = 0):
+		self.offsets.append(offset)
+		self.in_flight += 1
+		self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		try:
+			await asyncio.sleep(0)
+			if self.gate is not None and offset > 0:
+				await self.gate.wait()
+			if offset == self.short_offset:
+				length -= 1
+			return self.content[offset:offset+length], 0
+		finally:
+			self.in_flight -= 1
+
+class TestFileReaderPipeline(unittest.TestCase):
+	content = bytes(range(64))
+
+	def test_window(self):
+		async def run():
+			connection = PipelineConnection(self.content, credits = 3)
+			reader = await open_reader(connection, False)
+			self.assertEqual(await reader.read(), self.content)
+			#bounded by the credits
+			self.assertEqual(connection.max_in_flight, 3)
+
+			connection = PipelineConnection(self.content, credits = 100)
+			reader = await open_reader(connection, False)
+			reader.read_window = 2
+			self.assertEqual(await reader.read(), self.content)
+			self.assertEqual(connection.max_in_flight, 2)
+
+		asyncio.run(run())
+
+	def test_short_read(self):
+		async def run():
+			connection = PipelineConnection(self.content, short_offset = 8)
+			reader = await open_reader(connection, False)
+			self.assertEqual(await reader.read(), self.content)
+			#the missing byte is asked for before the data after it is used
+			self.assertIn(11, connection.offsets)
+			self.assertEqual(reader.position, len(self.content))
+
+		asyncio.run(run())
+
+	def test_eof(self):
+		async def run():
+			#the file got shorter since it was opened
+			connection = PipelineConnection(self.content[:10], end_of_file = 64)
+			reader = await open_reader(connection, False)
+			self.assertEqual(await reader.read(), self.content[:10])
+			self.assertEqual(connection.in_flight, 0)
+
+		asyncio.run(run())
+
+	def test_drain(self):
+		async def run():
+			gate = asyncio.Event()
+			connection = PipelineConnection(self.content, gate = gate)
+			reader = await open_reader(connection, False)
+			chunks = reader.read_chunked()
+			self.assertEqual(await chunks.__anext__(), self.content[:4])
+			self.assertGreater(connection.in_flight, 0)
+			asyncio.get_running_loop().call_later(0.01, gate.set)
+			await chunks.aclose()
+			#the replies of the reads still in flight were consumed
+			self.assertEqual(connection.in_flight, 0)
+
+		asyncio.run(run())
+
+	def test_session_closed(self):
+		async def run():
+			connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+			connection.session_closed = True
+			with self.assertRaises(SMBConnectionTerminated):
+				await connection.read(1, 5, offset = 0, length = 4)
+			with self.assertRaises(SMBConnectionTerminated):
+				await connection.readinto(1, 5, bytearray(4))
+
+		asyncio.run(run())
+
+class WriteConnection(FakeConnection):
+	"""
+	Collects the WRITEs, every WRITE completes after the ones sent before it. Writes at fail_offset fail,
+	writes at short_offset write one byte less than asked
+	"""
+	def __init__(self, fail_offset = None, short_offset = None, zero_offset = None):
+		super().__init__(b'')
+		self.fail_offset = fail_offset
+		self.short_offset = short_offset
+		self.zero_offset = zero_offset
+		self.content = bytearray()
+		self.writes = []
+		self.calls = []
+
+	def get_max_write_size(self):
+		return 4
+
+	async def write(self, tree_id, file_id, data, offset = 0):
+		self.assertIsView(data)
+		self.writes.append((offset, bytes(data)))
+		await asyncio.sleep(0)
+		if offset == self.fail_offset:
+			raise SMBException('write failed')
+		if offset == self.zero_offset:
+			return 0
+		count = len(data) - 1 if offset == self.short_offset else len(data)
+		if len(self.content) < offset + count:
+			self.content += b'\x00' * (offset + count - len(self.content))
+		self.content[offset:offset+count] = data[:count]
+		return count
+
+	def assertIsView(self, data):
+		#the remaining part of a short write must not be copied
+		if isinstance(data, memoryview) is False:
+			raise AssertionError('WRITE data is not a memoryview')
+
+	async def flush(self, tree_id, file_id):
+		self.calls.append(('flush', len(self.content)))
+
+	async def close(self, tree_id, file_id):
+		self.calls.append(('close', len(self.content)))
+
+	async def tree_disconnect(self, tree_id):
+		self.calls.append(('tree_disconnect', len(self.content)))
+
+async def open_writer(connection):
+	writer = SMBFileReader(connection, write_window = 2)
+	await writer.open('\\\\srv\\share\\file.bin', 'w')
+	return writer
+
+class TestFileReaderWrite(unittest.TestCase):
+	content = bytes(range(30))
+
+	def test_write_behind(self):
+		async def run():
+			connection = WriteConnection(short_offset = 4)
+			writer = await open_writer(connection)
+			for i in range(0, len(self.content), 3):
+				self.assertEqual(await writer.write(self.content[i:i+3]), 3)
+			#full chunks are already on the way, the tail is still buffered
+			self.assertLess(len(connection.writes), 10)
+			await writer.close()
+			self.assertEqual(bytes(connection.content), self.content)
+			#chunks are dispatched in file order, the short write is completed before the file is flushed
+			offsets = [offset for offset, _ in connection.writes]
+			self.assertEqual(offsets, [0, 4, 7, 8, 12, 16, 20, 24, 28])
+			self.assertEqual(connection.calls, [('flush', 30), ('close', 30), ('tree_disconnect', 30)])
+
+		asyncio.run(run())
+
+	def test_error(self):
+		async def run():
+			connection = WriteConnection(fail_offset = 8)
+			writer = await open_writer(connection)
+			#surfaces at the next write that has to wait for the failed one, or at flush
+			with self.assertRaises(SMBException):
+				await writer.write(self.content)
+				await writer.flush()
+			self.assertEqual(bytes(connection.content[:8]), self.content[:8])
+
+			connection = WriteConnection(zero_offset = 0)
+			writer = await open_writer(connection)
+			await writer.write(self.content[:2])
+			with self.assertRaises(SMBException):
+				await writer.flush()
+			self.assertEqual(len(connection.writes), 1)
+
+			#the handle and the tree are released even if the data couldn't be written
+			connection = WriteConnection(fail_offset = 0)
+			writer = await open_writer(connection)
+			await writer.write(self.content[:2])
+			with self.assertRaises(SMBException):
+				await writer.close()
+			self.assertEqual([call for call, _ in connection.calls], ['close', 'tree_disconnect'])
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+import hashlib
+import importlib.util
+
+from aiosmb.crypto.kdf import KDF_CounterMode
+from aiosmb.smbconnection import SMBConnection
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.protocol.smb2.commands import NegotiateDialects, SMB2SigningAlgorithm
+
+CRYPTOGRAPHY_AVAILABLE = importlib.util.find_spec('cryptography') is not None
+if CRYPTOGRAPHY_AVAILABLE is True:
+	from cryptography.hazmat.primitives import hashes
+	from cryptography.hazmat.primitives.kdf.kbkdf import KBKDFHMAC, CounterLocation, Mode
+	from cryptography.hazmat.backends import default_backend
+
+# SMB 3.0 example of the "Encryption in SMB 3.0: A protocol perspective" Open Specifications blog post
+SMB30_SESSION_KEY = bytes.fromhex('B4546771B515F766A86735532DD6C4F0')
+SMB30_ENCRYPTION_KEY = bytes.fromhex('261B72350558F2E9DCF613070383EDBF')
+SMB30_DECRYPTION_KEY = bytes.fromhex('8FE2B57EC34D2DB5B1A9727F526BBDB5')
+
+# SMB 3.1.1: session key and preauth hash of an arbitrary session
+SMB311_SESSION_KEY = bytes.fromhex('270E1BA896585EEB7AF3472D3B4C75A7')
+SMB311_PREAUTH_HASH = hashlib.sha512(b'preauth integrity hash of the session').digest()
+
+def reference_kdf(key, label, context):
+	#SP800-108 counter mode as implemented by the cryptography package
+	kdf = KBKDFHMAC(
+		algorithm = hashes.SHA256(), mode = Mode.CounterMode, length = 16, rlen = 4, llen = 4,
+		location = CounterLocation.BeforeFixed, label = label, context = context, fixed = None, backend = default_backend()
+	)
+	return kdf.derive(key)
+
+def derive(dialect, session_key, preauth_hash = None):
+	connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+	connection.selected_dialect = dialect
+	connection.SigningAlgorithmId = SMB2SigningAlgorithm.HMAC_SHA256 #no cryptography needed for the signer
+	connection.SessionKey = session_key
+	connection.SessionPreauthIntegrityHashValue = preauth_hash
+	connection._SMBConnection__derive_session_keys()
+	return connection
+
+class TestKDF(unittest.TestCase):
+	def test_smb30_vector(self):
+		for dialect in [NegotiateDialects.SMB300, NegotiateDialects.SMB302]:
+			connection = derive(dialect, SMB30_SESSION_KEY)
+			self.assertEqual(connection.EncryptionKey, SMB30_ENCRYPTION_KEY)
+			self.assertEqual(connection.DecryptionKey, SMB30_DECRYPTION_KEY)
+
+	@unittest.skipUnless(CRYPTOGRAPHY_AVAILABLE, 'cryptography package is not installed')
+	def test_smb30_signing_key(self):
+		connection = derive(NegotiateDialects.SMB300, SMB30_SESSION_KEY)
+		self.assertEqual(connection.SigningKey, reference_kdf(SMB30_SESSION_KEY, b'SMB2AESCMAC\x00', b'SmbSign\x00'))
+		self.assertEqual(connection.ApplicationKey, reference_kdf(SMB30_SESSION_KEY, b'SMB2APP\x00', b'SmbRpc\x00'))
+
+	@unittest.skipUnless(CRYPTOGRAPHY_AVAILABLE, 'cryptography package is not installed')
+	def test_smb311(self):
+		connection = derive(NegotiateDialects.SMB311, SMB311_SESSION_KEY, SMB311_PREAUTH_HASH)
+		self.assertEqual(connection.SigningKey, reference_kdf(SMB311_SESSION_KEY, b'SMBSigningKey\x00', SMB311_PREAUTH_HASH))
+		self.assertEqual(connection.ApplicationKey, reference_kdf(SMB311_SESSION_KEY, b'SMBAppKey\x00', SMB311_PREAUTH_HASH))
+		self.assertEqual(connection.EncryptionKey, reference_kdf(SMB311_SESSION_KEY, b'SMBC2SCipherKey\x00', SMB311_PREAUTH_HASH))
+		self.assertEqual(connection.DecryptionKey, reference_kdf(SMB311_SESSION_KEY, b'SMBS2CCipherKey\x00', SMB311_PREAUTH_HASH))
+		#the preauth hash is the context, a different session gets different keys
+		other = derive(NegotiateDialects.SMB311, SMB311_SESSION_KEY, hashlib.sha512(b'other session').digest())
+		self.assertNotEqual(connection.SigningKey, other.SigningKey)
+
+	def test_length(self):
+		#L is part of the PRF input, a longer key doesn't start with the shorter one
+		key = KDF_CounterMode(SMB30_SESSION_KEY, b'SMB2AESCCM\x00', b'ServerIn \x00', 256)
+		self.assertEqual(len(key), 32)
+		self.assertNotEqual(key[:16], SMB30_ENCRYPTION_KEY)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from types import SimpleNamespace
+
+from aiosmb.commons.smbleasecache import SMBLeaseCache
+from aiosmb.protocol.smb2.commands import LeaseState
+
+RH = LeaseState.SMB2_LEASE_READ_CACHING | LeaseState.SMB2_LEASE_HANDLE_CACHING
+
+def create_reply(size, last_write_time = 1):
+	return SimpleNamespace(LastWriteTime = last_write_time, ChangeTime = last_write_time, EndofFile = size)
+
+class TestLeaseCache(unittest.TestCase):
+	content = bytes(range(256)) * 40 #10240 bytes, the last block is partial
+
+	def open(self, cache, last_write_time = 1, state = RH):
+		lease_key = cache.get_lease_key('\\\\srv\\share', 'dir\\file.txt')
+		return cache.opened(lease_key, state, 0, create_reply(len(self.content), last_write_time))
+
+	def fill(self, cache, entry):
+		cache.store(entry, entry.version, 0, self.content)
+
+	def test_blocks(self):
+		cache = SMBLeaseCache(block_size = 4096)
+		entry = self.open(cache)
+		self.assertIsNone(cache.read(entry, 0, 100))
+		#only whole blocks are kept from an unaligned read
+		cache.store(entry, entry.version, 100, self.content[100:8292])
+		self.assertEqual(list(entry.blocks.keys()), [1])
+		self.fill(cache, entry)
+		self.assertEqual(cache.size, len(self.content))
+		self.assertEqual(cache.read(entry, 4000, 5000), self.content[4000:9000])
+		#reads are truncated at the end of the file
+		self.assertEqual(cache.read(entry, 10000, 4096), self.content[10000:])
+		self.assertEqual(cache.read(entry, 20000, 4096), b'')
+		buffer = bytearray(3000)
+		self.assertEqual(cache.readinto(entry, 3000, buffer), 3000)
+		self.assertEqual(bytes(buffer), self.content[3000:6000])
+
+	def test_lease_break(self):
+		cache = SMBLeaseCache(block_size = 4096)
+		entry = self.open(cache)
+		version = entry.version
+		#a break while a read is in flight must not let the old data in
+		cache.lease_break(entry.lease_key, LeaseState.SMB2_LEASE_NONE)
+		cache.store(entry, version, 0, self.content)
+		self.assertEqual(cache.size, 0)
+		self.assertIsNone(cache.read(entry, 0, 10))
+		#losing only handle caching keeps the data
+		entry = self.open(cache)
+		self.fill(cache, entry)
+		cache.lease_break(entry.lease_key, LeaseState.SMB2_LEASE_READ_CACHING)
+		self.assertEqual(cache.read(entry, 0, 10), self.content[:10])
+
+	def test_reopen(self):
+		cache = SMBLeaseCache(block_size = 4096)
+		entry = self.open(cache)
+		self.fill(cache, entry)
+		cache.closed(entry.lease_key)
+		self.assertIsNone(cache.read(entry, 0, 10))
+		#same file, same lease key. unchanged files keep their data
+		entry = self.open(cache)
+		self.assertEqual(cache.read(entry, 0, 10), self.content[:10])
+		cache.closed(entry.lease_key)
+		entry = self.open(cache, last_write_time = 2)
+		self.assertIsNone(cache.read(entry, 0, 10))
+
+	def test_evict(self):
+		cache = SMBLeaseCache(max_size = 16384, block_size = 4096)
+		entry = self.open(cache)
+		self.fill(cache, entry)
+		cache.closed(entry.lease_key)
+		other = cache.opened(cache.get_lease_key('\\\\srv\\share', 'other.txt'), RH, 0, create_reply(8192))
+		cache.store(other, other.version, 0, bytes(8192))
+		#the closed file goes first
+		self.assertEqual(cache.size, 8192)
+		self.assertEqual(len(cache.entries), 1)
+
+	def test_lease_key(self):
+		cache = SMBLeaseCache()
+		lease_key = cache.get_lease_key('\\\\srv\\share', 'dir\\file.txt')
+		self.assertEqual(len(lease_key), 16)
+		self.assertEqual(cache.get_lease_key('\\\\SRV\\share', 'DIR\\file.txt'), lease_key)
+		self.assertNotEqual(cache.get_lease_key('\\\\srv\\share', 'dir\\other.txt'), lease_key)
+		self.assertNotEqual(SMBLeaseCache().get_lease_key('\\\\srv\\share', 'dir\\file.txt'), lease_key)
+		#opens without a granted lease leave nothing behind
+		for i in range(100):
+			cache.get_lease_key('\\\\srv\\share', 'file%d.txt' % i)
+		self.assertEqual(len(cache.entries), 0)
+		self.assertIsNone(cache.get_entry(lease_key))
+
+		entry = self.open(cache)
+		self.assertIs(cache.get_entry(lease_key), entry)
+		cache.closed(lease_key)
+		self.assertEqual(len(cache.entries), 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+import hashlib
+import hmac
+
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.crypto.signing import get_signer
+from aiosmb.protocol.smb2.message import SMB2Message
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC, SMB2HeaderFlag
+from aiosmb.protocol.smb2.commands import NegotiateDialects, SMB2SigningAlgorithm, SESSION_SETUP_REPLY
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+
+def build_connection(available):
+	connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+	connection.status = SMBConnectionStatus.RUNNING
+	connection.credits.available = available
+	return connection
+
+class FakeTransport:
+	def __init__(self):
+		self.sent = []
+
+	async def send(self, data):
+		self.sent.append(bytes(data))
+
+class FakeGSSAPI:
+	def __init__(self):
+		self.rounds = 0
+
+	async def authenticate(self, authdata):
+		self.rounds += 1
+		return b'token %d' % self.rounds, None
+
+	def get_session_key(self):
+		return b'\x05' * 16
+
+def build_reply(message_id, status):
+	header = SMB2Header_SYNC()
+	header.Command = SMB2Command.SESSION_SETUP
+	header.Flags = SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR
+	header.Status = status
+	header.MessageId = message_id
+	header.CreditCharge = 1
+	header.CreditReq = 1
+	header.SessionId = 0x1234
+	command = SESSION_SETUP_REPLY()
+	command.SessionFlags = 0
+	command.Buffer = b'server token'
+	return SMB2Message.from_bytes(SMB2Message(header, command).to_bytes())
+
+class TestMultiChannel(unittest.TestCase):
+	def test_select_channel(self):
+		session = build_connection(10)
+		self.assertIs(session.select_channel(), session)
+
+		busy = build_connection(2)
+		idle = build_connection(50)
+		session.channels = [busy, idle]
+		self.assertIs(session.select_channel(), idle)
+		self.assertEqual(session.get_granted_credits(), 62)
+
+		#broken channels are skipped
+		idle.credits.close()
+		self.assertIs(session.select_channel(), session)
+		self.assertEqual(session.get_granted_credits(), 12)
+
+	def test_bind_preauth_hash(self):
+		async def run():
+			session_key = b'\x07' * 16
+			session = build_connection(10)
+			session.SessionId = 0x1234
+			session.signer = get_signer(SMB2SigningAlgorithm.HMAC_SHA256, session_key)
+
+			channel = SMBConnection(FakeGSSAPI(), SMBTarget(), shutdown_evt = asyncio.Event())
+			channel.status = SMBConnectionStatus.RUNNING
+			channel.selected_dialect = NegotiateDialects.SMB311
+			channel.SigningAlgorithmId = SMB2SigningAlgorithm.HMAC_SHA256
+			channel.PreauthIntegrityHashValue = hashlib.sha512(b'negotiate').digest()
+			channel.netbios_transport = FakeTransport()
+			replies = []
+			async def recvSMB(message_id, timeout = None):
+				status = NTStatus.MORE_PROCESSING_REQUIRED if message_id == 0 else NTStatus.SUCCESS
+				replies.append(build_reply(message_id, status))
+				channel.credits.grant(message_id, 1)
+				return replies[-1]
+			channel.recvSMB = recvSMB
+
+			await channel.session_setup(bind_to = session)
+			self.assertEqual(channel.status, SMBConnectionStatus.RUNNING)
+
+			#the hash covers the binding requests exactly as they went out, signature included
+			sent = channel.netbios_transport.sent
+			self.assertEqual(len(sent), 2)
+			expected = channel.PreauthIntegrityHashValue
+			for data in [sent[0], replies[0].raw, sent[1]]:
+				expected = hashlib.sha512(expected + data).digest()
+			self.assertEqual(channel.SessionPreauthIntegrityHashValue, expected)
+
+			for data in sent:
+				flags = int.from_bytes(data[16:20], byteorder = 'little', signed = False)
+				self.assertTrue(flags & SMB2HeaderFlag.SMB2_FLAGS_SIGNED)
+				unsigned = data[:48] + b'\x00' * 16 + data[64:]
+				self.assertEqual(data[48:64], hmac.new(session_key, unsigned, hashlib.sha256).digest()[:16])
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
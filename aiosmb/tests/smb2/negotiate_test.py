@@ -0,0 +1,48 @@
+import unittest
+
+from aiosmb.protocol.smb2.message import SMB2Message
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC
+from aiosmb.protocol.smb2.commands import *
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.dtyp.constrcuted_security.guid import GUID
+
+class TestNegotiate(unittest.TestCase):
+	def test_smb311_contexts(self):
+		preauth = SMB2PreauthIntegrityCapabilities()
+		preauth.HashAlgorithms = [SMB2HashAlgorithm.SHA_512]
+		preauth.Salt = b'\x11' * 32
+		encryption = SMB2EncryptionCapabilities()
+		encryption.Ciphers = [SMB2Cipher.AES_128_GCM, SMB2Cipher.AES_128_CCM]
+
+		command = NEGOTIATE_REQ()
+		command.SecurityMode = NegotiateSecurityMode.SMB2_NEGOTIATE_SIGNING_ENABLED
+		command.Capabilities = NegotiateCapabilities.LARGE_MTU | NegotiateCapabilities.ENCRYPTION
+		command.ClientGuid = GUID.random()
+		command.Dialects = [NegotiateDialects.SMB202, NegotiateDialects.SMB210, NegotiateDialects.SMB300, NegotiateDialects.SMB311]
+		command.NegotiateContextList = [
+			SMB2NegotiateContext(SMB2ContextType.SMB2_PREAUTH_INTEGRITY_CAPABILITIES, preauth),
+			SMB2NegotiateContext(SMB2ContextType.SMB2_ENCRYPTION_CAPABILITIES, encryption),
+		]
+
+		header = SMB2Header_SYNC()
+		header.Command = SMB2Command.NEGOTIATE
+		header.CreditCharge = 1
+		header.CreditReq = 1
+		header.MessageId = 1
+		data = SMB2Message(header, command).to_bytes()
+
+		self.assertEqual(command.NegotiateContextOffset % 8, 0)
+		msg = SMB2Message.from_bytes(data)
+		self.assertEqual(msg.command.Dialects, command.Dialects)
+		self.assertEqual(len(msg.command.NegotiateContextList), 2)
+		self.assertEqual(msg.command.NegotiateContextList[0].Data.Salt, preauth.Salt)
+		self.assertEqual(msg.command.NegotiateContextList[0].Data.HashAlgorithms, [SMB2HashAlgorithm.SHA_512])
+		self.assertEqual(msg.command.NegotiateContextList[1].Data.Ciphers, encryption.Ciphers)
+
+	def test_unknown_context(self):
+		ctx = SMB2NegotiateContext.from_bytes(b'\x99\x00\x02\x00\x00\x00\x00\x00\xAA\xBB')
+		self.assertEqual(ctx.ContextType, 0x99)
+		self.assertEqual(ctx.Data, b'\xAA\xBB')
+
+if __name__ == '__main__':
+	unittest.main()
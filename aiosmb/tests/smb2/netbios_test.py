@@ -0,0 +1,30 @@
+import unittest
+
+from aiosmb.network.netbios_transport import NetBIOSFrameDecoder
+
+def frame(payload):
+	return b'\x00' + len(payload).to_bytes(3, byteorder='big', signed = False) + payload
+
+class TestNetBIOSFrameDecoder(unittest.TestCase):
+	def test_multiple_frames_in_chunk(self):
+		decoder = NetBIOSFrameDecoder()
+		frames = decoder.feed(frame(b'\xFEaaa') + frame(b'\xFEbb') + frame(b'\xFEc'))
+		self.assertEqual([bytes(f) for f in frames], [b'\xFEaaa', b'\xFEbb', b'\xFEc'])
+
+	def test_split_frames(self):
+		payloads = [b'\xFE' + bytes([i])*(i*100) for i in range(1, 20)]
+		data = b''.join(frame(p) for p in payloads) + frame(b'')
+		for chunk_size in [1, 3, 4, 7, 4096]:
+			decoder = NetBIOSFrameDecoder()
+			frames = []
+			for i in range(0, len(data), chunk_size):
+				frames += decoder.feed(data[i:i+chunk_size])
+			self.assertEqual([bytes(f) for f in frames], payloads)
+
+	def test_many_small_frames(self):
+		decoder = NetBIOSFrameDecoder()
+		frames = decoder.feed(frame(b'\xFE')*5000)
+		self.assertEqual(len(frames), 5000)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+
+from aiosmb.network.network import TCPSocket
+from aiosmb.network.tcp_server import TCPServerSocket, TCPClient
+
+class FakeWriter:
+	def __init__(self, fail = False):
+		self.fail = fail
+		self.writes = []
+		self.drains = 0
+		self.closed = False
+
+	def writelines(self, buffers):
+		self.writes.append([bytes(buff) for buff in buffers])
+
+	async def drain(self):
+		self.drains += 1
+		await asyncio.sleep(0)
+		if self.fail is True:
+			raise ConnectionResetError('connection reset')
+
+	def close(self):
+		self.closed = True
+
+def queue_frames(queue):
+	queue.put_nowait((b'\x00\x00\x00\x02', b'AB'))
+	queue.put_nowait(b'\x00\x00\x00\x01C')
+	queue.put_nowait((b'\x00\x00\x00\x03', memoryview(b'DEF')))
+
+EXPECTED = [b'\x00\x00\x00\x02', b'AB', b'\x00\x00\x00\x01C', b'\x00\x00\x00\x03', b'DEF']
+
+class TestCoalescedWrites(unittest.TestCase):
+	def test_client(self):
+		async def run():
+			sock = TCPSocket(shutdown_evt = asyncio.Event())
+			sock.writer = FakeWriter()
+			queue_frames(sock.out_queue)
+			task = asyncio.ensure_future(sock.handle_outgoing())
+			await asyncio.sleep(0.01)
+			#everything queued went out in order with one writelines and one drain
+			self.assertEqual(sock.writer.writes, [EXPECTED])
+			self.assertEqual(sock.writer.drains, 1)
+
+			sock.out_queue.put_nowait(b'\x00\x00\x00\x01G')
+			await asyncio.sleep(0.01)
+			self.assertEqual(sock.writer.writes[1], [b'\x00\x00\x00\x01G'])
+			self.assertEqual(sock.writer.drains, 2)
+			task.cancel()
+			await asyncio.gather(task, return_exceptions = True)
+
+		asyncio.run(run())
+
+	def test_client_error(self):
+		async def run():
+			sock = TCPSocket(shutdown_evt = asyncio.Event())
+			writer = FakeWriter(fail = True)
+			sock.writer = writer
+			queue_frames(sock.out_queue)
+			await asyncio.wait_for(sock.handle_outgoing(), 1)
+			#the connection watching the socket fails its outstanding requests on this
+			self.assertTrue(sock.disconnected.is_set())
+			self.assertTrue(writer.closed)
+
+		asyncio.run(run())
+
+	def test_server(self):
+		async def run():
+			server = TCPServerSocket('127.0.0.1', None, shutdown_evt = asyncio.Event())
+			client = TCPClient('127.0.0.1', 50000, None, FakeWriter())
+			queue_frames(client.out_queue)
+			task = asyncio.ensure_future(server.handle_outgoing(client))
+			await asyncio.sleep(0.01)
+			self.assertEqual(client.writer.writes, [EXPECTED])
+			self.assertEqual(client.writer.drains, 1)
+			task.cancel()
+			await asyncio.gather(task, return_exceptions = True)
+
+			client = TCPClient('127.0.0.1', 50000, None, FakeWriter(fail = True))
+			queue_frames(client.out_queue)
+			#the writer loop stops on the first failed write
+			await asyncio.wait_for(server.handle_outgoing(client), 1)
+			self.assertEqual(client.writer.writes, [EXPECTED])
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
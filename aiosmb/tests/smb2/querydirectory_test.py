@@ -0,0 +1,73 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus, FileHandle
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.fscc.structures.fileinfoclass import FileInfoClass
+
+def build_connection():
+	connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+	connection.status = SMBConnectionStatus.RUNNING
+	connection.TreeConnectTable_id[1] = SimpleNamespace(tree_id = 1)
+	connection.FileHandleTable[5] = FileHandle()
+	connection.MaxTransactSize = 65536
+	return connection
+
+class TestQueryDirectory(unittest.TestCase):
+	def test_page_size(self):
+		async def run():
+			connection = build_connection()
+			connection.MaxTransactSize = 8*1024*1024
+			connection.SupportsMultiCredit = True
+			connection.credits.available = 64
+			sent = []
+			async def sendSMB(msg):
+				sent.append(msg)
+				return 1
+			async def recvSMB(message_id, timeout = None):
+				return SimpleNamespace(header = SimpleNamespace(Status = NTStatus.NO_MORE_FILES))
+			connection.sendSMB = sendSMB
+			connection.recvSMB = recvSMB
+
+			self.assertIsNone(await connection.query_directory(1, 5))
+			#capped by the credits we own
+			self.assertEqual(sent[0].command.OutputBufferLength, 64*65536)
+			self.assertEqual(sent[0].header.CreditCharge, 64)
+			await connection.query_directory(1, 5, maxBufferSize = 100000)
+			self.assertEqual(sent[1].command.OutputBufferLength, 100000)
+			self.assertEqual(sent[1].header.CreditCharge, 2)
+
+		asyncio.run(run())
+
+	def test_iter(self):
+		async def run():
+			connection = build_connection()
+			pages = [b'page1', b'page2']
+			sent = []
+			async def sendSMB(msg):
+				sent.append(msg)
+				return len(sent)
+			async def recvSMB(message_id, timeout = None):
+				await asyncio.sleep(0)
+				if message_id > len(pages):
+					return SimpleNamespace(header = SimpleNamespace(Status = NTStatus.NO_MORE_FILES))
+				return SimpleNamespace(header = SimpleNamespace(Status = NTStatus.SUCCESS), command = SimpleNamespace(Data = pages[message_id-1]))
+			connection.sendSMB = sendSMB
+			connection.recvSMB = recvSMB
+
+			#classes without a parser give the raw pages
+			received = []
+			async for page in connection.query_directory_iter(1, 5, information_class = FileInfoClass.FileDirectoryInformation, maxBufferSize = 4096):
+				#the next page is already requested while the current one is consumed
+				self.assertEqual(len(sent), len(received) + 2)
+				received.append(page)
+			self.assertEqual(received, pages)
+			self.assertEqual(len(sent), 3)
+			self.assertEqual(sent[0].command.OutputBufferLength, 4096)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
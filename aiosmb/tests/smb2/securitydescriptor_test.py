@@ -0,0 +1,134 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+from aiosmb.smbfilesystem import SMBFileSystem
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.smbcontainer import SMBShare
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.commons.smbsdcache import SMBSecurityDescriptorCache
+from aiosmb.commons.access_mask import FileAccessMask
+from aiosmb.protocol.smb2.message import SMB2_RELATED_FILE_ID
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.protocol.smb2.commands import SecurityInfo
+from aiosmb.exceptions import SMBException, SMBCreateAccessDenied, SMBConnectionTerminated
+
+def build_sd(subauthority):
+	#self relative descriptor with an owner only: S-1-5-<subauthority>
+	sid = b'\x01\x01\x00\x00\x00\x00\x00\x05' + subauthority.to_bytes(4, 'little')
+	return b'\x01\x00\x00\x80' + (20).to_bytes(4, 'little') + b'\x00' * 12 + sid
+
+def reply(status, **kwargs):
+	return SimpleNamespace(header = SimpleNamespace(Status = status), command = SimpleNamespace(**kwargs))
+
+class TestSecurityDescriptorCache(unittest.TestCase):
+	def test_dedup(self):
+		cache = SMBSecurityDescriptorCache(max_entries = 2)
+		first = cache.from_bytes(build_sd(18))
+		self.assertIs(cache.from_bytes(bytearray(build_sd(18))), first)
+		self.assertEqual(str(first.Owner), 'S-1-5-18')
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+		cache.from_bytes(build_sd(19))
+		cache.from_bytes(build_sd(18))
+		cache.from_bytes(build_sd(20))
+		#S-1-5-19 was the least recently used one
+		self.assertEqual(len(cache.entries), 2)
+		self.assertIs(cache.from_bytes(build_sd(18)), first)
+		self.assertNotIn(SMBSecurityDescriptorCache.get_key(build_sd(19)), cache.entries)
+
+class TestQuerySecurityInfo(unittest.TestCase):
+	def build_connection(self, replies):
+		connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+		connection.status = SMBConnectionStatus.RUNNING
+		connection.TreeConnectTable_id[1] = SimpleNamespace(tree_id = 1)
+		self.sent = []
+		self.closed = []
+		async def compound(msgs, related = True, timeout = None):
+			self.sent.append((msgs, related))
+			return replies
+		async def close(tree_id, file_id, flags = 0, timeout = None):
+			self.closed.append(file_id)
+		connection.compound = compound
+		connection.close = close
+		return connection
+
+	def test_compound(self):
+		async def run():
+			data = build_sd(18)
+			connection = self.build_connection([reply(NTStatus.SUCCESS, FileId = 7), reply(NTStatus.SUCCESS, Data = data), reply(NTStatus.SUCCESS)])
+			self.assertEqual(await connection.query_security_info(1, 'dir\\file.txt'), data)
+			msgs, related = self.sent[0]
+			self.assertTrue(related)
+			self.assertEqual([msg.header.Command for msg in msgs], [SMB2Command.CREATE, SMB2Command.QUERY_INFO, SMB2Command.CLOSE])
+			self.assertEqual([msg.header.TreeId for msg in msgs], [1, 1, 1])
+			self.assertEqual(msgs[0].command.DesiredAccess, FileAccessMask.READ_CONTROL)
+			self.assertEqual(msgs[1].command.FileId, SMB2_RELATED_FILE_ID)
+			self.assertEqual(msgs[2].command.FileId, SMB2_RELATED_FILE_ID)
+			self.assertEqual(self.closed, [])
+
+			await connection.query_security_info(1, 'file.txt', additional_information = SecurityInfo.SACL_SECURITY_INFORMATION)
+			self.assertTrue(self.sent[1][0][0].command.DesiredAccess & FileAccessMask.ACCESS_SYSTEM_SECURITY)
+
+		asyncio.run(run())
+
+	def test_errors(self):
+		async def run():
+			connection = self.build_connection([reply(NTStatus.ACCESS_DENIED), reply(NTStatus.ACCESS_DENIED), reply(NTStatus.ACCESS_DENIED)])
+			with self.assertRaises(SMBCreateAccessDenied):
+				await connection.query_security_info(1, 'secret.txt')
+			self.assertEqual(self.closed, [])
+
+			#the query failed and the server skipped the close of the chain
+			connection = self.build_connection([reply(NTStatus.SUCCESS, FileId = 7), reply(NTStatus.ACCESS_DENIED), reply(NTStatus.ACCESS_DENIED)])
+			with self.assertRaises(SMBException) as ctx:
+				await connection.query_security_info(1, 'file.txt')
+			self.assertEqual(ctx.exception.ntstatus, NTStatus.ACCESS_DENIED)
+			self.assertEqual(self.closed, [7])
+
+			#nothing is sent on a closed session
+			connection = self.build_connection([])
+			connection.session_closed = True
+			with self.assertRaises(SMBConnectionTerminated):
+				await connection.query_security_info(1, 'file.txt')
+			self.assertEqual(self.sent, [])
+
+		asyncio.run(run())
+
+class FakeConnection:
+	def __init__(self):
+		self.in_flight = 0
+		self.max_in_flight = 0
+
+	async def query_security_info(self, tree_id, path, additional_information = 0, timeout = None):
+		self.in_flight += 1
+		self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		await asyncio.sleep(0)
+		self.in_flight -= 1
+		if path == 'missing':
+			raise SMBCreateAccessDenied()
+		return build_sd(18 if path.startswith('a') else 19)
+
+class TestBulkSecurityDescriptors(unittest.TestCase):
+	def test_bulk(self):
+		async def run():
+			connection = FakeConnection()
+			fs = SMBFileSystem(connection)
+			share = SMBShare()
+			share.tree_id = 1
+			paths = ['a%d' % i for i in range(20)] + ['b1', 'missing']
+			results = {}
+			async for path, sd in fs.get_security_descriptors(share, iter(paths), concurrency = 4):
+				results[path] = sd
+			self.assertEqual(set(results), set(paths))
+			self.assertLessEqual(connection.max_in_flight, 4)
+			self.assertIsInstance(results['missing'], SMBCreateAccessDenied)
+			self.assertIs(results['a0'], results['a19'])
+			self.assertIsNot(results['a0'], results['b1'])
+			self.assertEqual(fs.sd_cache.misses, 2)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+import asyncio
+import hmac
+import hashlib
+
+from aiosmb.crypto.signing import get_signer, SIGNING_AES_AVAILABLE
+from aiosmb.protocol.smb2.commands import SMB2SigningAlgorithm, READ_REQ, ECHO_REQ, TREE_CONNECT_REQ, NegotiateDialects, SessionFlags
+from aiosmb.protocol.smb2.message import SMB2Message, SMB2_RELATED_FILE_ID
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC, SMB2HeaderFlag
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.smbconnection import SMBConnection, SMBConnectionStatus
+from aiosmb.commons.smbtarget import SMBTarget
+
+class TestSigning(unittest.TestCase):
+	def test_hmac_sha256(self):
+		key = b'\x01' * 16
+		signer = get_signer(SMB2SigningAlgorithm.HMAC_SHA256, key)
+		for data in [b'first message', b'second message']:
+			self.assertEqual(signer.sign(data), hmac.new(key, data, hashlib.sha256).digest()[:16])
+
+	@unittest.skipUnless(SIGNING_AES_AVAILABLE, 'cryptography package is not installed')
+	def test_aes_cmac(self):
+		#RFC 4493 test vectors
+		signer = get_signer(SMB2SigningAlgorithm.AES_CMAC, bytes.fromhex('2b7e151628aed2a6abf7158809cf4f3c'))
+		self.assertEqual(signer.sign(b''), bytes.fromhex('bb1d6929e95937287fa37d129b756746'))
+		self.assertEqual(signer.sign(bytes.fromhex('6bc1bee22e409f96e93d7e117393172a')), bytes.fromhex('070a16b46b4d4144f79bdd9dd04a287c'))
+
+@unittest.skipUnless(SIGNING_AES_AVAILABLE, 'cryptography package is not installed')
+class TestAESGMAC(unittest.TestCase):
+	key = bytes.fromhex('000102030405060708090a0b0c0d0e0f')
+
+	def build_message(self, message_id, command, flags):
+		header = SMB2Header_SYNC()
+		header.Command = command
+		header.CreditCharge = 1
+		header.CreditReq = 1
+		header.MessageId = message_id
+		header.Flags = flags
+		header.SessionId = 0x1122334455667788
+		return SMB2Message(header, ECHO_REQ()).to_bytes()
+
+	def reference(self, data, nonce):
+		#GMAC is GCM with the whole message as AAD and no plaintext
+		from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+		return AESGCM(self.key).encrypt(nonce, b'', bytes(data))
+
+	def test_nonce(self):
+		signer = get_signer(SMB2SigningAlgorithm.AES_GMAC, self.key)
+		message_id = 0x0102030405060708
+		cases = [
+			(SMB2Command.ECHO, 0, b'\x00\x00\x00\x00'),
+			(SMB2Command.ECHO, SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR, b'\x01\x00\x00\x00'),
+			(SMB2Command.CANCEL, 0, b'\x02\x00\x00\x00'),
+		]
+		tags = set()
+		for command, flags, info in cases:
+			data = self.build_message(message_id, command, flags)
+			#MessageId, then the role and cancel bits
+			nonce = bytes.fromhex('0807060504030201') + info
+			tag = signer.sign(data)
+			self.assertEqual(tag, self.reference(data, nonce))
+			tags.add(tag)
+		self.assertEqual(len(tags), 3)
+
+	def test_sign_verify(self):
+		connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+		connection.SessionKey = self.key
+		connection.signer = get_signer(SMB2SigningAlgorithm.AES_GMAC, self.key)
+		data = self.build_message(5, SMB2Command.ECHO, 0)
+		connection.sign_message(data)
+		#the receiver recomputes the signature over the message with a zeroed signature field
+		unsigned = bytearray(data)
+		unsigned[48:64] = b'\x00' * 16
+		nonce = (5).to_bytes(8, 'little') + b'\x00' * 4
+		self.assertEqual(bytes(data[48:64]), self.reference(unsigned, nonce))
+		data[65] ^= 1
+		unsigned[65] ^= 1
+		self.assertNotEqual(bytes(data[48:64]), self.reference(unsigned, nonce))
+
+class FakeTransport:
+	def __init__(self):
+		self.sent = []
+
+	async def send(self, data):
+		self.sent.append(bytes(data))
+
+def build_msg(command):
+	header = SMB2Header_SYNC()
+	header.Command = command
+	if command == SMB2Command.READ:
+		cmd = READ_REQ()
+		cmd.Length = 10
+		cmd.Offset = 0
+		cmd.FileId = SMB2_RELATED_FILE_ID
+		cmd.MinimumCount = 0
+		cmd.RemainingBytes = 0
+	elif command == SMB2Command.TREE_CONNECT:
+		cmd = TREE_CONNECT_REQ()
+		cmd.Path = '\\\\srv\\share'
+		cmd.Flags = 0
+	else:
+		cmd = ECHO_REQ()
+	return SMB2Message(header, cmd)
+
+class TestSignInPlace(unittest.TestCase):
+	key = b'\x02' * 16
+
+	def build_connection(self):
+		connection = SMBConnection(None, SMBTarget(), shutdown_evt = asyncio.Event())
+		connection.status = SMBConnectionStatus.RUNNING
+		connection.netbios_transport = FakeTransport()
+		connection.credits.available = 10
+		connection.SessionKey = self.key
+		connection.signer = get_signer(SMB2SigningAlgorithm.HMAC_SHA256, self.key)
+		connection.signing_required = True
+		return connection
+
+	def verify(self, data):
+		self.assertTrue(int.from_bytes(data[16:20], 'little') & SMB2HeaderFlag.SMB2_FLAGS_SIGNED)
+		unsigned = bytearray(data)
+		unsigned[48:64] = b'\x00' * 16
+		self.assertEqual(bytes(data[48:64]), hmac.new(self.key, unsigned, hashlib.sha256).digest()[:16])
+
+	def test_compound(self):
+		async def run():
+			connection = self.build_connection()
+			await connection.sendSMBCompound([build_msg(SMB2Command.READ), build_msg(SMB2Command.ECHO), build_msg(SMB2Command.ECHO)])
+			data = connection.netbios_transport.sent[0]
+			offset = 0
+			count = 0
+			while True:
+				next_command = int.from_bytes(data[offset+20:offset+24], 'little')
+				end = offset + next_command if next_command != 0 else len(data)
+				#every signature covers the message with its padding
+				self.verify(data[offset:end])
+				count += 1
+				if next_command == 0:
+					break
+				self.assertEqual(next_command % 8, 0)
+				offset = end
+			self.assertEqual(count, 3)
+
+		asyncio.run(run())
+
+	def test_single(self):
+		async def run():
+			connection = self.build_connection()
+			await connection.sendSMB(build_msg(SMB2Command.ECHO))
+			self.verify(connection.netbios_transport.sent[0])
+
+		asyncio.run(run())
+
+	def test_tree_connect_smb311(self):
+		async def run():
+			#signing is enabled but not required by the server
+			connection = self.build_connection()
+			connection.signing_required = False
+			connection.selected_dialect = NegotiateDialects.SMB311
+			await connection.sendSMB(build_msg(SMB2Command.TREE_CONNECT))
+			self.verify(connection.netbios_transport.sent[0])
+			#nothing else is signed
+			await connection.sendSMB(build_msg(SMB2Command.ECHO))
+			self.assertEqual(connection.netbios_transport.sent[1][48:64], b'\x00' * 16)
+
+			for flags in [SessionFlags.SMB2_SESSION_FLAG_IS_GUEST, SessionFlags.SMB2_SESSION_FLAG_IS_NULL]:
+				connection.SessionFlags = flags
+				await connection.sendSMB(build_msg(SMB2Command.TREE_CONNECT))
+				self.assertEqual(connection.netbios_transport.sent[-1][48:64], b'\x00' * 16)
+
+			connection.SessionFlags = 0
+			connection.selected_dialect = NegotiateDialects.SMB302
+			await connection.sendSMB(build_msg(SMB2Command.TREE_CONNECT))
+			self.assertEqual(connection.netbios_transport.sent[-1][48:64], b'\x00' * 16)
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import asyncio
+from types import SimpleNamespace
+
+from aiosmb.smbconnection import SMBConnection
+from aiosmb.smbfilesystem import SMBFileSystem
+from aiosmb.commons.smbcontainer import SMBShare
+from aiosmb.commons.smbtarget import SMBTarget
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+from aiosmb.protocol.smb2.commands import TreeCapabilities, ShareFlags
+
+class FakeServerConnection(SMBConnection):
+	"""
+	Answers TREE_CONNECT and TREE_DISCONNECT without a network connection
+	"""
+	def __init__(self):
+		SMBConnection.__init__(self, None, SMBTarget(), shutdown_evt = asyncio.Event())
+		self.sent = []
+		self.next_tree_id = 1
+
+	async def sendSMB(self, msg):
+		self.sent.append(msg.header.Command)
+		return len(self.sent)
+
+	async def recvSMB(self, message_id, timeout = None):
+		await asyncio.sleep(0)
+		command = self.sent[message_id - 1]
+		header = SimpleNamespace(Status = NTStatus.SUCCESS, TreeId = 0, SessionId = 0)
+		body = None
+		if command == SMB2Command.TREE_CONNECT:
+			header.TreeId = self.next_tree_id
+			self.next_tree_id += 1
+			body = SimpleNamespace(Capabilities = TreeCapabilities(0), ShareFlags = ShareFlags(0), MaximalAccess = 0)
+		return SimpleNamespace(header = header, command = body)
+
+class TestTreeCache(unittest.TestCase):
+	def test_shared_tree(self):
+		async def run():
+			connection = FakeServerConnection()
+			first, second = await asyncio.gather(connection.tree_connect('\\\\srv\\IPC$'), connection.tree_connect('\\\\srv\\IPC$'))
+			self.assertIs(first, second)
+			self.assertEqual(first.number_of_users, 2)
+			self.assertEqual(connection.sent, [SMB2Command.TREE_CONNECT])
+
+			await connection.tree_disconnect(first.tree_id)
+			self.assertEqual(connection.sent, [SMB2Command.TREE_CONNECT])
+			await connection.tree_disconnect(first.tree_id)
+			self.assertEqual(connection.sent, [SMB2Command.TREE_CONNECT, SMB2Command.TREE_DISCONNECT])
+			self.assertEqual(connection.TreeConnectTable_id, {})
+			self.assertEqual(connection.TreeConnectTable_share, {})
+
+			third = await connection.tree_connect('\\\\srv\\IPC$')
+			self.assertNotEqual(third.tree_id, first.tree_id)
+
+		asyncio.run(run())
+
+	def test_filesystem_release(self):
+		async def run():
+			connection = FakeServerConnection()
+			filesystems = [SMBFileSystem(connection), SMBFileSystem(connection)]
+			for fs in filesystems:
+				share = SMBShare(fullpath = '\\\\srv\\share')
+				await fs.connect_share(share)
+			tree_entry = connection.TreeConnectTable_id[share.tree_id]
+			self.assertEqual(tree_entry.number_of_users, 2)
+
+			await filesystems[0].close()
+			self.assertEqual(tree_entry.number_of_users, 1)
+			#releasing twice doesn't take the reference of the other user
+			await filesystems[0].close()
+			self.assertEqual(tree_entry.number_of_users, 1)
+			await filesystems[1].close()
+			self.assertEqual(connection.sent, [SMB2Command.TREE_CONNECT, SMB2Command.TREE_DISCONNECT])
+			self.assertEqual(connection.TreeConnectTable_id, {})
+
+		asyncio.run(run())
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark for the SMB2 header/command codecs.
+Compares the precompiled struct based decoding with the previous field-by-field io.BytesIO decoding.
+Run from the repository root (devel is not part of the package, aiosmb must be importable):
+	PYTHONPATH=. python devel/bench_codecs.py
+"""
+import io
+import timeit
+
+from aiosmb.commons.ntstatus import NTStatus
+from aiosmb.protocol.smb2.message import SMB2Message
+from aiosmb.protocol.smb2.headers import SMB2Header_SYNC, SMB2HeaderFlag
+from aiosmb.protocol.smb2.commands import CLOSE_REPLY, CloseFlag
+from aiosmb.fscc.FileAttributes import FileAttributes
+from aiosmb.protocol.smb2.command_codes import SMB2Command
+
+def legacy_header_from_buffer(buff):
+	hdr = SMB2Header_SYNC()
+	hdr.ProtocolId = buff.read(4)
+	hdr.StructureSize = int.from_bytes(buff.read(2), byteorder='little', signed = False)
+	hdr.CreditCharge = int.from_bytes(buff.read(2), byteorder='little', signed = False)
+	hdr.Status      = NTStatus(int.from_bytes(buff.read(4), byteorder='little', signed = False))
+	hdr.Command     = SMB2Command(int.from_bytes(buff.read(2), byteorder='little', signed = False))
+	hdr.CreditReq      = int.from_bytes(buff.read(2), byteorder='little', signed = False)
+	hdr.Flags       = SMB2HeaderFlag(int.from_bytes(buff.read(4), byteorder='little', signed = False))
+	hdr.NextCommand = int.from_bytes(buff.read(4), byteorder='little', signed = False)
+	hdr.MessageId   = int.from_bytes(buff.read(8), byteorder='little', signed = False)
+	hdr.Reserved    = int.from_bytes(buff.read(4), byteorder='little', signed = False)
+	hdr.TreeId      = int.from_bytes(buff.read(4), byteorder='little', signed = False)
+	hdr.SessionId   = int.from_bytes(buff.read(8), byteorder='little', signed = False)
+	hdr.Signature   = buff.read(16)
+	return hdr
+
+def legacy_close_reply_from_buffer(buff):
+	msg = CLOSE_REPLY()
+	msg.StructureSize   = int.from_bytes(buff.read(2), byteorder='little')
+	msg.Flags  = CloseFlag(int.from_bytes(buff.read(2), byteorder='little'))
+	msg.Reserved  = int.from_bytes(buff.read(4), byteorder='little')
+	msg.CreationTime  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.LastAccessTime  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.LastWriteTime  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.ChangeTime  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.AllocationSize  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.EndofFile  = int.from_bytes(buff.read(8), byteorder='little')
+	msg.FileAttributes  = FileAttributes(int.from_bytes(buff.read(4), byteorder='little'))
+	return msg
+
+def legacy_message(data):
+	buff = io.BytesIO(data)
+	legacy_header_from_buffer(buff)
+	legacy_close_reply_from_buffer(buff)
+
+def build_close_reply():
+	header = SMB2Header_SYNC()
+	header.Command = SMB2Command.CLOSE
+	header.CreditCharge = 1
+	header.CreditReq = 1
+	header.Flags = SMB2HeaderFlag.SMB2_FLAGS_SERVER_TO_REDIR
+	header.MessageId = 1234
+	header.TreeId = 1
+	header.SessionId = 0x1122334455667788
+	body = (60).to_bytes(2, byteorder='little') + b'\x00' * 58
+	return header.to_bytes() + body
+
+def bench(name, func, number = 100000):
+	t = timeit.timeit(func, number = number)
+	print('%-32s %8.2f us/op' % (name, t / number * 1000000))
+	return t
+
+def main():
+	data = build_close_reply()
+	old = bench('header (BytesIO)', lambda: legacy_header_from_buffer(io.BytesIO(data)))
+	new = bench('header (struct)', lambda: SMB2Header_SYNC.from_bytes(data))
+	print('speedup: %.2fx' % (old / new))
+	old = bench('CLOSE reply message (BytesIO)', lambda: legacy_message(data))
+	new = bench('CLOSE reply message (struct)', lambda: SMB2Message.from_bytes(data).command)
+	print('speedup: %.2fx' % (old / new))
+	bench('CLOSE reply header only (lazy)', lambda: SMB2Message.from_bytes(data))
+
+if __name__ == '__main__':
+	main()
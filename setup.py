@@ -33,6 +33,10 @@ setup(
 		'winsspi>=0.0.2',
 		'six',
 	],
+	extras_require={
+		#AES signing and encryption, needed for the SMB 3.x dialects
+		'crypto': ['cryptography'],
+	},
 	
 	classifiers=(
 		"Programming Language :: Python :: 3.7",